@@ -0,0 +1,483 @@
+"""Registry of the scheduler runs of the API.
+
+Every submitted payload becomes a `Job`, keyed by its `run_id`. Jobs are queued and
+admitted in order while less than `MAX_RUNNING_JOBS` are running. The `CPU_BUDGET` is
+split evenly between the running slots, so the `num_workers` of a run is capped to its
+share.
+
+Runs are executed by long lived `SchedulerWorker` processes, which have already
+imported the scheduler engines, one run at a time. Cancelling a running job stops its
+search through `scheduler.solver.cancel_event`, so the best solution, bound and solver
+stats are published. Its worker is killed if the run has not finished after
+`CANCEL_TIMEOUT` seconds, the latest solution of the shared memory buffer is kept."""
+import asyncio
+import itertools
+import json
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict, deque
+
+import pandas as pd
+from pydantic.json import pydantic_encoder
+
+from .objects import OptimizerInput, HeartbeatStatus
+from .messages import HeartbeatDeltaPipe, apply_heartbeat_deltas
+from .solution_buffer import SolutionBuffer
+from scheduler.optimizer_v1_8 import compute_schedule
+from scheduler.optimizer_patterns import compute_schedule as compute_pattern_schedule
+from scheduler.optimizer_column_generation import (
+    compute_schedule as compute_column_generation_schedule,
+)
+from scheduler.optimizer_rolling_horizon import (
+    compute_schedule as compute_rolling_horizon_schedule,
+)
+from scheduler.optimizer_lns import compute_schedule as compute_lns_schedule
+from scheduler.optimizer_multi_resolution import (
+    compute_schedule as compute_multi_resolution_schedule,
+)
+from scheduler.solver import (
+    cancel_event,
+    get_schedule_from_states_df,
+    get_solution_from_states_df,
+)
+
+# Number of CPUs shared by all the running jobs
+CPU_BUDGET = int(os.environ.get("SCHEDULER_CPU_BUDGET", os.cpu_count() or 1))
+# Number of jobs running at the same time, the rest wait in the queue
+MAX_RUNNING_JOBS = int(
+    os.environ.get("SCHEDULER_MAX_RUNNING_JOBS", max(1, CPU_BUDGET // 4))
+)
+# Seconds a cancelled run has to finish before its worker process is killed
+CANCEL_TIMEOUT = float(os.environ.get("SCHEDULER_CANCEL_TIMEOUT", 30))
+# Number of finished jobs kept in the registry
+MAX_FINISHED_JOBS = 50
+
+# Unique id of every job, as `run_id`s can be reused once a run is finished
+_job_ids = itertools.count()
+
+# Scheduler engines that can be selected with the payload `engine` field
+SCHEDULER_ENGINES = {
+    "v1.8": compute_schedule,
+    "patterns": compute_pattern_schedule,
+    "column_generation": compute_column_generation_schedule,
+    "rolling_horizon": compute_rolling_horizon_schedule,
+    "lns": compute_lns_schedule,
+    "multi_resolution": compute_multi_resolution_schedule,
+}
+
+
+def _scheduler_wrapper(heartbeat, multiprocess_pipe, solution_buffer_name):
+    """Executes the scheduler run of a worker process and watches for errors"""
+    # Only the heartbeat changes are sent back to the API process, the solutions are
+    # written to the shared memory buffer
+    multiprocess_pipe = HeartbeatDeltaPipe(
+        multiprocess_pipe, SolutionBuffer.attach(solution_buffer_name), keep_open=True
+    )
+    try:
+        SCHEDULER_ENGINES[heartbeat.payload.engine](heartbeat, multiprocess_pipe)
+    except Exception as e:
+        print(e, flush=True)
+        heartbeat.set_error(str(e))
+        multiprocess_pipe.send(heartbeat)
+    finally:
+        multiprocess_pipe.close()
+
+
+def _scheduler_worker(connection, cancel_connection):
+    """Main function of the worker processes. It runs the `(job_id, heartbeat,
+    solution_buffer_name)` tasks received through `connection` one after the other,
+    sending their heartbeat deltas and a final `None` back through it, until the
+    connection is closed. The `job_id`s received through `cancel_connection` cancel
+    the matching run, even if they arrive before it starts."""
+    lock = threading.Lock()
+    cancelled_job_ids = set()
+    current_job_id = None
+
+    def _listen_cancels():
+        while True:
+            try:
+                job_id = cancel_connection.recv()
+            except EOFError:
+                return
+            with lock:
+                cancelled_job_ids.add(job_id)
+                if job_id == current_job_id:
+                    cancel_event.set()
+
+    threading.Thread(target=_listen_cancels, daemon=True).start()
+    while True:
+        try:
+            task = connection.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        job_id, heartbeat, solution_buffer_name = task
+        with lock:
+            current_job_id = job_id
+            if job_id in cancelled_job_ids:
+                cancel_event.set()
+            else:
+                cancel_event.clear()
+        _scheduler_wrapper(heartbeat, connection, solution_buffer_name)
+        with lock:
+            current_job_id = None
+            cancelled_job_ids.discard(job_id)
+        connection.send(None)
+
+
+class SchedulerWorker:
+    """Long lived scheduler process, running the jobs it is given one at a time"""
+
+    def __init__(self):
+        self.connection, worker_connection = multiprocessing.Pipe()
+        cancel_connection, self.__cancel_connection = multiprocessing.Pipe(duplex=False)
+        # Not a daemon, as the rolling horizon engine starts its own processes
+        self.process = multiprocessing.Process(
+            target=_scheduler_worker, args=(worker_connection, cancel_connection)
+        )
+        self.process.start()
+        # Only the worker keeps its ends open, so the reads fail if it dies
+        worker_connection.close()
+        cancel_connection.close()
+
+    @property
+    def pid(self):
+        return self.process.pid
+
+    def run(self, job_id: int, heartbeat: HeartbeatStatus, solution_buffer_name: str):
+        """Sends a run to the worker. Its deltas are read from `connection`"""
+        self.connection.send((job_id, heartbeat, solution_buffer_name))
+
+    def cancel(self, job_id: int):
+        """Stops the search of the given run"""
+        try:
+            self.__cancel_connection.send(job_id)
+        except OSError:
+            # The worker already died
+            pass
+
+    def stop(self):
+        """Lets the worker exit once its current run, if any, is finished"""
+        self.connection.close()
+        self.__cancel_connection.close()
+
+    def is_alive(self) -> bool:
+        return self.process.is_alive()
+
+    def kill(self):
+        # Inside a while loop to flag it multiple times and prevent "confirmation" request
+        while self.process.is_alive():
+            self.process.kill()
+
+
+class Job:
+    """A scheduler run, with its heartbeat and, once admitted, its worker"""
+
+    def __init__(self, payload: OptimizerInput, on_update=None):
+        self.heartbeat = HeartbeatStatus(payload=payload)
+        self.heartbeat.version = 1.8
+        self.heartbeat.reset()
+        self.id = next(_job_ids)
+        self.worker = None
+        self.finished = False
+        self.killed = False
+        self.revision = 0  # Incremented on every heartbeat change
+        self.__output_cache = (None, None)  # (etag, JSON bytes) of the last output
+        self.__solution_buffer = None
+        self.__solution_buffer_sequence = 0
+        self.__solution_buffer_lock = threading.Lock()
+        self.__on_update = on_update or (lambda: None)
+
+    @property
+    def run_id(self) -> str:
+        return self.heartbeat.payload.run_id
+
+    @property
+    def is_queued(self) -> bool:
+        return self.worker is None and not self.finished
+
+    def start(self, num_workers: int):
+        """Sends the run to its worker with, at most, `num_workers` solver workers"""
+        payload = self.heartbeat.payload
+        static_variables = payload.static_variables
+        self.__solution_buffer = SolutionBuffer.create(
+            static_variables.num_vehicles,
+            static_variables.num_hours * 60 // static_variables.duration_step,
+            static_variables.duration_step,
+        )
+
+        # The scheduler gets its own heartbeat, with the workers of its CPU share
+        self.heartbeat.reset()
+        scheduler_heartbeat = self.heartbeat.copy(
+            update={
+                "payload": payload.copy(
+                    update={"num_workers": min(payload.num_workers, num_workers)}
+                )
+            }
+        )
+        self.worker.run(self.id, scheduler_heartbeat, self.__solution_buffer.name)
+
+    def watch(self):
+        """Updates the heartbeat in place with the deltas comming from the worker
+        until the run finishes, then frees the run resources"""
+        try:
+            while True:
+                # Read from the worker until the run finishes or the worker dies
+                data = self.worker.connection.recv()
+                if data and isinstance(data, list):
+                    apply_heartbeat_deltas(self.heartbeat, data)
+                    self.mark_updated()
+                else:
+                    break
+        except Exception as e:
+            if self.killed:
+                self.heartbeat.set_stage(
+                    5,
+                    f"Scheduler finished - Latest solution kept (cancelled, process killed after {CANCEL_TIMEOUT} seconds).",
+                )
+            elif self.heartbeat.stage_id != -1:
+                self.heartbeat.set_error("The scheduler process was terminated.")
+            self.heartbeat.set_end_time()
+        finally:
+            self.load_solution()
+            with self.__solution_buffer_lock:
+                self.__solution_buffer.close()
+                self.__solution_buffer.unlink()
+                self.__solution_buffer = None
+
+    def mark_updated(self):
+        """Records a change of the heartbeat, other than a new solution in the
+        shared memory buffer"""
+        self.revision += 1
+        self.__on_update()
+
+    @property
+    def heartbeat_etag(self) -> str:
+        """ETag of the heartbeat without its solution"""
+        return f'"{self.id}-{self.revision}"'
+
+    def get_output_etag(self) -> str:
+        """Loads the latest solution and returns the ETag of the whole heartbeat"""
+        self.load_solution()
+        return f'"{self.id}-{self.revision}-{self.__solution_buffer_sequence}"'
+
+    def get_output_json(self):
+        """Loads the latest solution and returns the `(etag, JSON bytes)` of the
+        `run_id` and the whole heartbeat but its payload. The bytes are only
+        serialised once per version"""
+        etag = self.get_output_etag()
+        cached_etag, output = self.__output_cache
+        if cached_etag != etag:
+            output = json.dumps(
+                dict(run_id=self.run_id, **self.heartbeat.dict(exclude={"payload"})),
+                default=pydantic_encoder,
+            ).encode()
+            self.__output_cache = (etag, output)
+        return etag, output
+
+    def load_solution(self):
+        """Updates the heartbeat `solution` and `schedule` with the latest solution of
+        the shared memory buffer, if there is a newer one"""
+        with self.__solution_buffer_lock:
+            if self.__solution_buffer is None:
+                return
+            sequence, shifts_state_values = self.__solution_buffer.read()
+            if sequence == self.__solution_buffer_sequence:
+                return
+            self.__solution_buffer_sequence = sequence
+
+        df = pd.DataFrame(
+            shifts_state_values,
+            columns=["day", "hour", "minute", "vehicle", "start", "end"],
+        )
+        self.heartbeat.solution = get_solution_from_states_df(
+            df, self.heartbeat
+        ).to_dict(orient="split")
+        self.heartbeat.schedule = get_schedule_from_states_df(df)
+
+    def cancel(self):
+        """Stops the search of the run, which finishes with its best solution"""
+        self.worker.cancel(self.id)
+
+    def kill(self):
+        """Kills the worker of a run that did not finish after being cancelled"""
+        self.killed = True
+        self.worker.kill()
+
+
+class JobManager:
+    """Queues, admits and keeps track of the jobs, and owns the worker processes.
+
+    Every change of a job heartbeat increments `version`, so streams can wait for
+    changes with `wait_for_update` or `wait_for_update_async` instead of polling.
+    Every job is followed by its own `watch` thread, started by `submit`, so runs
+    never hold a thread of the request handlers pool."""
+
+    def __init__(self, max_running_jobs=MAX_RUNNING_JOBS, cpu_budget=CPU_BUDGET):
+        self.max_running_jobs = max_running_jobs
+        self.workers_per_job = max(1, cpu_budget // max_running_jobs)
+        self.jobs = OrderedDict()  # By run_id, in submission order
+        self.__queue = deque()
+        self.__num_running_jobs = 0
+        self.__idle_workers = []
+        self.__condition = threading.Condition()
+        self.version = 0
+        self.__updates = threading.Condition()
+        self.__async_waiters = set()
+
+    def get(self, run_id: str) -> Job:
+        return self.jobs.get(run_id)
+
+    def get_latest(self) -> Job:
+        return next(reversed(self.jobs.values()), None)
+
+    def wait_for_update(self, version: int, timeout: float = None) -> int:
+        """Waits until there is a change after the given `version`, at most `timeout`
+        seconds, and returns the current version"""
+        with self.__updates:
+            self.__updates.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    async def wait_for_update_async(self, version: int, timeout: float = None) -> int:
+        """Same as `wait_for_update` for the event loop, which does not hold a thread
+        while waiting"""
+        loop = asyncio.get_running_loop()
+        updated = asyncio.Event()
+
+        def _notify():
+            loop.call_soon_threadsafe(updated.set)
+
+        with self.__updates:
+            if self.version != version:
+                return self.version
+            self.__async_waiters.add(_notify)
+        try:
+            await asyncio.wait_for(updated.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self.__updates:
+                self.__async_waiters.discard(_notify)
+        return self.version
+
+    def start_workers(self):
+        """Starts the worker processes of all the running slots ahead of the first
+        runs. Otherwise they are started when first needed"""
+        with self.__condition:
+            while (
+                len(self.__idle_workers) + self.__num_running_jobs
+                < self.max_running_jobs
+            ):
+                self.__idle_workers.append(SchedulerWorker())
+
+    def stop_workers(self):
+        """Stops the idle worker processes"""
+        with self.__condition:
+            for worker in self.__idle_workers:
+                worker.stop()
+            self.__idle_workers.clear()
+
+    def submit(self, payload: OptimizerInput) -> Job:
+        """Registers a new job, admits it if there is a free slot and starts its
+        `watch` thread. Raises a `ValueError` if a job with the same `run_id` is queued
+        or running"""
+        with self.__condition:
+            job = self.jobs.get(payload.run_id)
+            if job is not None and not job.finished:
+                raise ValueError(payload.run_id)
+            job = Job(payload, self.__notify_update)
+            self.jobs.pop(job.run_id, None)
+            self.jobs[job.run_id] = job
+            self.__queue.append(job)
+            self.__admit()
+            self.__forget_finished_jobs()
+        self.__notify_update()
+
+        # Follow the run through its process pipe
+        threading.Thread(
+            target=self.watch, args=(job,), name=f"watch-{job.run_id}", daemon=True
+        ).start()
+        return job
+
+    def watch(self, job: Job):
+        """Runs in the job thread: waits for the job to be admitted, starts it and follows
+        it until it finishes, then gives its worker to the next queued job"""
+        with self.__condition:
+            self.__condition.wait_for(lambda: not job.is_queued)
+            if job.worker is None:
+                # Cancelled while queued
+                return
+        try:
+            job.start(self.workers_per_job)
+            job.watch()
+        finally:
+            with self.__condition:
+                job.finished = True
+                self.__num_running_jobs -= 1
+                if job.worker.is_alive():
+                    self.__idle_workers.append(job.worker)
+                self.__admit()
+            job.mark_updated()
+
+    def cancel(self, job: Job):
+        """Removes a queued job from the queue or stops the search of a running one.
+        A running job not finished after `CANCEL_TIMEOUT` seconds is killed"""
+        with self.__condition:
+            if job.is_queued:
+                self.__queue.remove(job)
+                job.finished = True
+                job.heartbeat.set_error("The scheduler run was cancelled while queued.")
+                job.heartbeat.set_end_time()
+                self.__condition.notify_all()
+                job.mark_updated()
+            elif not job.finished:
+                job.cancel()
+                timer = threading.Timer(
+                    CANCEL_TIMEOUT, self.__kill_if_running, args=(job,)
+                )
+                timer.daemon = True
+                timer.start()
+
+    def __kill_if_running(self, job: Job):
+        # Hard kill fallback of `cancel`. Inside of the condition, so the worker is
+        # not given to another job meanwhile
+        with self.__condition:
+            if job.finished:
+                return
+            print(f"Run {job.run_id} did not finish after being cancelled, killing it")
+            job.kill()
+
+    def __notify_update(self):
+        with self.__updates:
+            self.version += 1
+            self.__updates.notify_all()
+            for notify in self.__async_waiters:
+                try:
+                    notify()
+                except RuntimeError:
+                    # The event loop of the stream is closed
+                    pass
+
+    def __admit(self):
+        # Must be called with the condition acquired
+        while self.__queue and self.__num_running_jobs < self.max_running_jobs:
+            job = self.__queue.popleft()
+            job.worker = self.__get_idle_worker()
+            self.__num_running_jobs += 1
+        self.__condition.notify_all()
+
+    def __get_idle_worker(self) -> SchedulerWorker:
+        # Must be called with the condition acquired
+        while self.__idle_workers:
+            worker = self.__idle_workers.pop()
+            if worker.is_alive():
+                return worker
+        return SchedulerWorker()
+
+    def __forget_finished_jobs(self):
+        # Must be called with the condition acquired
+        finished_jobs = [job for job in self.jobs.values() if job.finished]
+        for job in finished_jobs[: max(0, len(finished_jobs) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job.run_id]
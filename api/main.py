@@ -1,9 +1,14 @@
-import multiprocessing
+import json
 
-from fastapi import FastAPI, BackgroundTasks, HTTPException
+from typing import Union
 
-from .objects import OptimizerInput, HeartbeatStatus
-from scheduler.optimizer_v1_8 import compute_schedule
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from .objects import OptimizerInput, HeartbeatStatus, ScheduleDataFrame
+from .jobs import JobManager
 
 optimizer = FastAPI(
     title="Alto Scheduler API",
@@ -15,51 +20,61 @@ optimizer = FastAPI(
     },
 )
 
-# Define the global Heartbeat that will be updated by the endpoints & scheduler
-heartbeat = HeartbeatStatus()
-heartbeat.version = 1.8
+# Heartbeat returned while no run was submitted
+empty_heartbeat = HeartbeatStatus()
+empty_heartbeat.version = 1.8
+EMPTY_HEARTBEAT_ETAG = '"empty"'
 
-# Keep track of the current running scheduler process
-_current_scheduler_process = None
+# Heartbeat fields returned by each of the `fields` of the output endpoints
+OUTPUT_FIELDS = {
+    "status": [
+        "version",
+        "stage_id",
+        "stage",
+        "step",
+        "start_time",
+        "end_time",
+        "error_message",
+    ],
+    "scores": ["total_score", "score_real", "score_constraints", "scores_over_time"],
+    "solver_stats": ["best_bound", "solver_stats", "build_profile"],
+    "solution": ["solution"],
+    "schedule": ["schedule"],
+    "payload": ["payload"],
+}
+# Fields returned when no `fields` are given. The payload must be selected
+DEFAULT_OUTPUT_FIELDS = [field for field in OUTPUT_FIELDS if field != "payload"]
 
+# Registry of the queued, running and finished scheduler runs
+job_manager = JobManager()
 
-def _update_heartbeat_from_pipe(multiprocess_pipe):
-    """Auxiliary function that will run in a thread. Updates the heartbeat object
-    with a new one comming from the process pipe"""
-    try:
-        global heartbeat
-        while True:
-            # Read from the pipe until it is cancelled or the process is terminated
-            data = multiprocess_pipe.recv()
-            if data and isinstance(data, HeartbeatStatus):
-                heartbeat = data
-            else:
-                break
-    except Exception as e:
-        if heartbeat.stage_id != -1:
-            heartbeat.set_error("The scheduler process was terminated.")
-        heartbeat.set_end_time()
-    finally:
-        multiprocess_pipe.close()
-
-
-def _scheduler_wrapper(heartbeat, multiprocess_pipe):
-    """Wrapper function that will run in its own process.
-    It executes the scheduler and watches for errors"""
-    try:
-        compute_schedule(heartbeat, multiprocess_pipe)
-    except Exception as e:
-        print(e, flush=True)
-        heartbeat.set_error(str(e))
-        multiprocess_pipe.send(heartbeat)
-    finally:
-        multiprocess_pipe.close()
+# Seconds between two keep alive comments of an idle stream
+STREAM_KEEP_ALIVE = 15
 
 
-@optimizer.get("/heartbeat/")
-def optimizer_heartbeat():
-    """Returns the current status of the scheduler.
-    Use it to know when the scheduler is running or has found a solution."""
+@optimizer.on_event("startup")
+def start_scheduler_workers():
+    # The scheduler processes are started and import the engines before any run
+    job_manager.start_workers()
+
+
+@optimizer.on_event("shutdown")
+def stop_scheduler_workers():
+    job_manager.stop_workers()
+
+
+def _get_job(run_id: str):
+    """Returns the job of the given `run_id` or raises a 404"""
+    job = job_manager.get(run_id)
+    if job is None:
+        raise HTTPException(
+            status_code=404,
+            detail="No scheduler run found for the provided `run_id`.",
+        )
+    return job
+
+
+def _get_heartbeat_summary(heartbeat: HeartbeatStatus):
     return dict(
         run_id=heartbeat.payload.run_id
         if heartbeat.payload and hasattr(heartbeat, "payload")
@@ -74,72 +89,272 @@ def optimizer_heartbeat():
     )
 
 
-@optimizer.post("/input/")
-def optimizer_input(payload: OptimizerInput, background_tasks: BackgroundTasks):
-    """Given a valid input payload triggers a scheduler execution."""
-    # Check that we are in a valid stage to start the scheduler
-    global _current_scheduler_process
-    if _current_scheduler_process and _current_scheduler_process.is_alive():
-        raise HTTPException(
-            status_code=404,
-            detail="Cannot start a scheduler run while a previous run is still running. Check `/heartbeat/`",
-        )
-    _current_scheduler_process = (
-        None  # Set it to None in case it finished gracefully and it is not alive
+def _is_not_modified(request: Request, etag: str) -> bool:
+    """Whether the `If-None-Match` header of the request matches the `etag`"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is None:
+        return False
+    return if_none_match.strip() == "*" or etag in (
+        tag.strip() for tag in if_none_match.split(",")
     )
 
-    # Prepare the heartbeat for a new run
-    heartbeat.payload = payload
-    heartbeat.reset()
 
-    # Initialize pipe for multiprocess
-    read_pipe, write_pripe = multiprocessing.Pipe()
-    # Create a new process for the scheduler
-    _current_scheduler_process = multiprocessing.Process(
-        target=_scheduler_wrapper, args=(heartbeat, write_pripe)
+def _get_heartbeat(request: Request, job):
+    """Returns the heartbeat summary of the job, or a `304 Not Modified` if the client
+    already has its current version"""
+    etag = job.heartbeat_etag if job else EMPTY_HEARTBEAT_ETAG
+    if _is_not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return JSONResponse(
+        _get_heartbeat_summary(job.heartbeat if job else empty_heartbeat),
+        headers={"ETag": etag},
     )
-    _current_scheduler_process.start()
 
-    # Create a thread to read from the process pipe
-    background_tasks.add_task(_update_heartbeat_from_pipe, read_pipe)
 
-    return {
-        f"Scheduler started with run_id: {heartbeat.payload.run_id} and process_id: {_current_scheduler_process.pid}."
-    }
+def _slice_frame(frame, offset: int, limit: Union[int, None]):
+    """Returns the `[offset, offset + limit)` rows of a `VectorDataFrame` like dict,
+    with the `total_rows` of the whole frame"""
+    if frame is None:
+        return None
+    frame = jsonable_encoder(frame)
+    end = None if limit is None else offset + limit
+    return dict(
+        columns=frame["columns"],
+        index=frame["index"][offset:end],
+        data=frame["data"][offset:end],
+        total_rows=len(frame["index"]),
+    )
 
 
-@optimizer.get("/output/")
-def optimizer_output():
-    """Returns the heartbeat information (like `/heartbeat/`) but includes the output
-    of the last best step inside the fields `solution` and `schedule`"""
-    return heartbeat.dict()
+def _get_output_fields(heartbeat: HeartbeatStatus, fields, offset, limit):
+    """Returns the `run_id` and the selected `fields` of the heartbeat, with the
+    `solution` and `schedule` rows sliced"""
+    output = dict(run_id=heartbeat.payload.run_id if heartbeat.payload else None)
+    for field in fields:
+        for name in OUTPUT_FIELDS[field]:
+            output[name] = getattr(heartbeat, name)
+    for name in ("solution", "schedule"):
+        if name in output:
+            output[name] = _slice_frame(output[name], offset, limit)
+    return output
 
 
-@optimizer.get("/cancel/{run_id}")
-def cancel_scheduler(run_id: str):
-    """If a scheduler run exists it terminates the process"""
+def _get_output(
+    request: Request,
+    job,
+    fields: Union[str, None] = None,
+    offset: int = 0,
+    limit: Union[int, None] = None,
+):
+    """Loads the latest solution of the job and returns its `DEFAULT_OUTPUT_FIELDS`,
+    or only the given comma separated `fields`, or a `304 Not Modified` if the client
+    already has its current version. The default output JSON is serialised once per
+    version"""
+    if fields is not None:
+        fields = [field.strip() for field in fields.split(",") if field.strip()]
+        unknown_fields = set(fields) - set(OUTPUT_FIELDS)
+        if unknown_fields:
+            raise HTTPException(
+                status_code=422,
+                detail=f"Unknown output fields: {', '.join(sorted(unknown_fields))}. Valid fields are: {', '.join(OUTPUT_FIELDS)}.",
+            )
+    if offset < 0 or (limit is not None and limit < 0):
+        raise HTTPException(
+            status_code=422,
+            detail="`offset` and `limit` cannot be negative.",
+        )
+
+    default_output = fields is None and offset == 0 and limit is None
+    heartbeat = job.heartbeat if job else empty_heartbeat
+    if job is None:
+        etag = EMPTY_HEARTBEAT_ETAG
+    elif default_output:
+        etag, content = job.get_output_json()
+    else:
+        etag = job.get_output_etag()
+    if _is_not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    if job is None or not default_output:
+        return JSONResponse(
+            jsonable_encoder(
+                _get_output_fields(
+                    heartbeat, fields or DEFAULT_OUTPUT_FIELDS, offset, limit
+                )
+            ),
+            headers={"ETag": etag},
+        )
+    return Response(content, media_type="application/json", headers={"ETag": etag})
 
-    # Sanity check to prevent unwanted cancels
-    if heartbeat.payload and heartbeat.payload.run_id != run_id:
+
+def _format_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+
+async def _stream_events(get_job, until_finished: bool):
+    """Yields the server-sent events of the job returned by `get_job`: a `heartbeat`
+    event when its status changes, with the heartbeat fields other than the payload
+    and outputs, and an `incumbent` event with its `solution`, `schedule` and
+    `scores_over_time` when a new solution is found. Nothing is polled, the stream
+    waits for the job manager updates on the event loop, without holding a thread"""
+    version = job_manager.version
+    last_job, last_status, last_step = None, None, None
+    while True:
+        job = get_job()
+        heartbeat = job.heartbeat if job else empty_heartbeat
+        status = heartbeat.dict(
+            exclude={"payload", "solution", "schedule", "scores_over_time"}
+        )
+        status["run_id"] = job.run_id if job else None
+        if status != last_status:
+            yield _format_event("heartbeat", status)
+            last_status = status
+        if job is not None and (job is not last_job or heartbeat.step != last_step):
+            # Reading the solution buffer must not block the event loop
+            await run_in_threadpool(job.load_solution)
+            yield _format_event(
+                "incumbent",
+                dict(
+                    run_id=job.run_id,
+                    step=heartbeat.step,
+                    solution=heartbeat.solution,
+                    schedule=heartbeat.schedule,
+                    scores_over_time=heartbeat.scores_over_time,
+                ),
+            )
+            last_job, last_step = job, heartbeat.step
+        if until_finished and job.finished:
+            return
+
+        new_version = await job_manager.wait_for_update_async(
+            version, STREAM_KEEP_ALIVE
+        )
+        if new_version == version:
+            yield ": keep-alive\n\n"
+        version = new_version
+
+
+@optimizer.get("/heartbeat/")
+def optimizer_heartbeat(request: Request):
+    """Returns the current status of the last submitted run.
+    Use it to know when the scheduler is running or has found a solution.
+    Send back its `ETag` in `If-None-Match` to get a `304` while nothing changed."""
+    return _get_heartbeat(request, job_manager.get_latest())
+
+
+@optimizer.get("/heartbeat/{run_id}")
+def optimizer_run_heartbeat(run_id: str, request: Request):
+    """Returns the current status of the given run"""
+    return _get_heartbeat(request, _get_job(run_id))
+
+
+@optimizer.get("/jobs/")
+def optimizer_jobs():
+    """Returns the status of every queued, running or recently finished run, in
+    submission order"""
+    return [
+        dict(_get_heartbeat_summary(job.heartbeat), queued=job.is_queued)
+        for job in list(job_manager.jobs.values())
+    ]
+
+
+@optimizer.post("/input/")
+def optimizer_input(payload: OptimizerInput):
+    """Given a valid input payload queues a scheduler execution. It starts as soon as
+    there is a free slot, check `/jobs/`."""
+    # Warm start from the best schedule of a previous run
+    if payload.hint_run_id and payload.hint_schedule is None:
+        hint_job = job_manager.get(payload.hint_run_id)
+        if hint_job is not None:
+            hint_job.load_solution()
+        if hint_job is None or not hint_job.heartbeat.schedule:
+            raise HTTPException(
+                status_code=404,
+                detail="No schedule found for the provided `hint_run_id`.",
+            )
+        payload.hint_schedule = ScheduleDataFrame(**hint_job.heartbeat.schedule)
+
+    # Check that the same run is not already queued or running
+    try:
+        job = job_manager.submit(payload)
+    except ValueError:
         raise HTTPException(
             status_code=404,
-            detail="The current heartbeat `run_id` is different from the one provided. Not cancelling it.",
+            detail="Cannot start a scheduler run while a run with the same `run_id` is still queued or running. Check `/heartbeat/{run_id}`",
         )
 
-    global _current_scheduler_process
-    if _current_scheduler_process is None:
+    if job.is_queued:
+        return {f"Scheduler queued with run_id: {job.run_id}."}
+    return {
+        f"Scheduler started with run_id: {job.run_id} and process_id: {job.worker.pid}."
+    }
+
+
+@optimizer.get("/output/")
+def optimizer_output(
+    request: Request,
+    fields: Union[str, None] = None,
+    offset: int = 0,
+    limit: Union[int, None] = None,
+):
+    """Returns the heartbeat information (like `/heartbeat/`) of the last submitted
+    run but includes the output of the last best step inside the fields `solution`
+    and `schedule`. Supports `If-None-Match` like `/heartbeat/`.
+
+    `fields` selects a comma separated list of `status`, `scores`, `solver_stats`,
+    `solution`, `schedule` and `payload`, and `offset` and `limit` slice the
+    `solution` and `schedule` rows. Every field but the payload is returned by
+    default, the payload is only returned if selected"""
+    return _get_output(request, job_manager.get_latest(), fields, offset, limit)
+
+
+@optimizer.get("/output/{run_id}")
+def optimizer_run_output(
+    run_id: str,
+    request: Request,
+    fields: Union[str, None] = None,
+    offset: int = 0,
+    limit: Union[int, None] = None,
+):
+    """Same as `/output/` for the given run"""
+    return _get_output(request, _get_job(run_id), fields, offset, limit)
+
+
+@optimizer.get("/stream/")
+def optimizer_stream():
+    """Server-sent events stream of the last submitted run, following the new runs as
+    they are submitted. Use it instead of polling `/output/`"""
+    return StreamingResponse(
+        _stream_events(job_manager.get_latest, until_finished=False),
+        media_type="text/event-stream",
+    )
+
+
+@optimizer.get("/stream/{run_id}")
+def optimizer_run_stream(run_id: str):
+    """Same as `/stream/` for the given run. The stream ends once the run finishes"""
+    job = _get_job(run_id)
+    return StreamingResponse(
+        _stream_events(lambda: job, until_finished=True),
+        media_type="text/event-stream",
+    )
+
+
+@optimizer.get("/cancel/{run_id}")
+def cancel_scheduler(run_id: str):
+    """If the run is queued it removes it from the queue, if it is running it stops
+    its search, which finishes with the best solution found so far"""
+    job = job_manager.get(run_id)
+    if job is None or job.finished:
         raise HTTPException(
             status_code=404,
-            detail="No running scheduler execution detected.",
+            detail="No running scheduler execution detected for the provided `run_id`.",
         )
 
-    print("Trying to terminate the process")
-    # Inside a while loop to flag it multiple times and prevent "confirmation" request
-    while _current_scheduler_process.is_alive():
-        _current_scheduler_process.kill()
-    _current_scheduler_process = None
+    print("Trying to cancel the run")
+    job_manager.cancel(job)
 
-    return {"Scheduler execution terminated."}
+    return {"Scheduler execution cancelled."}
 
 
 @optimizer.get("/")
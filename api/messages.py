@@ -0,0 +1,173 @@
+"""Messages sent by the scheduler process through the multiprocess pipe.
+
+Instead of the whole pickled `HeartbeatStatus` (which carries the full payload), the
+scheduler only sends what changed since its previous message, as typed deltas that
+are applied in place to the heartbeat of the API process."""
+
+from typing import List, NamedTuple, Union
+
+from .objects import HeartbeatStatus
+from .solution_buffer import SolutionBuffer
+
+
+class StageDelta(NamedTuple):
+    """The stage changed, the run finished or an error happened"""
+
+    stage_id: int
+    stage: str
+    end_time: Union[str, None]
+    error_message: Union[str, None]
+
+
+class ScoresDelta(NamedTuple):
+    """A new solution was found. Only the new `scores_over_time` items are sent"""
+
+    step: int
+    total_score: int
+    score_real: int
+    score_constraints: int
+    new_scores_over_time: list
+
+
+class ScheduleDelta(NamedTuple):
+    """The `solution` and `schedule` of a new solution"""
+
+    solution: dict
+    schedule: dict
+
+
+class SolverStatsDelta(NamedTuple):
+    """The bound and statistics of a finished search"""
+
+    best_bound: Union[float, None]
+    solver_stats: Union[dict, None]
+
+
+class BuildProfileDelta(NamedTuple):
+    """The model of the run was built"""
+
+    build_profile: list
+
+
+def apply_heartbeat_deltas(heartbeat: HeartbeatStatus, deltas: List[NamedTuple]):
+    """Updates the heartbeat in place with the deltas of a scheduler message"""
+    for delta in deltas:
+        if isinstance(delta, StageDelta):
+            heartbeat.stage_id = delta.stage_id
+            heartbeat.stage = delta.stage
+            heartbeat.end_time = delta.end_time
+            heartbeat.error_message = delta.error_message
+        elif isinstance(delta, ScoresDelta):
+            heartbeat.step = delta.step
+            heartbeat.total_score = delta.total_score
+            heartbeat.score_real = delta.score_real
+            heartbeat.score_constraints = delta.score_constraints
+            heartbeat.scores_over_time.extend(delta.new_scores_over_time)
+        elif isinstance(delta, ScheduleDelta):
+            heartbeat.solution = delta.solution
+            heartbeat.schedule = delta.schedule
+        elif isinstance(delta, SolverStatsDelta):
+            heartbeat.best_bound = delta.best_bound
+            heartbeat.solver_stats = delta.solver_stats
+        elif isinstance(delta, BuildProfileDelta):
+            heartbeat.build_profile = delta.build_profile
+
+
+class HeartbeatDeltaPipe:
+    """Scheduler side of the multiprocess pipe. It takes the place of the pipe
+    connection given to the engines: `send(heartbeat)` sends the list of deltas since
+    the previous call (nothing if there are none), and `send(None)` still signals the
+    end of the run.
+
+    If a `solution_buffer` is given, new solutions are written to it by
+    `send_solution` instead of being sent as `ScheduleDelta`s.
+
+    With `keep_open` the pipe outlives the run, as in the long lived scheduler
+    workers: `send(None)` and `close()` are left to the owner of the pipe."""
+
+    def __init__(
+        self,
+        multiprocess_pipe,
+        solution_buffer: SolutionBuffer = None,
+        keep_open: bool = False,
+    ):
+        self.__pipe = multiprocess_pipe
+        self.__solution_buffer = solution_buffer
+        self.__keep_open = keep_open
+        self.__stage = None
+        self.__scores = None
+        self.__num_scores_over_time = 0
+        self.__solution = None
+        self.__solver_stats = None
+        self.__build_profile = None
+
+    def send(self, heartbeat: Union[HeartbeatStatus, None]):
+        if heartbeat is None:
+            if not self.__keep_open:
+                self.__pipe.send(None)
+            return
+
+        deltas = []
+        stage = StageDelta(
+            heartbeat.stage_id,
+            heartbeat.stage,
+            heartbeat.end_time,
+            heartbeat.error_message,
+        )
+        if stage != self.__stage:
+            deltas.append(stage)
+            self.__stage = stage
+
+        scores = (
+            heartbeat.step,
+            heartbeat.total_score,
+            heartbeat.score_real,
+            heartbeat.score_constraints,
+        )
+        if (
+            scores != self.__scores
+            or len(heartbeat.scores_over_time) != self.__num_scores_over_time
+        ):
+            deltas.append(
+                ScoresDelta(
+                    *scores,
+                    heartbeat.scores_over_time[self.__num_scores_over_time :],
+                )
+            )
+            self.__scores = scores
+            self.__num_scores_over_time = len(heartbeat.scores_over_time)
+
+        # Every new solution replaces the `solution` object, so identity is enough
+        if heartbeat.solution is not self.__solution:
+            deltas.append(ScheduleDelta(heartbeat.solution, heartbeat.schedule))
+            self.__solution = heartbeat.solution
+
+        # Same for the stats, set once per search
+        if heartbeat.solver_stats is not self.__solver_stats:
+            deltas.append(
+                SolverStatsDelta(heartbeat.best_bound, heartbeat.solver_stats)
+            )
+            self.__solver_stats = heartbeat.solver_stats
+
+        # And for the build profile, set once the model is built
+        if heartbeat.build_profile is not self.__build_profile:
+            deltas.append(BuildProfileDelta(heartbeat.build_profile))
+            self.__build_profile = heartbeat.build_profile
+
+        if deltas:
+            self.__pipe.send(deltas)
+
+    def send_solution(self, heartbeat: HeartbeatStatus, shifts_state_values):
+        """Sends a heartbeat with a new solution, given as `[day, hour, minute,
+        vehicle, start, end]` rows"""
+        if self.__solution_buffer is not None:
+            self.__solution_buffer.write(shifts_state_values)
+            self.__solution = heartbeat.solution
+        self.send(heartbeat)
+
+    def close(self):
+        if not self.__keep_open:
+            self.__pipe.close()
+        if self.__solution_buffer is not None:
+            self.__solution_buffer.close()
+            self.__solution_buffer = None
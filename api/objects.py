@@ -1,6 +1,6 @@
 """API objects for better input management & validation"""
 
-from typing import Union, List
+from typing import Union, List, Literal, Tuple
 from pydantic import BaseModel
 from datetime import datetime
 
@@ -22,6 +22,18 @@ class StaticVariables(BaseModel):
     rush_hour_soft_constraint_cost: int = 50
     minimum_shifts_soft_constraint_cost: int = 50
     min_time_between_shifts: int = 30  # In minutes
+    # Minutes between time ticks. Inputs are resampled onto this grid. The revenue,
+    # vehicle cost, minimum shifts cost and max starts & ends stay given per 15
+    # minutes and are rescaled to the ticks, so a run scores the same at every
+    # resolution. Below 15 minutes, the max starts & ends apply to the ticks within
+    # each 15 minutes (30 minutes for 10 minutes ticks). The rush hour cost is per
+    # shift end
+    duration_step: Literal[5, 10, 15, 30, 60] = 15
+    # How shifts are modelled: `states` (per-slot start/end/state booleans),
+    # `intervals` (per-vehicle optional interval variables with no-overlap) or
+    # `counts` (number of shifts per start & duration, rosters assigned afterwards)
+    shift_formulation: Literal["states", "intervals", "counts"] = "states"
+    enable_symmetry_breaking: bool = False
 
 
 class VectorDataFrame(BaseModel):
@@ -33,6 +45,15 @@ class VectorDataFrame(BaseModel):
     data: List[List[int]]
 
 
+class ScheduleDataFrame(BaseModel):
+    """Same as `VectorDataFrame` for the scheduler `schedule` output, which holds
+    the vehicle, start_time and end_time of every shift"""
+
+    columns: List[str]
+    index: List[int]
+    data: List[List[Union[int, datetime]]]
+
+
 class DynamicVariables(BaseModel):
     """Collection of dynamic inputs over time"""
 
@@ -48,6 +69,40 @@ class OptimizerInput(BaseModel):
 
     run_id: str = "99999999-9999-9999-9999-999999999999"
     num_workers: int = 4
+    # Scheduler engine: `v1.8` (vehicle based model), `patterns` (shift patterns),
+    # `column_generation` (shift patterns generated from an LP, for long horizons),
+    # `rolling_horizon` (v1.8 solved in consecutive windows, for multi-day runs),
+    # `lns` (local search over small neighbourhoods, for very big instances) or
+    # `multi_resolution` (v1.8 solved on a coarse time grid, then refined)
+    engine: Literal[
+        "v1.8",
+        "patterns",
+        "column_generation",
+        "rolling_horizon",
+        "lns",
+        "multi_resolution",
+    ] = "v1.8"
+    # Rolling horizon: hours decided by each window, extra hours each window looks
+    # ahead and whether the windows are speculatively solved in parallel processes
+    window_hours: int = 24
+    window_overlap_hours: int = 0
+    parallel_windows: bool = False
+    # Multi-resolution: minutes between the time ticks of the coarse solve
+    coarse_duration_step: Literal[15, 30, 60] = 60
+    # Warm start: schedule (or `run_id` of the last run) to start the search from and,
+    # optionally, the [start, end) hours where it can change. Outside of them the
+    # schedule is fixed to the hint. With `hint_window_hours`, shifts can only start
+    # and end within those hours of a hinted start and end of the same vehicle
+    hint_schedule: Union[ScheduleDataFrame, None] = None
+    hint_run_id: Union[str, None] = None
+    hint_free_hours: Union[Tuple[int, int], None] = None
+    hint_window_hours: Union[int, None] = None
+    # Stopping criteria, disabled if None: max wall time of the run, relative gap
+    # between the best solution and its bound, and seconds without improving the best
+    # solution. The run then finishes with the best solution found so far
+    max_time_in_seconds: Union[float, None] = None
+    relative_gap_limit: Union[float, None] = None
+    max_time_without_improvement: Union[float, None] = None
     static_variables: StaticVariables
     dynamic_variables: DynamicVariables
 
@@ -72,7 +127,10 @@ class HeartbeatStatus(BaseModel):
     )
     payload: OptimizerInput = None
     solution: VectorDataFrame = None
-    schedule: VectorDataFrame = None
+    schedule: ScheduleDataFrame = None
+    best_bound: float = None  # Objective bound of the finished search, if any
+    solver_stats: dict = None  # Status, objective, wall time and search statistics of the finished search
+    build_profile: list = None  # Wall time, peak RSS and variables & constraints added by each model builder
 
     def set_stage(self, id: int, final_stage_message: str = "Scheduler finished"):
         """Sets the stage given its ID. `final_stage_message` specifies a custom message
@@ -114,11 +172,21 @@ class HeartbeatStatus(BaseModel):
         self.solution = None
         self.schedule = None
         self.scores_over_time = []
+        self.best_bound = None
+        self.solver_stats = None
+        self.build_profile = None
 
     def set_end_time(self):
         """Records the end time"""
         self.end_time = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
 
+    def get_elapsed_seconds(self) -> float:
+        """Returns the seconds since the start of the current execution"""
+        if self.start_time is None:
+            return 0.0
+        start_time = datetime.strptime(self.start_time, "%Y-%m-%d %H:%M:%S")
+        return (datetime.utcnow() - start_time).total_seconds()
+
     def set_error(self, exception_message: str):
         self.set_stage(-1)
         self.error_message = exception_message
@@ -0,0 +1,102 @@
+"""Shared memory buffer holding the latest solution of the scheduler process.
+
+The solution is stored as a (vehicle, slot) matrix of `ACTIVE | START | END` flags, so
+the scheduler process publishes a solution by writing a few KB of memory and the API
+process only builds the `solution` and `schedule` frames when they are requested.
+
+The buffer is a ring of two matrices and a sequence counter. The writer fills the
+matrix not pointed by the counter and then increments it. Readers copy the matrix
+pointed by the counter, and try again if the counter moved during the copy."""
+from multiprocessing import shared_memory
+
+import numpy as np
+
+ACTIVE = 1
+START = 2
+END = 4
+
+RING_SIZE = 2
+# Header: sequence counter, number of vehicles, number of slots and slot minutes
+HEADER_SIZE = 4
+
+
+class SolutionBuffer:
+    """Latest solution of a run, shared between the scheduler and API processes"""
+
+    def __init__(self, memory: shared_memory.SharedMemory):
+        self.__memory = memory
+        self.__header = np.ndarray((HEADER_SIZE,), dtype=np.int64, buffer=memory.buf)
+        num_vehicles, num_slots = self.__header[1], self.__header[2]
+        self.__ring = np.ndarray(
+            (RING_SIZE, num_vehicles, num_slots),
+            dtype=np.uint8,
+            buffer=memory.buf,
+            offset=self.__header.nbytes,
+        )
+
+    @classmethod
+    def create(cls, num_vehicles: int, num_slots: int, duration_step: int):
+        """Creates a new, empty, buffer. Its creator has to `unlink` it once done"""
+        memory = shared_memory.SharedMemory(
+            create=True,
+            size=HEADER_SIZE * 8 + RING_SIZE * max(num_vehicles * num_slots, 1),
+        )
+        header = np.ndarray((HEADER_SIZE,), dtype=np.int64, buffer=memory.buf)
+        header[:] = [0, num_vehicles, num_slots, duration_step]
+        del header
+        return cls(memory)
+
+    @classmethod
+    def attach(cls, name: str):
+        """Attaches to the buffer created by the parent process. Child processes share
+        its resource tracker, so the block is not unlinked when they exit"""
+        return cls(shared_memory.SharedMemory(name=name))
+
+    @property
+    def name(self) -> str:
+        return self.__memory.name
+
+    def write(self, shifts_state_values):
+        """Writes a solution given as `[day, hour, minute, vehicle, start, end]` rows"""
+        rows = np.asarray(shifts_state_values, dtype=np.int64).reshape(-1, 6)
+        duration_step = self.__header[3]
+        slots = (rows[:, 0] * 60 * 24 + rows[:, 1] * 60 + rows[:, 2]) // duration_step
+
+        sequence = self.__header[0]
+        matrix = self.__ring[(sequence + 1) % RING_SIZE]
+        matrix.fill(0)
+        matrix[rows[:, 3], slots] = ACTIVE | (rows[:, 4] * START) | (rows[:, 5] * END)
+        self.__header[0] = sequence + 1
+
+    def read(self):
+        """Returns the sequence number and the `[day, hour, minute, vehicle, start,
+        end]` rows of the latest solution. The sequence is 0 if there is none yet"""
+        while True:
+            sequence = self.__header[0]
+            matrix = self.__ring[sequence % RING_SIZE].copy()
+            if self.__header[0] == sequence:
+                break
+
+        vehicles, slots = np.nonzero(matrix)
+        flags = matrix[vehicles, slots]
+        minutes = slots * self.__header[3]
+        rows = np.column_stack(
+            (
+                minutes // (60 * 24),
+                minutes // 60 % 24,
+                minutes % 60,
+                vehicles,
+                (flags & START) > 0,
+                (flags & END) > 0,
+            )
+        ).astype(np.int64)
+        return int(sequence), rows
+
+    def close(self):
+        # The numpy views have to be released before the memory block
+        del self.__header
+        del self.__ring
+        self.__memory.close()
+
+    def unlink(self):
+        self.__memory.unlink()
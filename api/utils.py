@@ -1,4 +1,5 @@
 import os
+import sys
 import json
 
 import pandas as pd
@@ -46,9 +47,12 @@ def files_to_dynamic_variables(path: str):
         json.dump({"dynamic_variables": dynamic_variables}, f)
 
 
-def solution_to_graph():
-    """Displays the solution graph of the best solution inside the `solutions` folder"""
-    df_solution = pd.read_csv("../scheduler/solutions/best_solution_front_format.csv")
+def solution_to_graph(run_id: str):
+    """Displays the solution graph of the best solution of a run inside the
+    `solutions` folder"""
+    df_solution = pd.read_csv(
+        f"../scheduler/solutions/{run_id}/best_solution_front_format.csv"
+    )
 
     fig = px.line(
         df_solution,
@@ -86,4 +90,4 @@ if __name__ == "__main__":
     # files_to_dynamic_variables(
     #     ""
     # )
-    solution_to_graph()
+    solution_to_graph(sys.argv[1])
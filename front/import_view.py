@@ -139,7 +139,7 @@ layout = html.Div(
         html.Div(
             [
                 html.H4(
-                    "Hi! Please upload data (in 15 minute increments) to create a schedule 😃"
+                    "Hi! Please upload data (in 5 to 60 minute increments) to create a schedule 😃"
                 ),
                 html.H6("When everything looks good, move on to the next step ✅"),
             ]
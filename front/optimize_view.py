@@ -1,6 +1,8 @@
 from datetime import datetime
 import os
 import json
+import threading
+import time
 from uuid import uuid4
 
 import pandas as pd
@@ -22,6 +24,77 @@ if not directory_exists:
 BUTTON_STATE_NO_EXECUTION = "Start"
 BUTTON_STATE_RUNNING_EXECUTION = "Cancel"
 
+# API hosts, the localhost one is used when running in debug mode
+API_URLS = ["http://alto_api:8081", "http://0.0.0.0:8081"]
+
+# Fields of the `/output/` of a new run, the payload must be selected
+OUTPUT_FIELDS = "status,scores,solver_stats,solution,schedule,payload"
+
+
+class HeartbeatStream:
+    """Follows the `/stream/` events of the API from a background thread and keeps the
+    latest heartbeat, with the `OUTPUT_FIELDS` of `/output/`. Its `version` changes
+    with every event, so the figures are only rebuilt when something changed"""
+
+    def __init__(self):
+        self.__heartbeat = None
+        self.__version = 0
+        self.__lock = threading.Lock()
+        self.__thread = None
+
+    def start(self):
+        with self.__lock:
+            if self.__thread is None:
+                self.__thread = threading.Thread(target=self.__run, daemon=True)
+                self.__thread.start()
+
+    def get(self):
+        """Returns the version and the latest heartbeat, None until connected"""
+        with self.__lock:
+            return self.__version, self.__heartbeat
+
+    def __run(self):
+        while True:
+            for url in API_URLS:
+                try:
+                    self.__follow(url)
+                except (requests.RequestException, ValueError):
+                    pass
+            # The API is restarting or unreachable
+            time.sleep(1)
+
+    def __follow(self, url):
+        event = None
+        # The API sends a keep alive comment every 15 seconds
+        with requests.get(f"{url}/stream/", stream=True, timeout=(5, 60)) as response:
+            response.raise_for_status()
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith("event: "):
+                    event = line[len("event: ") :]
+                elif line.startswith("data: "):
+                    self.__apply(url, event, json.loads(line[len("data: ") :]))
+
+    def __apply(self, url, event, data):
+        with self.__lock:
+            heartbeat = self.__heartbeat
+        run_id = data.pop("run_id")
+        if (
+            heartbeat is None
+            or (heartbeat["payload"] or {}).get("run_id") != run_id
+        ):
+            # New run: the payload is only fetched once
+            heartbeat = requests.get(
+                f"{url}/output/", params={"fields": OUTPUT_FIELDS}, timeout=(5, 30)
+            ).json()
+        else:
+            heartbeat = dict(heartbeat, **data)
+        with self.__lock:
+            self.__heartbeat = heartbeat
+            self.__version += 1
+
+
+stream = HeartbeatStream()
+
 
 layout = html.Div(
     [
@@ -41,6 +114,8 @@ layout = html.Div(
         ),
         html.Div(id="output-container"),
         dcc.Store(id="current-heartbeat"),
+        dcc.Store(id="current-heartbeat-version"),
+        # Only reads the heartbeat kept by the stream, the API is not polled
         dcc.Interval(
             id="interval-component", interval=3 * 1000, n_intervals=0  # in milliseconds
         ),
@@ -123,23 +198,34 @@ def run_script_onClick(n_clicks, button_state, heartbeat):
     Output("start-button", "disabled"),
     Output("output-container-button", "children"),
     Output("current-heartbeat", "data"),
+    Output("current-heartbeat-version", "data"),
     Input("interval-component", "n_intervals"),
+    State("current-heartbeat-version", "data"),
 )
-def check_for_execution(_):
-    # Directly download the output
-    try:
-        response = requests.get("http://alto_api:8081/output/")
-    except Exception:
-        # Try to connect to localhost if running in debug mode
-        response = requests.get("http://0.0.0.0:8081/output/")
+def check_for_execution(_, current_version):
+    stream.start()
+    version, data = stream.get()
+    if data is None:
+        return (
+            BUTTON_STATE_NO_EXECUTION,
+            True,
+            "Connecting to the scheduler API.",
+            dash.no_update,
+            dash.no_update,
+        )
+    # The figures are rebuilt only when the heartbeat changed
+    if version == current_version:
+        data_update = dash.no_update
+    else:
+        data_update = data
 
-    data = response.json()
     if data["stage_id"] == 0:
         return (
             BUTTON_STATE_NO_EXECUTION,
             False,
             "No scheduler execution detected.",
-            data,
+            data_update,
+            version,
         )
 
     time_delta = None
@@ -164,7 +250,8 @@ def check_for_execution(_):
             Start time: {data["start_time"] or "-"}
             End time: {data["end_time"] or "-"}
             Error message: {data["error_message"] or "-"}""",
-            data,
+            data_update,
+            version,
         )
     else:
         return (
@@ -174,7 +261,8 @@ def check_for_execution(_):
             Current stage: {data['stage']}
             Start time: {data["start_time"] or "-"}
             Time running: {time_delta or "-"}""",
-            data,
+            data_update,
+            version,
         )
 
 
@@ -12,7 +12,14 @@ layout = html.Div(
                         dbc.InputGroup(
                             [
                                 dbc.InputGroupText("Minutes Between Time Ticks"),
-                                dbc.Input(type="number", value=15, disabled=True),
+                                dbc.Select(
+                                    id="duration_step",
+                                    options=[
+                                        {"label": str(step), "value": step}
+                                        for step in [5, 10, 15, 30, 60]
+                                    ],
+                                    value=15,
+                                ),
                             ],
                             className="mb-3",
                         ),
@@ -92,7 +99,7 @@ layout = html.Div(
                     [
                         dbc.InputGroup(
                             [
-                                dbc.InputGroupText("Cost of the vehicle per minute"),
+                                dbc.InputGroupText("Cost of the vehicle every 15 minutes"),
                                 dbc.InputGroupText("$"),
                                 dbc.Input(
                                     id="vehicle_cost",
@@ -226,6 +233,7 @@ layout = html.Div(
 @callback(
     Output("parameter-confirmation", "children"),
     Input("parameter-submit", "n_clicks"),
+    State("duration_step", "value"),
     State("hours_to_simulate", "value"),
     State("vehicle_count", "value"),
     State("min_shift", "value"),
@@ -241,6 +249,7 @@ layout = html.Div(
 )
 def on_save_params(
     n_clicks,
+    duration_step,
     hours_to_simulate,
     num_vehicles,
     min_shift,
@@ -261,6 +270,7 @@ def on_save_params(
             "min_duration": min_shift,
             "max_duration": max_shift,
             "min_time_between_shifts": min_time_between_shifts,
+            "duration_step": int(duration_step),
             "cost_vehicle_per_15min": vehicle_cost,
             "revenue_passenger": trip_revenue,
             "max_starts_per_slot": depot_starts,
@@ -1,6 +1,5 @@
 """OrTools related auxiliary functions"""
 from ortools.sat.python import cp_model
-from scheduler.utils import expand_minutes_into_components
 
 
 def define_shift_state(model, all_minutes, all_vehicles):
@@ -47,14 +46,162 @@ def define_shifts_end(model, all_minutes, all_vehicles):
     }
 
 
+def define_shift_intervals(
+    model,
+    all_minutes,
+    all_vehicles,
+    all_duration,
+    total_minutes,
+    duration_step,
+    min_time_between_shifts,
+):
+    """Auxiliary variables for the interval formulation.
+    Each vehicle gets the maximum number of shifts that fit in the horizon as optional
+    intervals. The interval is padded with the minimum rest time so that a no-overlap
+    constraint also enforces the time between shifts. Shifts are used in order, so
+    the n-th shift of a vehicle can't start before n shorter shifts and rests.
+
+    Returns a dict keyed by (vehicle, shift_number) holding the tuple
+    (is_present, start, duration, end, interval)"""
+    rest_time = max(min_time_between_shifts, duration_step)
+    min_duration = all_duration[0]
+    last_minute = total_minutes - duration_step
+    max_shifts_per_vehicle = max(
+        (last_minute - min_duration) // (min_duration + rest_time) + 1, 0
+    )
+    duration_domain = cp_model.Domain.FromValues(list(all_duration))
+
+    shift_intervals = {}
+    for shift in range(max_shifts_per_vehicle):
+        earliest_start = shift * (min_duration + rest_time)
+        starts_domain = cp_model.Domain.FromValues(
+            [
+                minute
+                for minute in all_minutes
+                if earliest_start <= minute <= last_minute - min_duration
+            ]
+        )
+        for vehicle in all_vehicles:
+            is_present = model.NewBoolVar(f"interval_present_v{vehicle}_s{shift}")
+            start = model.NewIntVarFromDomain(
+                starts_domain, f"interval_start_v{vehicle}_s{shift}"
+            )
+            duration = model.NewIntVarFromDomain(
+                duration_domain, f"interval_duration_v{vehicle}_s{shift}"
+            )
+            end = model.NewIntVar(
+                earliest_start + min_duration,
+                last_minute,
+                f"interval_end_v{vehicle}_s{shift}",
+            )
+            interval = model.NewOptionalIntervalVar(
+                start,
+                duration + rest_time,
+                end + rest_time,
+                is_present,
+                f"interval_v{vehicle}_s{shift}",
+            )
+            shift_intervals[(vehicle, shift)] = (
+                is_present,
+                start,
+                duration,
+                end,
+                interval,
+            )
+    return shift_intervals
+
+
+def define_shift_interval_literals(model, shift_intervals, all_minutes):
+    """Auxiliary variables for the interval formulation: one literal per minute of the
+    start and end domains of every shift interval, true if the shift starts (ends)
+    at that minute.
+
+    Returns two dicts keyed by (vehicle, shift_number) holding {minute: literal}"""
+    interval_starts = {}
+    interval_ends = {}
+    for key, (_, start, _, end, _) in shift_intervals.items():
+        vehicle, shift = key
+        for literals, variable, name in (
+            (interval_starts, start, "starts_at"),
+            (interval_ends, end, "ends_at"),
+        ):
+            domain = cp_model.Domain.FromFlatIntervals(list(variable.Proto().domain))
+            literals[key] = {
+                minute: model.NewBoolVar(f"{name}_v{vehicle}_s{shift}_m{minute}")
+                for minute in all_minutes
+                if domain.Contains(minute)
+            }
+    return interval_starts, interval_ends
+
+
+def get_interval_literals_in_time(interval_literals, all_minutes, all_vehicles):
+    """Return, per (vehicle, minute), the number of shifts of the vehicle starting
+    (ending) at that minute, from the literals of `define_shift_interval_literals`.
+    Used like the `shifts_start` and `shifts_end` booleans of the states formulation"""
+    literals_in_time = {
+        (vehicle, minute): [] for vehicle in all_vehicles for minute in all_minutes
+    }
+    for (vehicle, _), literals in interval_literals.items():
+        for minute, literal in literals.items():
+            literals_in_time[(vehicle, minute)].append(literal)
+    return {
+        key: cp_model.LinearExpr.Sum(literals)
+        for key, literals in literals_in_time.items()
+    }
+
+
+def define_interval_counts_in_time(
+    model, interval_starts, interval_ends, all_minutes, num_vehicles
+):
+    """Return the number of active vehicles, starts and ends per timestamp for the
+    intervals formulation. Starts and ends are sums of the interval literals. A shift
+    is active from its start up to and including its end, so the active vehicles are
+    the ones active at the previous timestamp, plus the starts, minus the previous
+    ends"""
+    starts_in_time = {minute: [] for minute in all_minutes}
+    ends_in_time = {minute: [] for minute in all_minutes}
+    for literals_in_time, interval_literals in (
+        (starts_in_time, interval_starts),
+        (ends_in_time, interval_ends),
+    ):
+        for literals in interval_literals.values():
+            for minute, literal in literals.items():
+                literals_in_time[minute].append(literal)
+    starts_in_time = {
+        minute: cp_model.LinearExpr.Sum(literals)
+        for minute, literals in starts_in_time.items()
+    }
+    ends_in_time = {
+        minute: cp_model.LinearExpr.Sum(literals)
+        for minute, literals in ends_in_time.items()
+    }
+
+    vehicles_in_time = {}
+    for minute in all_minutes:
+        vehicles_in_time[minute] = model.NewIntVar(
+            0, num_vehicles, f"vehicles_in_time_m{minute}"
+        )
+        if minute == all_minutes[0]:
+            model.Add(vehicles_in_time[minute] == starts_in_time[minute])
+        else:
+            previous_minute = minute - all_minutes.step
+            model.Add(
+                vehicles_in_time[minute]
+                == vehicles_in_time[previous_minute]
+                + starts_in_time[minute]
+                - ends_in_time[previous_minute]
+            )
+    return vehicles_in_time, starts_in_time, ends_in_time
+
+
 def define_rush_hour(model, all_minutes, rush_hour_input):
-    """Auxiliary variable to track if we are in a rush hour"""
+    """Auxiliary variable to track if we are in a rush hour.
+    `rush_hour_input` holds one value per slot of `all_minutes`"""
     rush_hour = {}
-    for minute in all_minutes:
-        day, hour, r_minute = expand_minutes_into_components(minute)
+    for slot, minute in enumerate(all_minutes):
         var = model.NewBoolVar(f"rush_hour_{minute}")
         rush_hour[minute] = var
-        if rush_hour_input[(day, hour, r_minute)]:
+        if rush_hour_input[slot]:
             model.Add(var == 1)
         else:
             model.Add(var == 0)
@@ -95,25 +242,24 @@ def define_sum_of_equals(model, all_minutes, all_vehicles):
 def define_completion_rate(
     model,
     all_minutes,
-    all_vehicles,
     num_vehicles,
     demand_input,
-    shifts_state,
+    vehicles_in_time,
 ):
     """Auxiliary variable to define completion_rate
-    The completion rate is the min between demand and vehicles
+    The completion rate is the min between demand and vehicles.
+    `demand_input` holds one value per slot of `all_minutes`
     """
     completion_rate = {}
-    for minute in all_minutes:
+    for slot, minute in enumerate(all_minutes):
         completion_rate[minute] = model.NewIntVar(
             0, num_vehicles, f"completion_rate_m{minute}"
         )
-        day, hour, r_minute = expand_minutes_into_components(minute)
         model.AddMinEquality(
             completion_rate[minute],
             [
-                demand_input[(day, hour, r_minute)],
-                get_vehicles_in_time(shifts_state, minute, all_vehicles),
+                int(demand_input[slot]),
+                vehicles_in_time[minute],
             ],
         )
     return completion_rate
@@ -173,36 +319,104 @@ def get_vehicles_in_time_from_solver(
     return sum(solver.Value(shifts_state[minute, vehicle]) for vehicle in all_vehicles)
 
 
+def get_starts_in_time(shifts_start, minute, all_vehicles):
+    """Return the number of shifts starting at a given timestamp"""
+    return cp_model.LinearExpr.Sum(
+        [shifts_start[(vehicle, minute)] for vehicle in all_vehicles]
+    )
+
+
+def get_ends_in_time(shifts_end, minute, all_vehicles):
+    """Return the number of shifts ending at a given timestamp"""
+    return cp_model.LinearExpr.Sum(
+        [shifts_end[(vehicle, minute)] for vehicle in all_vehicles]
+    )
+
+
+def define_shifts_count(
+    model,
+    all_minutes,
+    all_duration,
+    total_minutes,
+    max_shifts_per_slot,
+):
+    """Auxiliary variable for the counts formulation.
+    Holds the number of shifts that start at a given minute with a given duration"""
+    return {
+        (minute, duration): model.NewIntVar(
+            0, max_shifts_per_slot, f"shifts_count_m{minute}_d{duration}"
+        )
+        for minute in all_minutes
+        for duration in all_duration
+        if minute + duration < total_minutes
+    }
+
+
+def get_counts_in_time(shifts_count, fixed_shifts_list, all_minutes):
+    """Return the number of active vehicles, starts and ends per timestamp for the
+    counts formulation. Counts are obtained by convolving the shifts starting at each
+    minute with their duration. Fixed shifts are added as constants."""
+    vehicles_in_time = {minute: [] for minute in all_minutes}
+    starts_in_time = {minute: [] for minute in all_minutes}
+    ends_in_time = {minute: [] for minute in all_minutes}
+    for (start, duration), count in shifts_count.items():
+        starts_in_time[start].append(count)
+        ends_in_time[start + duration].append(count)
+        for minute in range(
+            start, start + duration + all_minutes.step, all_minutes.step
+        ):
+            vehicles_in_time[minute].append(count)
+
+    fixed_vehicles = {minute: 0 for minute in all_minutes}
+    fixed_starts = {minute: 0 for minute in all_minutes}
+    fixed_ends = {minute: 0 for minute in all_minutes}
+    for _, start, end in fixed_shifts_list:
+        fixed_starts[start] += 1
+        fixed_ends[end] += 1
+        for minute in range(start, end + all_minutes.step, all_minutes.step):
+            fixed_vehicles[minute] += 1
+
+    return (
+        {
+            minute: cp_model.LinearExpr.Sum(vehicles_in_time[minute])
+            + fixed_vehicles[minute]
+            for minute in all_minutes
+        },
+        {
+            minute: cp_model.LinearExpr.Sum(starts_in_time[minute])
+            + fixed_starts[minute]
+            for minute in all_minutes
+        },
+        {
+            minute: cp_model.LinearExpr.Sum(ends_in_time[minute]) + fixed_ends[minute]
+            for minute in all_minutes
+        },
+    )
+
+
 def define_min_shifts_to_vehicles_difference(
     model,
-    shifts_state,
+    vehicles_in_time,
     minimum_shifts_input,
     num_vehicles,
     all_minutes,
-    all_vehicles,
 ):
     """Defines a new Int variable that will hold the number of vehicles needed to meet
-    the min_shifts requirement. Negative values are clamped to 0"""
+    the min_shifts requirement. Negative values are clamped to 0.
+    `minimum_shifts_input` holds one value per slot of `all_minutes`"""
     vehicles_to_min_shifts = {}
-    for minute in all_minutes:
-        day, hour, r_minute = expand_minutes_into_components(minute)
+    for slot, minute in enumerate(all_minutes):
+        minimum_shifts = int(minimum_shifts_input[slot])
         vehicles_to_min_shifts[minute] = model.NewIntVar(
-            -max(num_vehicles, minimum_shifts_input[(day, hour, r_minute)]),
-            max(num_vehicles, minimum_shifts_input[(day, hour, r_minute)]),
+            -max(num_vehicles, minimum_shifts),
+            max(num_vehicles, minimum_shifts),
             f"vehicles_to_min_shifts_m{minute}",
         )
         model.AddMaxEquality(
             vehicles_to_min_shifts[minute],
             [
                 0,
-                (
-                    minimum_shifts_input[(day, hour, r_minute)]
-                    - get_vehicles_in_time(
-                        shifts_state,
-                        minute,
-                        all_vehicles,
-                    )
-                ),
+                (minimum_shifts - vehicles_in_time[minute]),
             ],
         )
     return vehicles_to_min_shifts
@@ -7,3 +7,11 @@ from .max_start_and_end import max_start_and_end
 from .rush_hours import rush_hours
 from .market_hours import market_hours
 from .fixed_shifts import fixed_shifts
+from .shift_intervals import shift_intervals_behaviour
+from .shift_counts import shift_counts_behaviour
+from .symmetry_breaking import (
+    vehicles_lexicographic_order,
+    vehicles_first_start_order,
+    sort_vehicles_shifts,
+)
+from .schedule_hint import schedule_hint, schedule_intervals_hint, schedule_counts_hint
@@ -1,24 +1,11 @@
-from scheduler.utils import expand_minutes_into_components
-
-
 def market_hours(
     model,
-    shifts_state,
+    vehicles_in_time,
     market_hours_input,
-    all_vehicles,
     all_minutes,
 ):
-    """No shifts allowed during closed market hours"""
-    for minute in all_minutes:
-        for vehicle in all_vehicles:
-            day, hour, r_minute = expand_minutes_into_components(minute)
-            if market_hours_input[(day, hour, r_minute)] == 0:  # Closed
-                model.Add(
-                    shifts_state[
-                        (
-                            minute,
-                            vehicle,
-                        )
-                    ]
-                    == 0
-                )
+    """No shifts allowed during closed market hours.
+    `market_hours_input` holds one value per slot of `all_minutes`"""
+    for slot, minute in enumerate(all_minutes):
+        if market_hours_input[slot] == 0:  # Closed
+            model.Add(vehicles_in_time[minute] == 0)
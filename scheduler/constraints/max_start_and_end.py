@@ -1,38 +1,16 @@
-from ortools.sat.python import cp_model
-
-
 def max_start_and_end(
     model,
-    shifts_start,
-    shifts_end,
+    starts_in_time,
+    ends_in_time,
     all_minutes,
-    all_vehicles,
     max_starts_per_slot,
     max_ends_per_slot,
+    window_slots=1,
 ):
-    """The sum of starts and ends per slot can't be higher than the specified max"""
-    for minute in all_minutes:
-        starts = cp_model.LinearExpr.Sum(
-            [
-                shifts_start[
-                    (
-                        vehicle,
-                        minute,
-                    )
-                ]
-                for vehicle in all_vehicles
-            ]
-        )
-        ends = cp_model.LinearExpr.Sum(
-            [
-                shifts_end[
-                    (
-                        vehicle,
-                        minute,
-                    )
-                ]
-                for vehicle in all_vehicles
-            ]
-        )
-        model.Add(starts <= max_starts_per_slot)
-        model.Add(ends <= max_ends_per_slot)
+    """The sum of starts and ends per window of `window_slots` consecutive slots
+    can't be higher than the specified max"""
+    all_minutes = list(all_minutes)
+    for first_slot in range(0, len(all_minutes), window_slots):
+        window = all_minutes[first_slot : first_slot + window_slots]
+        model.Add(sum(starts_in_time[minute] for minute in window) <= max_starts_per_slot)
+        model.Add(sum(ends_in_time[minute] for minute in window) <= max_ends_per_slot)
@@ -0,0 +1,153 @@
+from collections import Counter
+
+import numpy as np
+from ortools.sat.python import cp_model
+
+
+def schedule_hint(
+    model,
+    shifts_start,
+    shifts_end,
+    shifts_state,
+    hint_shifts,
+    all_minutes,
+    all_vehicles,
+    free_minutes=None,
+    window_minutes=None,
+):
+    """Starts the search from the given (vehicle, start, end) shifts.
+    If `free_minutes` is provided, the schedule outside of it is fixed to the hint.
+    If `window_minutes` is provided, shifts can only start and end that close to a
+    hinted start and end of the same vehicle"""
+    hint_starts = {(vehicle, start) for vehicle, start, _ in hint_shifts}
+    hint_ends = {(vehicle, end) for vehicle, _, end in hint_shifts}
+    hint_states = {
+        (vehicle, minute)
+        for vehicle, start, end in hint_shifts
+        for minute in range(start, end + all_minutes.step, all_minutes.step)
+    }
+    for vehicle in all_vehicles:
+        for minute in all_minutes:
+            for variable, hint_values in (
+                (shifts_start[(vehicle, minute)], hint_starts),
+                (shifts_end[(vehicle, minute)], hint_ends),
+                (shifts_state[minute, vehicle], hint_states),
+            ):
+                value = int((vehicle, minute) in hint_values)
+                model.AddHint(variable, value)
+                if free_minutes is not None and minute not in free_minutes:
+                    model.Add(variable == value)
+
+    if window_minutes is not None:
+        for hint_values, variables in (
+            (hint_starts, shifts_start),
+            (hint_ends, shifts_end),
+        ):
+            near_values = {
+                (vehicle, near_minute)
+                for vehicle, minute in hint_values
+                for near_minute in range(
+                    minute - window_minutes,
+                    minute + window_minutes + 1,
+                    all_minutes.step,
+                )
+            }
+            for vehicle in all_vehicles:
+                for minute in all_minutes:
+                    if (vehicle, minute) not in near_values:
+                        model.Add(variables[(vehicle, minute)] == 0)
+
+
+
+def schedule_intervals_hint(
+    model,
+    shift_intervals,
+    interval_starts,
+    interval_ends,
+    hint_shifts,
+    all_minutes,
+    all_vehicles,
+    free_minutes=None,
+    window_minutes=None,
+):
+    """Intervals formulation version of `schedule_hint`: the n-th shift of each
+    vehicle gets its n-th hinted shift. If `free_minutes` is provided, the starts and
+    ends of each vehicle outside of it are fixed to the hint, which also fixes when
+    it is active there. If `window_minutes` is provided, shifts can only start and
+    end that close to a hinted start and end of the same vehicle"""
+    vehicles_shifts = {vehicle: [] for vehicle in all_vehicles}
+    for vehicle, start, end in sorted(hint_shifts):
+        vehicles_shifts[vehicle].append((start, end))
+
+    for (vehicle, shift), variables in shift_intervals.items():
+        is_present, start, duration, end, _ = variables
+        vehicle_shifts = vehicles_shifts[vehicle]
+        if shift < len(vehicle_shifts):
+            shift_start, shift_end = vehicle_shifts[shift]
+            model.AddHint(is_present, 1)
+            model.AddHint(start, shift_start)
+            model.AddHint(duration, shift_end - shift_start)
+            model.AddHint(end, shift_end)
+        else:
+            shift_start, shift_end = None, None
+            model.AddHint(is_present, 0)
+        for literals, hint_minute in (
+            (interval_starts[(vehicle, shift)], shift_start),
+            (interval_ends[(vehicle, shift)], shift_end),
+        ):
+            for minute, literal in literals.items():
+                model.AddHint(literal, int(minute == hint_minute))
+
+    for hint_index, interval_literals in (
+        (0, interval_starts),
+        (1, interval_ends),
+    ):
+        hint_minutes = {
+            vehicle: {shift[hint_index] for shift in vehicle_shifts}
+            for vehicle, vehicle_shifts in vehicles_shifts.items()
+        }
+        literals_in_time = {}
+        for (vehicle, _), literals in interval_literals.items():
+            for minute, literal in literals.items():
+                literals_in_time.setdefault((vehicle, minute), []).append(literal)
+                if window_minutes is not None and not any(
+                    abs(minute - hint_minute) <= window_minutes
+                    for hint_minute in hint_minutes[vehicle]
+                ):
+                    model.Add(literal == 0)
+        if free_minutes is not None:
+            for vehicle in all_vehicles:
+                for minute in all_minutes:
+                    if minute in free_minutes:
+                        continue
+                    model.Add(
+                        cp_model.LinearExpr.Sum(
+                            literals_in_time.get((vehicle, minute), [])
+                        )
+                        == int(minute in hint_minutes[vehicle])
+                    )
+
+
+def schedule_counts_hint(
+    model, shifts_count, hint_shifts, free_minutes=None, window_minutes=None
+):
+    """Counts formulation version of `schedule_hint`. If `free_minutes` is provided,
+    the shifts not entirely inside of it are fixed to the hint. If `window_minutes`
+    is provided, only the shifts starting and ending that close to a hinted shift
+    are allowed"""
+    hint_counts = Counter((start, end - start) for _, start, end in hint_shifts)
+    hint_bounds = np.array(
+        [(start, end) for _, start, end in hint_shifts], dtype=np.int64
+    ).reshape(-1, 2)
+    for (start, duration), count in shifts_count.items():
+        value = hint_counts.get((start, duration), 0)
+        model.AddHint(count, value)
+        if free_minutes is not None and not (
+            start in free_minutes and start + duration in free_minutes
+        ):
+            model.Add(count == value)
+        if window_minutes is not None and not (
+            np.abs(hint_bounds - (start, start + duration)).max(axis=1)
+            <= window_minutes
+        ).any():
+            model.Add(count == 0)
@@ -0,0 +1,25 @@
+from ortools.sat.python import cp_model
+
+
+def shift_counts_behaviour(
+    model: cp_model.CpModel,
+    shifts_count,
+    all_minutes,
+    min_time_between_shifts,
+    num_vehicles,
+):
+    """Counts based alternative to `shift_start_and_end_behaviour`.
+    Vehicles are interchangeable, so instead of assigning shifts to vehicles we only
+    bound the number of vehicles busy at any time. A vehicle is busy from the start of
+    its shift until the end plus the minimum time between shifts.
+    As shifts are intervals, respecting this bound guarantees that a greedy
+    assignment by start time can always build the per vehicle rosters."""
+    rest_time = max(min_time_between_shifts, all_minutes.step)
+    busy_in_time = {minute: [] for minute in all_minutes}
+    for (start, duration), count in shifts_count.items():
+        for minute in range(start, start + duration + rest_time, all_minutes.step):
+            if minute in busy_in_time:
+                busy_in_time[minute].append(count)
+
+    for minute in all_minutes:
+        model.Add(cp_model.LinearExpr.Sum(busy_in_time[minute]) <= num_vehicles)
@@ -0,0 +1,44 @@
+from ortools.sat.python import cp_model
+
+
+def shift_intervals_behaviour(
+    model: cp_model.CpModel,
+    shift_intervals,
+    interval_starts,
+    interval_ends,
+    all_vehicles,
+):
+    """Interval based alternative to `shift_start_and_end_behaviour`.
+    The shifts of a vehicle are optional intervals that can't overlap (their size
+    includes the minimum time between shifts). Shifts are used in order, so the k-th
+    shift can only exist if the previous one does and it must start after it.
+    Exactly one literal of the start & end domains of a present shift is true, and
+    they are channeled to its start & end. There is no per minute state: the counts
+    per timestamp are derived from those literals"""
+    for vehicle in all_vehicles:
+        vehicle_shifts = sorted(key for key in shift_intervals if key[0] == vehicle)
+        model.AddNoOverlap([shift_intervals[key][-1] for key in vehicle_shifts])
+
+        for shift, key in enumerate(vehicle_shifts):
+            is_present, start, _, end, _ = shift_intervals[key]
+            for variable, literals in (
+                (start, interval_starts[key]),
+                (end, interval_ends[key]),
+            ):
+                model.Add(cp_model.LinearExpr.Sum(list(literals.values())) == is_present)
+                model.Add(
+                    variable
+                    == cp_model.LinearExpr.WeightedSum(
+                        list(literals.values()), list(literals)
+                    )
+                ).OnlyEnforceIf(is_present)
+                # Absent shifts are pinned to avoid equivalent solutions
+                model.Add(variable == min(literals)).OnlyEnforceIf(is_present.Not())
+
+            # Shifts are used in chronological order
+            if shift > 0:
+                previous_present, _, _, previous_end, _ = shift_intervals[
+                    vehicle_shifts[shift - 1]
+                ]
+                model.AddImplication(is_present, previous_present)
+                model.Add(start > previous_end).OnlyEnforceIf(is_present)
@@ -0,0 +1,75 @@
+from ortools.sat.python import cp_model
+
+
+def vehicles_lexicographic_order(
+    model: cp_model.CpModel,
+    shifts_start,
+    all_minutes,
+    ordered_vehicles,
+):
+    """Interchangeable vehicles must be sorted by their shift starts.
+    The vector of starts of each vehicle must be lexicographically greater or equal
+    than the one of the next vehicle (i.e. the earliest starting vehicle goes first).
+    `prefix_equal` tracks if both vectors are equal up to the current minute, which is
+    the only case where the current minute decides the order."""
+    for vehicle, next_vehicle in zip(ordered_vehicles, ordered_vehicles[1:]):
+        prefix_equal = None
+        for minute in all_minutes:
+            start = shifts_start[(vehicle, minute)]
+            next_start = shifts_start[(next_vehicle, minute)]
+            if prefix_equal is None:
+                model.Add(start >= next_start)
+            else:
+                model.Add(start >= next_start).OnlyEnforceIf(prefix_equal)
+
+            if minute == all_minutes[-1]:
+                break
+            equal = model.NewBoolVar(f"lex_equal_v{vehicle}_m{minute}")
+            model.Add(start == next_start).OnlyEnforceIf(equal)
+            if prefix_equal is None:
+                model.AddBoolOr([equal, start])
+                model.AddBoolOr([equal, start.Not(), next_start.Not()])
+            else:
+                model.AddImplication(equal, prefix_equal)
+                model.AddBoolOr([equal, prefix_equal.Not(), start])
+                model.AddBoolOr(
+                    [equal, prefix_equal.Not(), start.Not(), next_start.Not()]
+                )
+            prefix_equal = equal
+
+
+def vehicles_first_start_order(
+    model: cp_model.CpModel,
+    shift_intervals,
+    ordered_vehicles,
+):
+    """Intervals formulation version of `vehicles_lexicographic_order`.
+    Interchangeable vehicles must be sorted by the start of their first shift, and
+    vehicles without shifts go last. Every order of `sort_vehicles_shifts` follows it"""
+    for vehicle, next_vehicle in zip(ordered_vehicles, ordered_vehicles[1:]):
+        if (vehicle, 0) not in shift_intervals:
+            break
+        is_present, start, _, _, _ = shift_intervals[(vehicle, 0)]
+        next_present, next_start, _, _, _ = shift_intervals[(next_vehicle, 0)]
+        model.AddImplication(next_present, is_present)
+        model.Add(start <= next_start).OnlyEnforceIf(next_present)
+
+
+def sort_vehicles_shifts(shifts, ordered_vehicles):
+    """Returns the (vehicle, start, end) shifts with the `ordered_vehicles` relabelled
+    so their starts follow the order of `vehicles_lexicographic_order`. Hints must be
+    sorted this way, as an unsorted hint pinned with `free_minutes` is infeasible.
+    At the first differing start, the vehicle starting there goes first, so a vehicle
+    whose starts are a prefix of the other's goes last."""
+    vehicles_starts = {vehicle: [] for vehicle in ordered_vehicles}
+    for vehicle, start, _ in shifts:
+        if vehicle in vehicles_starts:
+            vehicles_starts[vehicle].append(start)
+    sorted_vehicles = sorted(
+        ordered_vehicles,
+        key=lambda vehicle: (*sorted(vehicles_starts[vehicle]), float("inf")),
+    )
+    relabel = dict(zip(sorted_vehicles, ordered_vehicles))
+    return [
+        (relabel.get(vehicle, vehicle), start, end) for vehicle, start, end in shifts
+    ]
@@ -0,0 +1,71 @@
+"""Greedy constructive heuristic.
+
+Shifts are placed one at a time, always picking the valid shift pattern with the best
+marginal value against the demand and minimum shifts not covered yet. It only uses
+NumPy, so a usable schedule is available before the solver model is even built."""
+import numpy as np
+
+from .optimizer_patterns import PatternInputs, get_patterns_cost, get_valid_patterns
+from .utils import assign_shifts_to_vehicles, get_counts_per_window
+
+
+def greedy_schedule(inputs: PatternInputs):
+    """Builds a schedule respecting the shift durations, the max starts & ends per
+    window, the market hours, the rush hours (if they are hard constraints), the time
+    between shifts and the fixed shifts. The hard minimum shifts constraint is only
+    pursued through its soft cost, so check the schedule with `validate_shifts`
+    before publishing it.
+
+    Returns a list of (vehicle, start, end) tuples, including the fixed shifts"""
+    duration_step = inputs.all_minutes.step
+    num_slots = len(inputs.all_minutes)
+    num_free_vehicles = len(inputs.free_vehicles)
+    rest_slots = -(-inputs.rest_time // duration_step)
+
+    pattern_starts, pattern_durations = get_valid_patterns(inputs)
+    pattern_ends = pattern_starts + pattern_durations
+    busy_ends = np.minimum(pattern_ends + rest_slots, num_slots)
+    patterns_cost = get_patterns_cost(inputs, pattern_starts, pattern_durations)
+    revenue_passenger, _, minimum_shifts_cost = inputs.slot_costs
+    window_slots, max_starts, max_ends = inputs.start_end_windows
+
+    residual_demand = inputs.demand - inputs.fixed_vehicles
+    residual_min_shifts = inputs.minimum_shifts - inputs.fixed_vehicles
+    starts_per_window = get_counts_per_window(inputs.fixed_starts, window_slots)
+    ends_per_window = get_counts_per_window(inputs.fixed_ends, window_slots)
+    busy_per_slot = np.zeros(num_slots, dtype=int)
+
+    def _cumsum(values):
+        return np.concatenate(([0], np.cumsum(values)))
+
+    shifts = []
+    while len(pattern_starts):
+        # Value of one more vehicle at each slot, accumulated to price every pattern
+        slot_value = _cumsum(
+            (residual_demand > 0) * revenue_passenger
+            + (residual_min_shifts > 0) * minimum_shifts_cost
+        )
+        full_slots = _cumsum(busy_per_slot >= num_free_vehicles)
+        patterns_value = (
+            slot_value[pattern_ends + 1] - slot_value[pattern_starts] - patterns_cost
+        ).astype(float)
+        patterns_value[
+            (starts_per_window[pattern_starts // window_slots] >= max_starts)
+            | (ends_per_window[pattern_ends // window_slots] >= max_ends)
+            | (full_slots[busy_ends] > full_slots[pattern_starts])
+        ] = -np.inf
+
+        best = np.argmax(patterns_value)
+        if patterns_value[best] <= 0:
+            break
+        start, end = pattern_starts[best], pattern_ends[best]
+        residual_demand[start : end + 1] -= 1
+        residual_min_shifts[start : end + 1] -= 1
+        starts_per_window[start // window_slots] += 1
+        ends_per_window[end // window_slots] += 1
+        busy_per_slot[start : busy_ends[best]] += 1
+        shifts.append((inputs.all_minutes[start], inputs.all_minutes[end]))
+
+    return list(inputs.fixed_shifts_list) + assign_shifts_to_vehicles(
+        shifts, inputs.free_vehicles, inputs.rest_time
+    )
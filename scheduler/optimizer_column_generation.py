@@ -0,0 +1,259 @@
+"""Column generation engine for long horizons.
+
+A restricted master LP selects shift patterns to cover the demand and the minimum
+shifts. At each iteration the LP duals are used to price every valid pattern and the
+ones with a positive reduced cost are added as new columns. Once no pattern can improve
+the LP, the integer schedule is found with a CP-SAT pass over the generated columns,
+starting from the rounded LP solution.
+
+The pricing follows the stop rules of the run: it stops once it has used its share of
+`max_time_in_seconds`, keeping `INTEGER_PASS_TIME_SHARE` of it for the integer pass,
+or once the LP has not improved in `max_time_without_improvement` seconds.
+
+The integer pass is only optimal over the generated columns. The LP objective of the
+converged master bounds the run objective instead, so the run reports its gap to it."""
+import time
+
+import numpy as np
+from ortools.linear_solver import pywraplp
+
+from api.objects import HeartbeatStatus
+from .optimizer_patterns import (
+    get_fixed_shifts_cost,
+    get_pattern_inputs,
+    get_patterns_cost,
+    get_valid_patterns,
+    solve_patterns,
+)
+from .solver import cancel_event
+from .utils import get_counts_per_window
+
+MAX_ITERATIONS = 500  # Column generation iterations before solving the integer problem
+COLUMNS_PER_ITERATION = 50  # Max new columns added to the master at each iteration
+REDUCED_COST_TOLERANCE = 1e-6
+HARD_CONSTRAINT_PENALTY = 1e6  # LP penalty for missing vehicles if min shifts is hard
+INTEGER_PASS_TIME_SHARE = 0.5  # Min share of the wall time limit for the integer pass
+
+
+class RestrictedMaster:
+    """Restricted master LP over a growing set of shift patterns"""
+
+    def __init__(self, inputs):
+        static_variables = inputs.static_variables
+        self.solver = pywraplp.Solver.CreateSolver("GLOP")
+        self.num_slots = len(inputs.all_minutes)
+        self.rest_slots = -(-inputs.rest_time // inputs.all_minutes.step)
+        self.window_slots, max_starts, max_ends = inputs.start_end_windows
+        self.max_patterns_count = min(max_starts, len(inputs.free_vehicles))
+        revenue_passenger, _, minimum_shifts_cost = inputs.slot_costs
+        missing_vehicles_cost = (
+            HARD_CONSTRAINT_PENALTY
+            if static_variables.enable_min_shift_constraint
+            else minimum_shifts_cost
+        )
+
+        infinity = self.solver.infinity()
+        objective = self.solver.Objective()
+        objective.SetMaximization()
+        self.cover_rows = []
+        self.min_shifts_rows = []
+        self.busy_rows = []
+        self.starts_rows = []
+        self.ends_rows = []
+        for slot in range(self.num_slots):
+            # completion_rate <= min(demand, vehicles)
+            completion = self.solver.NumVar(0, float(inputs.demand[slot]), "")
+            objective.SetCoefficient(completion, revenue_passenger)
+            row = self.solver.Constraint(-infinity, float(inputs.fixed_vehicles[slot]))
+            row.SetCoefficient(completion, 1)
+            self.cover_rows.append(row)
+
+            # missing >= min_shifts - vehicles
+            missing = self.solver.NumVar(0, infinity, "")
+            objective.SetCoefficient(missing, -missing_vehicles_cost)
+            row = self.solver.Constraint(
+                -infinity,
+                float(inputs.fixed_vehicles[slot] - inputs.minimum_shifts[slot]),
+            )
+            row.SetCoefficient(missing, -1)
+            self.min_shifts_rows.append(row)
+
+            self.busy_rows.append(
+                self.solver.Constraint(-infinity, len(inputs.free_vehicles))
+            )
+        # One max starts & ends row per window of slots
+        fixed_starts = get_counts_per_window(inputs.fixed_starts, self.window_slots)
+        fixed_ends = get_counts_per_window(inputs.fixed_ends, self.window_slots)
+        for window in range(len(fixed_starts)):
+            self.starts_rows.append(
+                self.solver.Constraint(
+                    -infinity, float(max_starts - fixed_starts[window])
+                )
+            )
+            self.ends_rows.append(
+                self.solver.Constraint(-infinity, float(max_ends - fixed_ends[window]))
+            )
+        self.patterns_count = []
+
+    def add_pattern(self, start, duration, cost):
+        """Adds a new pattern column to the master"""
+        count = self.solver.NumVar(0, self.max_patterns_count, "")
+        self.solver.Objective().SetCoefficient(count, -float(cost))
+        for slot in range(start, start + duration + 1):
+            self.cover_rows[slot].SetCoefficient(count, -1)
+            self.min_shifts_rows[slot].SetCoefficient(count, -1)
+        for slot in range(
+            start, min(start + duration + self.rest_slots, self.num_slots)
+        ):
+            self.busy_rows[slot].SetCoefficient(count, 1)
+        self.starts_rows[start // self.window_slots].SetCoefficient(count, 1)
+        self.ends_rows[(start + duration) // self.window_slots].SetCoefficient(count, 1)
+        self.patterns_count.append(count)
+
+    def solve(self):
+        """Solves the LP and returns its objective value"""
+        status = self.solver.Solve()
+        if status != pywraplp.Solver.OPTIMAL:
+            raise ValueError("The column generation master problem could not be solved")
+        return self.solver.Objective().Value()
+
+    def get_reduced_costs(self, pattern_starts, pattern_durations, patterns_cost):
+        """Prices the given patterns with the duals of the last LP solution.
+        Per slot duals are accumulated so each pattern is priced in O(1)"""
+
+        def _duals(rows):
+            return np.array([row.dual_value() for row in rows])
+
+        def _cumsum(values):
+            return np.concatenate(([0], np.cumsum(values)))
+
+        pattern_ends = pattern_starts + pattern_durations
+        cover_cumsum = _cumsum(_duals(self.cover_rows) + _duals(self.min_shifts_rows))
+        busy_cumsum = _cumsum(_duals(self.busy_rows))
+        busy_ends = np.minimum(pattern_ends + self.rest_slots, self.num_slots)
+        return (
+            -patterns_cost
+            + (cover_cumsum[pattern_ends + 1] - cover_cumsum[pattern_starts])
+            - (busy_cumsum[busy_ends] - busy_cumsum[pattern_starts])
+            - _duals(self.starts_rows)[pattern_starts // self.window_slots]
+            - _duals(self.ends_rows)[pattern_ends // self.window_slots]
+        )
+
+    def get_patterns_count(self):
+        return np.array([count.solution_value() for count in self.patterns_count])
+
+
+def compute_schedule(heartbeat: HeartbeatStatus, multiprocess_pipe=None):
+    """Column generation alternative to `optimizer_v1_8.compute_schedule` meant for
+    long horizons. It takes the same inputs and publishes the same heartbeat
+    `solution` and `schedule` shapes.
+
+    Args:
+        heartbeat (HeartbeatStatus): Status object which will be updated with the run information.
+        multiprocess_pipe (_type_, optional): Multiprocessing pipe to send the current heartbeat object
+            everytime it is updated. Defaults to None.
+    """
+    inputs = get_pattern_inputs(heartbeat)
+
+    # Generate the columns
+    heartbeat.set_stage(1)
+    if multiprocess_pipe:
+        multiprocess_pipe.send(heartbeat)
+    print("Defining Auxiliary Variables", flush=True)
+
+    pattern_starts, pattern_durations = get_valid_patterns(inputs)
+    patterns_cost = get_patterns_cost(inputs, pattern_starts, pattern_durations)
+    generated = np.zeros(len(pattern_starts), dtype=bool)
+    generated_patterns = []  # In the same order as the master columns
+
+    # Wall time of the run after which the pricing stops
+    payload = heartbeat.payload
+    pricing_time_limit = None
+    if payload.max_time_in_seconds is not None:
+        pricing_time_limit = payload.max_time_in_seconds * (
+            1 - INTEGER_PASS_TIME_SHARE
+        )
+
+    master = RestrictedMaster(inputs)
+    converged = False
+    best_objective_value = None
+    last_improvement_time = time.time()
+    for iteration in range(MAX_ITERATIONS):
+        objective_value = master.solve()
+        if (
+            best_objective_value is None
+            or objective_value > best_objective_value + REDUCED_COST_TOLERANCE
+        ):
+            best_objective_value = objective_value
+            last_improvement_time = time.time()
+        reduced_costs = master.get_reduced_costs(
+            pattern_starts, pattern_durations, patterns_cost
+        )
+        reduced_costs[generated] = -np.inf
+        candidates = np.flatnonzero(reduced_costs > REDUCED_COST_TOLERANCE)
+        print(
+            f"Column generation iteration {iteration}: LP objective {objective_value:.2f} - {len(generated_patterns)} columns - {len(candidates)} improving",
+            flush=True,
+        )
+        if not len(candidates):
+            converged = True
+            break
+        if cancel_event.is_set():
+            # The integer pass keeps the best solution it finds before stopping
+            print("Run cancelled, stopping the column generation", flush=True)
+            break
+        # The time rules only stop the pricing once there are columns to select
+        if (
+            generated_patterns
+            and pricing_time_limit is not None
+            and heartbeat.get_elapsed_seconds() >= pricing_time_limit
+        ):
+            print(
+                "Pricing time limit reached, stopping the column generation",
+                flush=True,
+            )
+            break
+        if (
+            generated_patterns
+            and payload.max_time_without_improvement is not None
+            and time.time() - last_improvement_time
+            >= payload.max_time_without_improvement
+        ):
+            print(
+                f"No LP improvement in {payload.max_time_without_improvement} seconds, stopping the column generation",
+                flush=True,
+            )
+            break
+
+        best = candidates[np.argsort(-reduced_costs[candidates])][
+            :COLUMNS_PER_ITERATION
+        ]
+        for pattern in best:
+            master.add_pattern(
+                pattern_starts[pattern],
+                pattern_durations[pattern],
+                patterns_cost[pattern],
+            )
+        generated[best] = True
+        generated_patterns.extend(best)
+
+    # The LP only bounds the run objective once no column can improve it. The CP-SAT
+    # objective also counts the cost of the fixed shifts
+    objective_bound = None
+    if converged:
+        objective_bound = objective_value - get_fixed_shifts_cost(inputs)
+    else:
+        print("The column generation did not converge, no LP bound", flush=True)
+
+    # Find the integer solution over the generated columns (price-and-branch)
+    generated_patterns = np.array(generated_patterns, dtype=int)
+    solve_patterns(
+        heartbeat,
+        inputs,
+        pattern_starts[generated_patterns],
+        pattern_durations[generated_patterns],
+        multiprocess_pipe,
+        patterns_hint=np.round(master.get_patterns_count()),
+        solution_label="Best solution over the generated columns found",
+        objective_bound=objective_bound,
+    )
@@ -0,0 +1,446 @@
+"""Large neighbourhood search engine.
+
+Starting from a feasible schedule (the `hint_schedule` or else the greedy one), each
+iteration frees a neighbourhood of shifts, either the ones touching a random 2 to 4
+hours window or all the shifts of a few random vehicles around a random day, and
+solves only that part of the schedule again with a small CP-SAT model. The score is kept up to date with NumPy
+coverage arrays, only evaluating again the time slots of the neighbourhood."""
+import time
+
+import numpy as np
+from ortools.sat.python import cp_model
+
+from api.objects import HeartbeatStatus
+from .greedy import greedy_schedule
+from .optimizer_patterns import (
+    PatternInputs,
+    get_pattern_inputs,
+    get_patterns_cost,
+    get_valid_patterns,
+    validate_shifts,
+)
+from .solver import (
+    cancel_event,
+    evaluate_schedule,
+    get_shifts_from_schedule,
+    get_states_from_shifts,
+    publish_solution,
+)
+from .utils import clear_solutions_folder
+
+MAX_ITERATIONS = 1000
+MAX_ITERATIONS_WITHOUT_IMPROVEMENT = 50
+SUBPROBLEM_TIME_LIMIT = 5.0  # In seconds
+WINDOW_HOURS = (2, 4)  # Length bounds of the window neighbourhoods
+VEHICLES_PER_MOVE = 2  # Vehicles freed by the vehicles neighbourhoods
+VEHICLES_MOVE_HOURS = 24  # Length of the window of the vehicles neighbourhoods
+MAX_VEHICLES_PER_MOVE = 8  # Keeps the window neighbourhoods small on busy hours
+
+
+class LocalSearchState:
+    """Current schedule, as (vehicle, start, end) shifts, with its per slot coverage
+    and score"""
+
+    def __init__(self, inputs: PatternInputs, shifts):
+        self.inputs = inputs
+        self.shifts = []
+        num_slots = len(inputs.all_minutes)
+        self.vehicles_per_slot = np.zeros(num_slots, dtype=int)
+        self.starts_per_slot = np.zeros(num_slots, dtype=int)
+        self.ends_per_slot = np.zeros(num_slots, dtype=int)
+        for shift in shifts:
+            self._add_shift(shift)
+        self.score_real, self.score_constraints = self.evaluate(0, num_slots)
+
+    def _update_coverage(self, shift, delta):
+        _, start, end = shift
+        duration_step = self.inputs.all_minutes.step
+        self.vehicles_per_slot[
+            start // duration_step : end // duration_step + 1
+        ] += delta
+        self.starts_per_slot[start // duration_step] += delta
+        self.ends_per_slot[end // duration_step] += delta
+
+    def _add_shift(self, shift):
+        self.shifts.append(shift)
+        self._update_coverage(shift, 1)
+
+    def _remove_shift(self, shift):
+        self.shifts.remove(shift)
+        self._update_coverage(shift, -1)
+
+    def evaluate(self, first_slot, last_slot):
+        """Real and soft constraints scores of the [first_slot, last_slot) slots"""
+        return evaluate_schedule(
+            self.vehicles_per_slot[first_slot:last_slot],
+            self.ends_per_slot[first_slot:last_slot],
+            *[
+                value[first_slot:last_slot] if isinstance(value, np.ndarray) else value
+                for value in self.inputs.score_inputs
+            ],
+        )
+
+    @property
+    def total_score(self):
+        return self.score_real - self.score_constraints
+
+    def replace_shifts(self, old_shifts, new_shifts, first_slot, last_slot):
+        """Replaces shifts living inside the [first_slot, last_slot) slots.
+        Returns True if the score improved, otherwise the schedule is left unchanged"""
+        score_real, score_constraints = self.evaluate(first_slot, last_slot)
+        for shift in old_shifts:
+            self._remove_shift(shift)
+        for shift in new_shifts:
+            self._add_shift(shift)
+        new_score_real, new_score_constraints = self.evaluate(first_slot, last_slot)
+
+        if new_score_real - new_score_constraints <= score_real - score_constraints:
+            for shift in new_shifts:
+                self._remove_shift(shift)
+            for shift in old_shifts:
+                self._add_shift(shift)
+            return False
+        self.score_real += new_score_real - score_real
+        self.score_constraints += new_score_constraints - score_constraints
+        return True
+
+
+def solve_neighbourhood(
+    state: LocalSearchState,
+    pattern_starts,
+    pattern_durations,
+    patterns_cost,
+    vehicles,
+    first_slot,
+    last_slot,
+    num_workers,
+    time_limit=SUBPROBLEM_TIME_LIMIT,
+):
+    """Solves again the shifts of the given vehicles inside the [first_slot, last_slot)
+    slots, keeping the rest of the schedule. Fixed shifts are never freed.
+
+    Returns the freed shifts and the new ones (None if no solution was found)"""
+    inputs = state.inputs
+    static_variables = inputs.static_variables
+    duration_step = inputs.all_minutes.step
+    rest_slots = -(-inputs.rest_time // duration_step)
+    num_region_slots = last_slot - first_slot
+    region = slice(first_slot, last_slot)
+
+    freed_shifts = [
+        shift
+        for shift in state.shifts
+        if shift[0] in vehicles
+        and shift not in inputs.fixed_shifts_list
+        and first_slot <= shift[1] // duration_step
+        and shift[2] // duration_step < last_slot
+    ]
+    freed_coverage = LocalSearchState(inputs, freed_shifts)
+    kept_vehicles = (state.vehicles_per_slot - freed_coverage.vehicles_per_slot)[region]
+    # The max starts & ends windows can reach outside of the region
+    kept_starts = state.starts_per_slot - freed_coverage.starts_per_slot
+    kept_ends = state.ends_per_slot - freed_coverage.ends_per_slot
+
+    pattern_ends = pattern_starts + pattern_durations
+    in_region = (pattern_starts >= first_slot) & (pattern_ends < last_slot)
+    freed_patterns = {
+        (vehicle, start // duration_step, (end - start) // duration_step)
+        for vehicle, start, end in freed_shifts
+    }
+
+    model = cp_model.CpModel()
+    active_in_time = [[] for _ in range(num_region_slots)]
+    starts_in_time = [[] for _ in range(num_region_slots)]
+    ends_in_time = [[] for _ in range(num_region_slots)]
+    patterns = []  # (vehicle, pattern, variable)
+    for vehicle in vehicles:
+        # Patterns that do not overlap the kept shifts of the vehicle (with rest time)
+        candidates = in_region.copy()
+        for kept_vehicle, start, end in state.shifts:
+            if kept_vehicle != vehicle or (kept_vehicle, start, end) in freed_shifts:
+                continue
+            candidates &= ~(
+                (pattern_starts < end // duration_step + rest_slots)
+                & (start // duration_step < pattern_ends + rest_slots)
+            )
+        busy_in_time = [[] for _ in range(num_region_slots)]
+        for pattern in np.flatnonzero(candidates):
+            variable = model.NewBoolVar(f"lns_v{vehicle}_p{pattern}")
+            start = pattern_starts[pattern]
+            duration = pattern_durations[pattern]
+            model.AddHint(variable, int((vehicle, start, duration) in freed_patterns))
+            patterns.append((vehicle, pattern, variable))
+
+            # Shifts are contiguous, so the slots are filled from their bounds
+            start -= first_slot
+            for slot in range(start, start + duration + 1):
+                active_in_time[slot].append(variable)
+            for slot in range(
+                start, min(start + duration + rest_slots, num_region_slots)
+            ):
+                busy_in_time[slot].append(variable)
+            starts_in_time[start].append(variable)
+            ends_in_time[start + duration].append(variable)
+
+        for busy_variables in busy_in_time:
+            if len(busy_variables) > 1:
+                model.AddAtMostOne(busy_variables)
+
+    window_slots, max_starts, max_ends = inputs.start_end_windows
+    for window in range(first_slot // window_slots, -(-last_slot // window_slots)):
+        window_region = slice(window * window_slots, (window + 1) * window_slots)
+        slots = range(
+            max(window_region.start, first_slot) - first_slot,
+            min(window_region.stop, last_slot) - first_slot,
+        )
+        starts = [variable for slot in slots for variable in starts_in_time[slot]]
+        ends = [variable for slot in slots for variable in ends_in_time[slot]]
+        model.Add(
+            cp_model.LinearExpr.Sum(starts) + int(kept_starts[window_region].sum())
+            <= max_starts
+        )
+        model.Add(
+            cp_model.LinearExpr.Sum(ends) + int(kept_ends[window_region].sum())
+            <= max_ends
+        )
+
+    completion_rate = []
+    vehicles_to_min_shifts = []
+    demand = inputs.demand[region]
+    minimum_shifts = inputs.minimum_shifts[region]
+    current_vehicles = state.vehicles_per_slot[region]
+    for slot in range(num_region_slots):
+        vehicles_in_time = cp_model.LinearExpr.Sum(active_in_time[slot]) + int(
+            kept_vehicles[slot]
+        )
+        if static_variables.enable_min_shift_constraint:
+            model.Add(vehicles_in_time >= int(minimum_shifts[slot]))
+
+        # completion_rate = min(demand, vehicles) as linear rows (the objective
+        # maximizes it), which gives a much tighter relaxation
+        completion = model.NewIntVar(0, max(int(demand[slot]), 0), "")
+        model.Add(completion <= vehicles_in_time)
+        completion_rate.append(completion)
+        missing = model.NewIntVar(0, max(int(minimum_shifts[slot]), 0), "")
+        model.Add(missing >= int(minimum_shifts[slot]) - vehicles_in_time)
+        vehicles_to_min_shifts.append(missing)
+
+        # The current schedule completes the hint
+        model.AddHint(
+            completion, max(min(int(demand[slot]), int(current_vehicles[slot])), 0)
+        )
+        model.AddHint(
+            missing, max(int(minimum_shifts[slot]) - int(current_vehicles[slot]), 0)
+        )
+
+    revenue_passenger, _, minimum_shifts_cost = inputs.slot_costs
+    model.Maximize(
+        cp_model.LinearExpr.Sum(completion_rate) * revenue_passenger
+        - cp_model.LinearExpr.WeightedSum(
+            [variable for _, _, variable in patterns],
+            [patterns_cost[pattern].item() for _, pattern, _ in patterns],
+        )
+        - cp_model.LinearExpr.Sum(vehicles_to_min_shifts) * minimum_shifts_cost
+    )
+
+    solver = cp_model.CpSolver()
+    solver.parameters.num_workers = num_workers
+    solver.parameters.max_time_in_seconds = time_limit
+    # Probing the dense per vehicle rows takes most of the time of such small models
+    solver.parameters.cp_model_probing_level = 0
+    status = solver.Solve(model)
+    if status != cp_model.OPTIMAL and status != cp_model.FEASIBLE:
+        return freed_shifts, None
+
+    new_shifts = []
+    for vehicle, pattern, variable in patterns:
+        if solver.BooleanValue(variable):
+            start = inputs.all_minutes[pattern_starts[pattern]]
+            end = inputs.all_minutes[pattern_ends[pattern]]
+            new_shifts.append((vehicle, start, end))
+    return freed_shifts, new_shifts
+
+
+def compute_schedule(heartbeat: HeartbeatStatus, multiprocess_pipe=None):
+    """Large neighbourhood search alternative to `optimizer_v1_8.compute_schedule` for
+    instances too big for the full model. It takes the same inputs and publishes the
+    same heartbeat `solution` and `schedule` shapes after every improvement.
+
+    There is no bound to compare against, so only the `max_time_in_seconds` and
+    `max_time_without_improvement` stopping criteria of the payload apply.
+
+    Args:
+        heartbeat (HeartbeatStatus): Status object which will be updated with the run information.
+        multiprocess_pipe (_type_, optional): Multiprocessing pipe to send the current heartbeat object
+            everytime it is updated. Defaults to None.
+    """
+    payload = heartbeat.payload
+    inputs = get_pattern_inputs(heartbeat)
+    static_variables = inputs.static_variables
+    duration_step = inputs.all_minutes.step
+    num_slots = len(inputs.all_minutes)
+    max_duration_slots = inputs.all_duration[-1] // duration_step + 1
+    all_vehicles = np.arange(static_variables.num_vehicles)
+
+    def _finish(stage_message):
+        heartbeat.set_stage(5, stage_message)
+        heartbeat.set_end_time()
+        if multiprocess_pipe:
+            multiprocess_pipe.send(heartbeat)
+
+            # Finish process and close the process pipe
+            multiprocess_pipe.send(None)
+            multiprocess_pipe.close()
+
+    # Initial schedule
+    heartbeat.set_stage(1)
+    if multiprocess_pipe:
+        multiprocess_pipe.send(heartbeat)
+    print("Building Initial Schedule", flush=True)
+
+    shifts = None
+    if payload.hint_schedule:
+        shifts = [
+            (vehicle, start, end)
+            for vehicle, start, end in get_shifts_from_schedule(
+                payload.hint_schedule.dict()
+            )
+            if vehicle < static_variables.num_vehicles
+            and end < num_slots * duration_step
+        ]
+        # The search only accepts feasible moves, so it must start from a feasible
+        # schedule
+        hint_errors = validate_shifts(inputs, shifts)
+        if hint_errors:
+            print(
+                f"The hint schedule is not feasible, starting from the greedy one: {hint_errors[0]}",
+                flush=True,
+            )
+            shifts = None
+    if shifts is None:
+        shifts = greedy_schedule(inputs)
+        greedy_errors = validate_shifts(inputs, shifts)
+        if greedy_errors:
+            print(
+                f"The greedy schedule is not feasible: {greedy_errors[0]}", flush=True
+            )
+            _finish("Scheduler finished - No solution found.")
+            return
+    state = LocalSearchState(inputs, shifts)
+    pattern_starts, pattern_durations = get_valid_patterns(inputs)
+    patterns_cost = get_patterns_cost(inputs, pattern_starts, pattern_durations)
+
+    def _publish(step):
+        publish_solution(
+            heartbeat,
+            get_states_from_shifts(sorted(state.shifts), duration_step),
+            step,
+            state.total_score,
+            state.score_real,
+            state.score_constraints,
+            multiprocess_pipe,
+        )
+
+    clear_solutions_folder(payload.run_id)
+    _publish(0)
+
+    # Improve the schedule one neighbourhood at a time
+    heartbeat.set_stage(4)
+    if multiprocess_pipe:
+        multiprocess_pipe.send(heartbeat)
+    print("Finding Solutions", flush=True)
+
+    rng = np.random.default_rng()
+    start_time = time.time()
+    last_improvement_time = start_time
+    stop_reason = ""
+    step = 0
+    iterations_without_improvement = 0
+    for iteration in range(MAX_ITERATIONS):
+        if cancel_event.is_set():
+            stop_reason = " (cancelled)"
+            break
+        time_limit = SUBPROBLEM_TIME_LIMIT
+        if payload.max_time_in_seconds is not None:
+            time_limit = min(
+                time_limit,
+                payload.max_time_in_seconds - heartbeat.get_elapsed_seconds(),
+            )
+            if time_limit <= 0:
+                stop_reason = " (time limit reached)"
+                break
+        if (
+            payload.max_time_without_improvement is not None
+            and time.time() - last_improvement_time
+            >= payload.max_time_without_improvement
+        ):
+            stop_reason = (
+                f" (no improvement in {payload.max_time_without_improvement} seconds)"
+            )
+            break
+
+        # Window neighbourhoods free the shifts touching a 2 to 4 hours window, and
+        # vehicles neighbourhoods the shifts of a few vehicles around a whole day
+        is_window_move = rng.random() < 0.5
+        if is_window_move:
+            window_slots = rng.integers(
+                WINDOW_HOURS[0] * 60 // duration_step,
+                WINDOW_HOURS[1] * 60 // duration_step + 1,
+            )
+        else:
+            window_slots = VEHICLES_MOVE_HOURS * 60 // duration_step
+        window_slots = min(window_slots, num_slots)
+        window_start = rng.integers(0, num_slots - window_slots + 1)
+        window_end = window_start + window_slots
+
+        vehicles = set(
+            rng.choice(
+                all_vehicles, min(VEHICLES_PER_MOVE, len(all_vehicles)), replace=False
+            )
+        )
+        if is_window_move:
+            touching_vehicles = {
+                vehicle
+                for vehicle, start, end in state.shifts
+                if start // duration_step < window_end
+                and end // duration_step >= window_start
+            }
+            vehicles |= set(
+                rng.choice(
+                    list(touching_vehicles),
+                    min(len(touching_vehicles), MAX_VEHICLES_PER_MOVE - len(vehicles)),
+                    replace=False,
+                )
+            )
+        first_slot = max(window_start - max_duration_slots, 0)
+        last_slot = min(window_end + max_duration_slots, num_slots)
+
+        freed_shifts, new_shifts = solve_neighbourhood(
+            state,
+            pattern_starts,
+            pattern_durations,
+            patterns_cost,
+            sorted(int(vehicle) for vehicle in vehicles),
+            first_slot,
+            last_slot,
+            payload.num_workers,
+            time_limit,
+        )
+        if new_shifts is not None and state.replace_shifts(
+            freed_shifts, new_shifts, first_slot, last_slot
+        ):
+            step += 1
+            iterations_without_improvement = 0
+            last_improvement_time = time.time()
+            print(
+                f"Solution found: {step} - {state.total_score}$ ({state.score_real}$ from real -{state.score_constraints}$ from soft constraints) - iteration {iteration} - {round(time.time() - start_time, 2)} seconds",
+                flush=True,
+            )
+            _publish(step)
+        else:
+            iterations_without_improvement += 1
+            if iterations_without_improvement >= MAX_ITERATIONS_WITHOUT_IMPROVEMENT:
+                break
+
+    print(f"Maximum of objective function: {state.total_score}\n", flush=True)
+    _finish(f"Scheduler finished - Local search finished{stop_reason}.")
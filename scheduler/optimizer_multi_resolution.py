@@ -0,0 +1,161 @@
+"""Multi-resolution engine.
+
+The run is first solved with `optimizer_v1_8.compute_schedule` on a coarse time grid
+of `coarse_duration_step` minutes, where the model is many times smaller. It is then
+refined on the run grid: the coarse shifts are published as the first solution and
+used as the hint, and every shift can only start and end within `REFINE_WINDOW_HOURS`
+of a coarse start and end of its vehicle, unless the payload sets its own
+`hint_window_hours`.
+
+The inputs are resampled with their strictest value on the coarse grid, but a coarse
+schedule is not always feasible on the run grid: a shift ending at a coarse tick
+covers the whole coarse slot, and only the first fine slot of it. The coarse shifts
+are therefore checked against the run grid hard constraints first. If they break one,
+they are only a hint of an unrestricted solve on the run grid."""
+from api.objects import HeartbeatStatus, OptimizerInput, ScheduleDataFrame
+from .optimizer_patterns import evaluate_shifts, get_pattern_inputs, validate_shifts
+from .optimizer_v1_8 import compute_schedule as compute_grid_schedule
+from .solver import (
+    cancel_event,
+    get_shifts_from_schedule,
+    get_states_from_shifts,
+    publish_solution,
+)
+
+# Share of the run wall time limit given to the coarse solve
+COARSE_TIME_SHARE = 0.25
+# Hours around the coarse shifts where the refined shifts can start and end
+REFINE_WINDOW_HOURS = 1
+
+
+def get_coarse_payload(payload: OptimizerInput) -> OptimizerInput:
+    """Returns the payload of the coarse solve, on the `coarse_duration_step` grid"""
+    return payload.copy(
+        update={
+            "max_time_in_seconds": payload.max_time_in_seconds * COARSE_TIME_SHARE
+            if payload.max_time_in_seconds is not None
+            else None,
+            "static_variables": payload.static_variables.copy(
+                update={"duration_step": payload.coarse_duration_step}
+            ),
+        }
+    )
+
+
+def get_refine_payload(
+    payload: OptimizerInput, coarse_schedule, restricted: bool = True
+) -> OptimizerInput:
+    """Returns the payload of the refinement on the run grid, hinted with the coarse
+    schedule (in split format). Unless `restricted`, the shifts are not kept around
+    the coarse ones"""
+    if not restricted:
+        hint_window_hours = None
+    elif payload.hint_window_hours is not None:
+        hint_window_hours = payload.hint_window_hours
+    else:
+        hint_window_hours = REFINE_WINDOW_HOURS
+    return payload.copy(
+        update={
+            "hint_schedule": ScheduleDataFrame(**coarse_schedule),
+            "hint_run_id": None,
+            "hint_free_hours": None,
+            "hint_window_hours": hint_window_hours,
+        }
+    )
+
+
+def compute_schedule(heartbeat: HeartbeatStatus, multiprocess_pipe=None):
+    """Multi-resolution alternative to `optimizer_v1_8.compute_schedule`. It takes the
+    same inputs and publishes the same heartbeat `solution` and `schedule` shapes.
+
+    Args:
+        heartbeat (HeartbeatStatus): Status object which will be updated with the run information.
+        multiprocess_pipe (_type_, optional): Multiprocessing pipe to send the current heartbeat object
+            everytime it is updated. Defaults to None.
+    """
+    payload = heartbeat.payload
+    inputs = get_pattern_inputs(heartbeat)
+    coarse_step = payload.coarse_duration_step
+    fine_step = inputs.all_minutes.step
+
+    # The fixed shifts must also be on the coarse grid to be part of the coarse solve
+    coarse_schedule = None
+    if coarse_step <= fine_step:
+        print(
+            f"The run grid is not finer than {coarse_step} minutes, solving it directly.",
+            flush=True,
+        )
+    elif any(
+        start % coarse_step != 0 or end % coarse_step != 0
+        for _, start, end in inputs.fixed_shifts_list
+    ):
+        print(
+            f"Fixed shifts are not on the {coarse_step} minutes time grid, solving directly.",
+            flush=True,
+        )
+    else:
+        heartbeat.set_stage(4)
+        if multiprocess_pipe:
+            multiprocess_pipe.send(heartbeat)
+        print(f"Solving on the {coarse_step} minutes time grid", flush=True)
+
+        coarse_heartbeat = HeartbeatStatus(payload=get_coarse_payload(payload))
+        coarse_heartbeat.reset()
+        compute_grid_schedule(coarse_heartbeat)
+        coarse_status = (coarse_heartbeat.solver_stats or {}).get("status")
+        if coarse_status in ("OPTIMAL", "FEASIBLE"):
+            coarse_schedule = coarse_heartbeat.schedule
+        else:
+            print(
+                f"No coarse solution found ({coarse_status}), solving directly.",
+                flush=True,
+            )
+
+    if coarse_schedule is None:
+        compute_grid_schedule(heartbeat, multiprocess_pipe)
+        return
+
+    shifts = get_shifts_from_schedule(coarse_schedule)
+    errors = validate_shifts(inputs, shifts)
+    if errors:
+        print(
+            f"The coarse solution is not feasible on the run grid, only used as a hint: {errors[0]}",
+            flush=True,
+        )
+        heartbeat.payload = get_refine_payload(
+            payload, coarse_schedule, restricted=False
+        )
+        try:
+            compute_grid_schedule(heartbeat, multiprocess_pipe)
+        finally:
+            heartbeat.payload = payload
+        return
+
+    if cancel_event.is_set():
+        # The coarse schedule is kept, without refining it
+        score_real, score_constraints = evaluate_shifts(inputs, shifts)
+        publish_solution(
+            heartbeat,
+            get_states_from_shifts(sorted(shifts), fine_step),
+            0,
+            score_real - score_constraints,
+            score_real,
+            score_constraints,
+            multiprocess_pipe,
+        )
+        heartbeat.set_stage(5, "Scheduler finished - Coarse solution kept (cancelled).")
+        heartbeat.set_end_time()
+        if multiprocess_pipe:
+            multiprocess_pipe.send(heartbeat)
+
+            # Finish process and close the process pipe
+            multiprocess_pipe.send(None)
+            multiprocess_pipe.close()
+        return
+
+    # The refinement publishes the coarse schedule first and finishes the run
+    heartbeat.payload = get_refine_payload(payload, coarse_schedule)
+    try:
+        compute_grid_schedule(heartbeat, multiprocess_pipe, feasible_hint=True)
+    finally:
+        heartbeat.payload = payload
@@ -0,0 +1,629 @@
+"""Shift pattern (set covering) engine.
+
+Every feasible shift is a (start, duration) pair, so instead of modelling each vehicle
+the valid patterns are enumerated once with NumPy masks and the solver only decides
+how many shifts of each pattern to run. Rosters are built afterwards by assigning the
+selected shifts to vehicles."""
+import time
+from typing import List, NamedTuple
+
+import numpy as np
+import pandas as pd
+from ortools.sat.python import cp_model
+
+from api.objects import HeartbeatStatus, StaticVariables
+from .solver import (
+    LinearExpressionsEvaluator,
+    StoppableSolutionCollector,
+    evaluate_schedule,
+    get_states_from_shifts,
+    publish_solution,
+    set_solver_stats,
+    set_stopping_criteria,
+)
+from .utils import (
+    assign_shifts_to_vehicles,
+    clear_solutions_folder,
+    get_counts_per_window,
+    get_input_per_slot,
+    get_slot_costs,
+    get_start_end_windows,
+    validate_fixed_shifts_input,
+)
+
+
+def enumerate_shift_patterns(
+    num_slots,
+    duration_slots,
+    closed_slots=None,
+    rush_hour_slots=None,
+):
+    """Returns the start slot and length (in slots) of every valid shift pattern.
+    A pattern is valid if it ends inside the horizon, does not cover a closed slot
+    and does not end in a rush hour slot (when those masks are provided)."""
+    starts = np.arange(num_slots)[:, None]
+    durations = np.asarray(duration_slots)[None, :]
+    ends = starts + durations
+    valid = ends < num_slots
+    ends = np.minimum(ends, num_slots - 1)
+
+    if closed_slots is not None:
+        # Number of closed slots inside [start, end] from the cumulative sum
+        closed_cumsum = np.concatenate(([0], np.cumsum(closed_slots)))
+        valid &= (closed_cumsum[ends + 1] - closed_cumsum[starts]) == 0
+    if rush_hour_slots is not None:
+        valid &= np.asarray(rush_hour_slots)[ends] == 0
+
+    pattern_starts, pattern_durations = np.nonzero(valid)
+    return pattern_starts, np.asarray(duration_slots)[pattern_durations]
+
+
+def get_patterns_per_slot(first_slots, num_pattern_slots, num_slots):
+    """Returns, for each slot, the indices of the patterns spanning it, given the
+    first slot and the number of slots spanned by every pattern (clipped to the
+    horizon). Only the (slot, pattern) pairs are built, never a (slot x pattern)
+    matrix, so it scales with the number of pairs"""
+    num_pattern_slots = np.minimum(num_pattern_slots, num_slots - first_slots)
+    patterns = np.repeat(np.arange(len(first_slots)), num_pattern_slots)
+    # Slot of every pair: the first slot of its pattern plus its rank in the pattern
+    first_pairs = np.cumsum(num_pattern_slots) - num_pattern_slots
+    slots = np.repeat(first_slots - first_pairs, num_pattern_slots) + np.arange(
+        len(patterns)
+    )
+    order = np.argsort(slots, kind="stable")
+    return np.split(
+        patterns[order], np.cumsum(np.bincount(slots, minlength=num_slots))[:-1]
+    )
+
+
+def get_counts_per_slot(first_slots, num_pattern_slots, counts, num_slots):
+    """`get_patterns_per_slot` counterpart for a solution: the number of selected
+    shifts spanning each slot, given how many shifts of each pattern are selected.
+    It is the cumulative sum of the selected counts starting minus stopping at each
+    slot"""
+    stops = np.minimum(first_slots + num_pattern_slots, num_slots)
+    changes = np.bincount(
+        first_slots, weights=counts, minlength=num_slots + 1
+    ) - np.bincount(stops, weights=counts, minlength=num_slots + 1)
+    return np.round(np.cumsum(changes)[:num_slots]).astype(int)
+
+
+class PatternInputs(NamedTuple):
+    """Scheduler inputs as NumPy arrays with one value per time slot"""
+
+    static_variables: StaticVariables
+    all_minutes: range
+    all_duration: range
+    rest_time: int
+    demand: np.ndarray
+    rush_hour: np.ndarray
+    market_open: np.ndarray
+    minimum_shifts: np.ndarray
+    fixed_shifts_list: List[tuple]
+    free_vehicles: List[int]
+    fixed_vehicles: np.ndarray
+    fixed_starts: np.ndarray
+    fixed_ends: np.ndarray
+
+    @property
+    def slot_costs(self):
+        """Revenue per passenger, vehicle cost and missing minimum shift cost of one
+        slot of the grid"""
+        return get_slot_costs(self.static_variables, self.all_minutes.step)
+
+    @property
+    def start_end_windows(self):
+        """Slots per window of the max starts & ends, and the max starts and ends
+        per window"""
+        return get_start_end_windows(self.static_variables, self.all_minutes.step)
+
+    @property
+    def score_inputs(self):
+        """Arguments expected by `evaluate_schedule` after the per slot counts"""
+        revenue_passenger, cost_vehicle, minimum_shifts_cost = self.slot_costs
+        return (
+            self.demand,
+            self.rush_hour,
+            self.minimum_shifts,
+            revenue_passenger,
+            cost_vehicle,
+            self.static_variables.rush_hour_soft_constraint_cost,
+            minimum_shifts_cost,
+        )
+
+
+class PatternSolutionCollector(StoppableSolutionCollector):
+    """Builds and publishes the rosters of every improving solution"""
+
+    def __init__(
+        self,
+        heartbeat,
+        patterns_count,
+        pattern_starts,
+        pattern_durations,
+        fixed_vehicles,
+        fixed_ends,
+        fixed_shifts_list,
+        free_vehicles,
+        all_minutes,
+        rest_time,
+        score_inputs,
+        multiprocess_pipe,
+        max_time_without_improvement=None,
+    ):
+        StoppableSolutionCollector.__init__(self, max_time_without_improvement)
+        self.__heartbeat = heartbeat
+        self.__patterns_count = LinearExpressionsEvaluator(patterns_count)
+        self.__pattern_starts = pattern_starts
+        self.__pattern_durations = pattern_durations
+        self.__fixed_vehicles = fixed_vehicles
+        self.__fixed_ends = fixed_ends
+        self.__fixed_shifts_list = fixed_shifts_list
+        self.__free_vehicles = free_vehicles
+        self.__all_minutes = all_minutes
+        self.__rest_time = rest_time
+        self.__score_inputs = score_inputs
+        self.__multiprocess_pipe = multiprocess_pipe
+        self.__solution_count = 0
+        self.__start_time = time.time()
+
+    def on_solution_callback(self):
+        self.__solution_count += 1
+        self.register_improvement()
+        self.submit_solution(
+            self.get_solution_values(),
+            self.__solution_count,
+            int(self.ObjectiveValue()),
+            round(time.time() - self.__start_time, 2),
+        )
+
+    def _publish(self, solution, solution_count, current_score, current_time):
+        counts = self.__patterns_count.evaluate(solution)
+        num_slots = len(self.__all_minutes)
+        score_real, score_constraints = evaluate_schedule(
+            get_counts_per_slot(
+                self.__pattern_starts, self.__pattern_durations + 1, counts, num_slots
+            )
+            + self.__fixed_vehicles,
+            get_counts_per_slot(
+                self.__pattern_starts + self.__pattern_durations, 1, counts, num_slots
+            )
+            + self.__fixed_ends,
+            *self.__score_inputs,
+        )
+        print(
+            f"Solution found: {solution_count} - {current_score}$ ({score_real}$ from real -{score_constraints}$ from soft constraints) - {current_time} seconds",
+            flush=True,
+        )
+
+        step = self.__all_minutes.step
+        shifts = []
+        for pattern in np.flatnonzero(counts):
+            start = self.__all_minutes[self.__pattern_starts[pattern]]
+            end = start + self.__pattern_durations[pattern] * step
+            shifts.extend([(start, end)] * counts[pattern])
+        assigned_shifts = assign_shifts_to_vehicles(
+            shifts, self.__free_vehicles, self.__rest_time
+        )
+        shifts_state_values = get_states_from_shifts(
+            list(self.__fixed_shifts_list) + assigned_shifts, step
+        )
+        if not len(shifts_state_values):
+            return
+        publish_solution(
+            self.__heartbeat,
+            shifts_state_values,
+            solution_count,
+            current_score,
+            score_real,
+            score_constraints,
+            self.__multiprocess_pipe,
+        )
+
+
+def get_pattern_inputs(heartbeat: HeartbeatStatus) -> PatternInputs:
+    """Converts the heartbeat payload into `PatternInputs`"""
+    static_variables = heartbeat.payload.static_variables
+    num_vehicles = static_variables.num_vehicles
+    min_duration = int(static_variables.min_duration * 60)  # Convert to minutes
+    max_duration = int(static_variables.max_duration * 60)  # Convert to minutes
+
+    # Utility Ranges
+    duration_step = static_variables.duration_step  # In minutes
+    total_minutes = 60 * static_variables.num_hours
+    all_minutes = range(0, total_minutes, duration_step)
+    all_vehicles = range(num_vehicles)
+    # Shifts last a whole number of slots, from the first one above `min_duration`
+    all_duration = range(
+        -(-min_duration // duration_step) * duration_step, max_duration, duration_step
+    )
+    num_slots = len(all_minutes)
+
+    # Dynamic Inputs: one value per time slot
+    dynamic_variables = heartbeat.payload.dynamic_variables
+    demand = get_input_per_slot(
+        dynamic_variables.demand_forecast, "demand", all_minutes
+    )
+    rush_hour = get_input_per_slot(
+        dynamic_variables.rush_hours, "rush_hour", all_minutes
+    )
+    market_open = get_input_per_slot(
+        dynamic_variables.market_hours, "open", all_minutes, fill_value=1
+    )
+    minimum_shifts = get_input_per_slot(
+        dynamic_variables.minimum_shifts, "min_shifts", all_minutes
+    )
+
+    # Fixed shifts: their vehicles only run them, the rest are interchangeable
+    fixed_shifts_list = []
+    if dynamic_variables.fixed_shifts:
+        df_fixed_shifts = pd.read_json(
+            dynamic_variables.fixed_shifts.json(), orient="split"
+        )
+        invalid_shifts = validate_fixed_shifts_input(
+            df_fixed_shifts,
+            duration_step,
+            min_duration,
+            max_duration,
+            num_vehicles,
+        )
+        if invalid_shifts:
+            raise ValueError("Fixed shifts input contains errors", invalid_shifts)
+        fixed_shifts_list = [
+            (
+                vehicle,
+                (sday * 60 * 24) + (shour * 60) + sminute,
+                (eday * 60 * 24) + (ehour * 60) + eminute,
+            )
+            for vehicle, sday, shour, sminute, eday, ehour, eminute in df_fixed_shifts.iloc[
+                :, 1:
+            ].to_numpy()
+        ]
+    pinned_vehicles = {vehicle for vehicle, _, _ in fixed_shifts_list}
+    free_vehicles = [
+        vehicle for vehicle in all_vehicles if vehicle not in pinned_vehicles
+    ]
+    fixed_vehicles = np.zeros(num_slots, dtype=int)
+    fixed_starts = np.zeros(num_slots, dtype=int)
+    fixed_ends = np.zeros(num_slots, dtype=int)
+    for _, start, end in fixed_shifts_list:
+        fixed_vehicles[start // duration_step : end // duration_step + 1] += 1
+        fixed_starts[start // duration_step] += 1
+        fixed_ends[end // duration_step] += 1
+
+    return PatternInputs(
+        static_variables,
+        all_minutes,
+        all_duration,
+        max(static_variables.min_time_between_shifts, duration_step),
+        demand,
+        rush_hour,
+        market_open,
+        minimum_shifts,
+        fixed_shifts_list,
+        free_vehicles,
+        fixed_vehicles,
+        fixed_starts,
+        fixed_ends,
+    )
+
+
+def evaluate_shifts(inputs: PatternInputs, shifts):
+    """Returns the real and soft constraints scores of a list of shifts"""
+    duration_step = inputs.all_minutes.step
+    vehicles_per_slot = np.zeros(len(inputs.all_minutes), dtype=int)
+    ends_per_slot = np.zeros(len(inputs.all_minutes), dtype=int)
+    for _, start, end in shifts:
+        vehicles_per_slot[start // duration_step : end // duration_step + 1] += 1
+        ends_per_slot[end // duration_step] += 1
+    return evaluate_schedule(vehicles_per_slot, ends_per_slot, *inputs.score_inputs)
+
+
+def validate_shifts(inputs: PatternInputs, shifts, frozen_until=0) -> List[str]:
+    """Returns the hard constraints broken by a list of (vehicle, start, end) shifts,
+    empty if it is a feasible schedule of the inputs. The fixed shifts must be part
+    of it and the other shifts must run on the free vehicles, starting after
+    `frozen_until`. Used before publishing a schedule that was not found by the
+    solver, like the greedy or hint ones"""
+    static_variables = inputs.static_variables
+    duration_step = inputs.all_minutes.step
+    num_slots = len(inputs.all_minutes)
+    fixed_shifts = set(inputs.fixed_shifts_list)
+    free_vehicles = set(inputs.free_vehicles)
+    errors = []
+
+    if not shifts:
+        errors.append("There must be at least one shift.")
+    if not fixed_shifts.issubset(shifts):
+        errors.append("The fixed shifts are missing.")
+    vehicles_shifts = {}
+    for vehicle, start, end in shifts:
+        vehicles_shifts.setdefault(vehicle, []).append((start, end))
+        if (vehicle, start, end) in fixed_shifts:
+            continue
+        if vehicle not in free_vehicles:
+            errors.append(f"Vehicle {vehicle} is not free for the shift {start}-{end}.")
+        elif (
+            start % duration_step != 0
+            or end - start not in inputs.all_duration
+            or end // duration_step >= num_slots
+        ):
+            errors.append(f"Shift {start}-{end} is not a valid shift of the grid.")
+        elif start < frozen_until:
+            errors.append(f"Shift {start}-{end} starts before minute {frozen_until}.")
+    for vehicle, vehicle_shifts in vehicles_shifts.items():
+        vehicle_shifts.sort()
+        for (_, end), (next_start, _) in zip(vehicle_shifts, vehicle_shifts[1:]):
+            if next_start - end < inputs.rest_time:
+                errors.append(f"Vehicle {vehicle} does not rest after minute {end}.")
+    if errors:
+        return errors
+
+    vehicles_per_slot = np.zeros(num_slots, dtype=int)
+    starts_per_slot = np.zeros(num_slots, dtype=int)
+    ends_per_slot = np.zeros(num_slots, dtype=int)
+    for _, start, end in shifts:
+        vehicles_per_slot[start // duration_step : end // duration_step + 1] += 1
+        starts_per_slot[start // duration_step] += 1
+        ends_per_slot[end // duration_step] += 1
+
+    def _check(broken_slots, message):
+        if broken_slots.any():
+            minute = inputs.all_minutes[np.flatnonzero(broken_slots)[0]]
+            errors.append(f"{message} from minute {minute}.")
+
+    def _per_window(counts_per_slot):
+        # Window totals, repeated on every slot of the window
+        return np.repeat(
+            get_counts_per_window(counts_per_slot, window_slots), window_slots
+        )[:num_slots]
+
+    window_slots, max_starts, max_ends = inputs.start_end_windows
+    _check(_per_window(starts_per_slot) > max_starts, "Too many starts per slot")
+    _check(_per_window(ends_per_slot) > max_ends, "Too many ends per slot")
+    if static_variables.enable_min_shift_constraint:
+        _check(
+            vehicles_per_slot < inputs.minimum_shifts, "Minimum shifts are not met"
+        )
+    if static_variables.enable_rush_hour_constraint:
+        _check((ends_per_slot > 0) & (inputs.rush_hour > 0), "Shifts end in rush hours")
+    if static_variables.enable_market_hour_constraint:
+        _check(
+            (vehicles_per_slot > 0) & (inputs.market_open == 0),
+            "Shifts run while the market is closed",
+        )
+    return errors
+
+
+def get_valid_patterns(inputs: PatternInputs):
+    """Enumerates the shift patterns allowed by the hard constraints"""
+    static_variables = inputs.static_variables
+    duration_step = inputs.all_minutes.step
+    return enumerate_shift_patterns(
+        len(inputs.all_minutes),
+        [duration // duration_step for duration in inputs.all_duration],
+        closed_slots=(inputs.market_open == 0)
+        if static_variables.enable_market_hour_constraint
+        else None,
+        rush_hour_slots=inputs.rush_hour
+        if static_variables.enable_rush_hour_constraint
+        else None,
+    )
+
+
+def get_patterns_cost(inputs: PatternInputs, pattern_starts, pattern_durations):
+    """The cost of a pattern only depends on its length and on where it ends"""
+    static_variables = inputs.static_variables
+    _, cost_vehicle, _ = inputs.slot_costs
+    return (
+        (pattern_durations + 1) * cost_vehicle
+        + static_variables.rush_hour_soft_constraint_cost
+        * inputs.rush_hour[pattern_starts + pattern_durations]
+    )
+
+
+def get_fixed_shifts_cost(inputs: PatternInputs):
+    """The cost of the fixed shifts, a constant of the objective"""
+    static_variables = inputs.static_variables
+    _, cost_vehicle, _ = inputs.slot_costs
+    return (
+        inputs.fixed_vehicles.sum() * cost_vehicle
+        + (inputs.fixed_ends * inputs.rush_hour).sum()
+        * static_variables.rush_hour_soft_constraint_cost
+    ).item()
+
+
+def solve_patterns(
+    heartbeat: HeartbeatStatus,
+    inputs: PatternInputs,
+    pattern_starts,
+    pattern_durations,
+    multiprocess_pipe=None,
+    patterns_hint=None,
+    solution_label=None,
+    objective_bound=None,
+):
+    """Defines and solves the pattern selection problem over the given patterns.
+    Covers the scheduler stages 2 to 5. `patterns_hint` optionally holds a count per
+    pattern to start the search from.
+
+    When the patterns are only a subset of the valid ones, the search can't prove
+    optimality for the run: `solution_label` replaces the "Optimal/Feasible solution
+    found" of the final stage, and `objective_bound`, an upper bound of the run
+    objective, is reported as the run `best_bound` with the gap to it."""
+    model = cp_model.CpModel()
+    static_variables = inputs.static_variables
+    num_slots = len(inputs.all_minutes)
+    num_free_vehicles = len(inputs.free_vehicles)
+    rest_slots = -(-inputs.rest_time // inputs.all_minutes.step)
+
+    # Patterns active, busy (active or resting), starting and ending at each slot
+    pattern_ends = pattern_starts + pattern_durations
+    active = get_patterns_per_slot(pattern_starts, pattern_durations + 1, num_slots)
+    busy = get_patterns_per_slot(
+        pattern_starts, pattern_durations + rest_slots, num_slots
+    )
+    starting = get_patterns_per_slot(pattern_starts, 1, num_slots)
+    ending = get_patterns_per_slot(pattern_ends, 1, num_slots)
+    window_slots, max_starts, max_ends = inputs.start_end_windows
+    max_patterns_count = min(max_starts, num_free_vehicles)
+    patterns_count = [
+        model.NewIntVar(0, max_patterns_count, f"pattern_s{start}_d{duration}")
+        for start, duration in zip(pattern_starts, pattern_durations)
+    ]
+    if patterns_hint is not None:
+        for count, hint in zip(patterns_count, patterns_hint):
+            model.AddHint(count, min(int(hint), max_patterns_count))
+
+    def _row(patterns_per_slot, slot):
+        return cp_model.LinearExpr.Sum(
+            [patterns_count[pattern] for pattern in patterns_per_slot[slot]]
+        )
+
+    vehicles_per_slot = [
+        _row(active, slot) + int(inputs.fixed_vehicles[slot])
+        for slot in range(num_slots)
+    ]
+
+    # Define the constraints as linear rows over the pattern columns
+    heartbeat.set_stage(2)
+    if multiprocess_pipe:
+        multiprocess_pipe.send(heartbeat)
+    print("Defining Constraints", flush=True)
+
+    model.Add(
+        cp_model.LinearExpr.Sum(patterns_count) + len(inputs.fixed_shifts_list) >= 1
+    )
+    for slot in range(num_slots):
+        model.Add(_row(busy, slot) <= num_free_vehicles)
+        if static_variables.enable_min_shift_constraint:
+            model.Add(vehicles_per_slot[slot] >= int(inputs.minimum_shifts[slot]))
+    fixed_starts = get_counts_per_window(inputs.fixed_starts, window_slots)
+    fixed_ends = get_counts_per_window(inputs.fixed_ends, window_slots)
+    for window, first_slot in enumerate(range(0, num_slots, window_slots)):
+        slots = range(first_slot, min(first_slot + window_slots, num_slots))
+        model.Add(
+            sum(_row(starting, slot) for slot in slots) + int(fixed_starts[window])
+            <= max_starts
+        )
+        model.Add(
+            sum(_row(ending, slot) for slot in slots) + int(fixed_ends[window])
+            <= max_ends
+        )
+
+    # Objective: revenue from the covered demand minus the pattern costs
+    heartbeat.set_stage(3)
+    if multiprocess_pipe:
+        multiprocess_pipe.send(heartbeat)
+    print("Constructing Optimization Problem", flush=True)
+
+    completion_rate = []
+    vehicles_to_min_shifts = []
+    for slot in range(num_slots):
+        completion = model.NewIntVar(
+            0, static_variables.num_vehicles, f"completion_rate_{slot}"
+        )
+        model.AddMinEquality(
+            completion, [int(inputs.demand[slot]), vehicles_per_slot[slot]]
+        )
+        completion_rate.append(completion)
+        missing = model.NewIntVar(
+            0,
+            max(int(inputs.minimum_shifts[slot]), 0),
+            f"vehicles_to_min_shifts_{slot}",
+        )
+        model.Add(missing >= int(inputs.minimum_shifts[slot]) - vehicles_per_slot[slot])
+        vehicles_to_min_shifts.append(missing)
+
+    # The slot costs are fractional below 15 minutes slots, the objective then too
+    revenue_passenger, _, minimum_shifts_cost = inputs.slot_costs
+    patterns_cost = get_patterns_cost(inputs, pattern_starts, pattern_durations)
+    model.Maximize(
+        cp_model.LinearExpr.Sum(completion_rate) * revenue_passenger
+        - cp_model.LinearExpr.WeightedSum(patterns_count, patterns_cost.tolist())
+        - cp_model.LinearExpr.Sum(vehicles_to_min_shifts) * minimum_shifts_cost
+        - get_fixed_shifts_cost(inputs)
+    )
+
+    # Everything was setup fine, remove previous solutions before starting the solver
+    clear_solutions_folder(heartbeat.payload.run_id)
+
+    # Run the scheduler
+    heartbeat.set_stage(4)
+    if multiprocess_pipe:
+        multiprocess_pipe.send(heartbeat)
+    print("Finding Solutions", flush=True)
+
+    solver = cp_model.CpSolver()
+    solver.parameters.num_workers = heartbeat.payload.num_workers
+    set_stopping_criteria(solver, heartbeat)
+    solution_collector = PatternSolutionCollector(
+        heartbeat,
+        patterns_count,
+        pattern_starts,
+        pattern_durations,
+        inputs.fixed_vehicles,
+        inputs.fixed_ends,
+        inputs.fixed_shifts_list,
+        inputs.free_vehicles,
+        inputs.all_minutes,
+        inputs.rest_time,
+        inputs.score_inputs,
+        multiprocess_pipe,
+        heartbeat.payload.max_time_without_improvement,
+    )
+    with solution_collector.publishing(), solution_collector.watch_stop_rules():
+        status = solver.Solve(model, solution_collector)
+    set_solver_stats(heartbeat, solver, status)
+
+    if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
+        print(f"Maximum of objective function: {solver.ObjectiveValue()}\n", flush=True)
+        if solution_label is None:
+            sol_type = "Optimal" if status == cp_model.OPTIMAL else "Feasible"
+            solution_label = f"{sol_type} solution found"
+        stop_reason = solution_collector.get_stop_reason(solver, status)
+        bound_gap = ""
+        if objective_bound is not None:
+            heartbeat.best_bound = objective_bound
+            gap = (objective_bound - solver.ObjectiveValue()) / max(
+                abs(objective_bound), 1
+            )
+            bound_gap = f", {gap:.2%} gap to the bound {objective_bound:.0f}"
+        heartbeat.set_stage(
+            5, f"Scheduler finished - {solution_label}{stop_reason}{bound_gap}."
+        )
+    else:
+        print("No solution found.", flush=True)
+        heartbeat.set_stage(5, "Scheduler finished - No solution found.")
+    heartbeat.set_end_time()
+    if multiprocess_pipe:
+        multiprocess_pipe.send(heartbeat)
+
+        # Finish process and close the process pipe
+        multiprocess_pipe.send(None)
+        multiprocess_pipe.close()
+
+
+def compute_schedule(heartbeat: HeartbeatStatus, multiprocess_pipe=None):
+    """Pattern based alternative to `optimizer_v1_8.compute_schedule`. It takes the
+    same inputs and publishes the same heartbeat `solution` and `schedule` shapes.
+
+    Args:
+        heartbeat (HeartbeatStatus): Status object which will be updated with the run information.
+        multiprocess_pipe (_type_, optional): Multiprocessing pipe to send the current heartbeat object
+            everytime it is updated. Defaults to None.
+    """
+    inputs = get_pattern_inputs(heartbeat)
+
+    # Enumerate the valid patterns
+    heartbeat.set_stage(1)
+    if multiprocess_pipe:
+        multiprocess_pipe.send(heartbeat)
+    print("Defining Auxiliary Variables", flush=True)
+
+    pattern_starts, pattern_durations = get_valid_patterns(inputs)
+    print(f"{len(pattern_starts)} valid shift patterns", flush=True)
+
+    solve_patterns(
+        heartbeat, inputs, pattern_starts, pattern_durations, multiprocess_pipe
+    )
@@ -0,0 +1,305 @@
+"""Rolling horizon engine.
+
+Multi-day runs are split into windows of `window_hours`, each one also looking
+`window_overlap_hours` ahead, and solved one after the other with
+`optimizer_v1_8.compute_schedule`. Shifts of the previous windows that are still
+running (or resting) when a window starts are frozen as fixed shifts of that window,
+so the stitched schedule is feasible as a whole. With `parallel_windows` all the
+windows are first solved at the same time assuming nothing is carried over, and only
+the ones where that assumption does not hold are solved again. Cancelling the run
+terminates those parallel windows and keeps no schedule."""
+import multiprocessing
+
+import pandas as pd
+
+from api.objects import HeartbeatStatus, OptimizerInput, VectorDataFrame
+from .optimizer_patterns import evaluate_shifts, get_pattern_inputs
+from .optimizer_v1_8 import compute_schedule as compute_window_schedule
+from .solver import (
+    STOP_CHECK_INTERVAL,
+    cancel_event,
+    get_shifts_from_schedule,
+    get_states_from_shifts,
+    publish_solution,
+)
+from .utils import expand_minutes_into_components
+
+
+def slice_vector_dataframe(vector_dataframe, window_start, window_end):
+    """Keeps the rows of a `VectorDataFrame` between the given minutes, with their
+    day, hour and minute relative to the window start"""
+    if vector_dataframe is None:
+        return None
+
+    df = pd.DataFrame(vector_dataframe.data, columns=vector_dataframe.columns)
+    if "day" not in df:
+        # Inputs without a `day` column are daily profiles, as in `get_input_per_slot`
+        days = range(window_start // (60 * 24), -(-window_end // (60 * 24)))
+        df = pd.concat([df.assign(day=day) for day in days], ignore_index=True)
+    minutes = (df["day"] * 60 * 24) + (df["hour"] * 60) + df["minute"]
+    in_window = (minutes >= window_start) & (minutes < window_end)
+    df = df[in_window].reset_index(drop=True)
+    minutes = minutes[in_window].reset_index(drop=True) - window_start
+    df["day"] = minutes // (60 * 24)
+    df["hour"] = minutes // 60 % 24
+    df["minute"] = minutes % 60
+    return VectorDataFrame(**df.to_dict(orient="split"))
+
+
+def get_window_payload(
+    payload: OptimizerInput,
+    window_start,
+    window_end,
+    commit_start,
+    fixed_shifts_list,
+    num_workers,
+    max_time_in_seconds=None,
+) -> OptimizerInput:
+    """Returns the payload of the window between `window_start` and `window_end`.
+    The schedule before `commit_start` is already decided by `fixed_shifts_list`,
+    so the minimum shifts are not enforced there. `max_time_in_seconds` is the share
+    of the run wall time limit given to the window."""
+    dynamic_variables = payload.dynamic_variables
+    minimum_shifts = slice_vector_dataframe(
+        dynamic_variables.minimum_shifts, window_start, window_end
+    )
+    if minimum_shifts is not None:
+        df = pd.DataFrame(minimum_shifts.data, columns=minimum_shifts.columns)
+        minutes = (df["day"] * 60 * 24) + (df["hour"] * 60) + df["minute"]
+        df.loc[minutes < commit_start - window_start, "min_shifts"] = 0
+        minimum_shifts = VectorDataFrame(**df.to_dict(orient="split"))
+
+    fixed_shifts = []
+    for shift_id, (vehicle, start, end) in enumerate(fixed_shifts_list):
+        sday, shour, sminute = expand_minutes_into_components(start - window_start)
+        eday, ehour, eminute = expand_minutes_into_components(end - window_start)
+        fixed_shifts.append(
+            [shift_id, vehicle, sday, shour, sminute, eday, ehour, eminute]
+        )
+
+    return payload.copy(
+        update={
+            "num_workers": num_workers,
+            "max_time_in_seconds": max_time_in_seconds,
+            # The hint is given for the whole horizon
+            "hint_schedule": None,
+            "hint_free_hours": None,
+            "static_variables": payload.static_variables.copy(
+                update={"num_hours": (window_end - window_start) // 60}
+            ),
+            "dynamic_variables": dynamic_variables.copy(
+                update={
+                    "demand_forecast": slice_vector_dataframe(
+                        dynamic_variables.demand_forecast, window_start, window_end
+                    ),
+                    "minimum_shifts": minimum_shifts,
+                    "rush_hours": slice_vector_dataframe(
+                        dynamic_variables.rush_hours, window_start, window_end
+                    ),
+                    "market_hours": slice_vector_dataframe(
+                        dynamic_variables.market_hours, window_start, window_end
+                    ),
+                    "fixed_shifts": VectorDataFrame(
+                        columns=[
+                            "shift_id",
+                            "vehicle",
+                            "sday",
+                            "shour",
+                            "sminute",
+                            "eday",
+                            "ehour",
+                            "eminute",
+                        ],
+                        index=list(range(len(fixed_shifts))),
+                        data=fixed_shifts,
+                    )
+                    if fixed_shifts
+                    else None,
+                }
+            ),
+        }
+    )
+
+
+def solve_window(payload: OptimizerInput, frozen_until: int = 0):
+    """Solves a single window and returns its (vehicle, start, end) shifts, in
+    minutes from the window start"""
+    window_heartbeat = HeartbeatStatus(payload=payload)
+    window_heartbeat.reset()
+    compute_window_schedule(window_heartbeat, frozen_until=frozen_until)
+    if window_heartbeat.schedule is None:
+        raise ValueError("No solution found for one of the rolling horizon windows")
+    return get_shifts_from_schedule(window_heartbeat.schedule)
+
+
+def _solve_window_star(args):
+    return solve_window(*args)
+
+
+def get_window_bounds(commit_start, commit_end, shifts, overlap_minutes, total_minutes):
+    """Returns the window (start, end) minutes, rounded to hours, so the window
+    covers its commit period, the overlap and the whole given shifts"""
+    window_start = min([commit_start] + [start for _, start, _ in shifts])
+    window_end = max([commit_end + overlap_minutes] + [end + 1 for _, _, end in shifts])
+    return window_start // 60 * 60, min(-(-window_end // 60) * 60, total_minutes)
+
+
+def compute_schedule(heartbeat: HeartbeatStatus, multiprocess_pipe=None):
+    """Rolling horizon alternative to `optimizer_v1_8.compute_schedule` for multi-day
+    runs. It takes the same inputs and publishes the same heartbeat `solution` and
+    `schedule` shapes, updated every time a window is stitched.
+
+    Args:
+        heartbeat (HeartbeatStatus): Status object which will be updated with the run information.
+        multiprocess_pipe (_type_, optional): Multiprocessing pipe to send the current heartbeat object
+            everytime it is updated. Defaults to None.
+    """
+    payload = heartbeat.payload
+    inputs = get_pattern_inputs(heartbeat)
+    total_minutes = len(inputs.all_minutes) * inputs.all_minutes.step
+    window_minutes = 60 * payload.window_hours
+    overlap_minutes = 60 * payload.window_overlap_hours
+    commit_starts = list(range(0, total_minutes, window_minutes))
+
+    def _get_time_limit(num_windows):
+        # The remaining wall time is evenly shared by the windows left to solve
+        if payload.max_time_in_seconds is None:
+            return None
+        return (
+            max(payload.max_time_in_seconds - heartbeat.get_elapsed_seconds(), 0)
+            / num_windows
+        )
+
+    def _get_fixed_shifts(window_start, window_end):
+        return [
+            shift
+            for shift in inputs.fixed_shifts_list
+            if window_start <= shift[1] and shift[2] < window_end
+        ]
+
+    def _get_bounds(commit_start, carried_shifts):
+        # Fixed shifts starting inside the commit period must fit in the window
+        commit_end = commit_start + window_minutes
+        starting_shifts = [
+            shift
+            for shift in inputs.fixed_shifts_list
+            if commit_start <= shift[1] < commit_end
+        ]
+        return get_window_bounds(
+            commit_start,
+            commit_end,
+            carried_shifts + starting_shifts,
+            overlap_minutes,
+            total_minutes,
+        )
+
+    # Every window is solved with the scheduler stages, so only the progress on the
+    # stitched schedule is reported here
+    heartbeat.set_stage(4)
+    if multiprocess_pipe:
+        multiprocess_pipe.send(heartbeat)
+    print(f"Solving {len(commit_starts)} rolling horizon windows", flush=True)
+
+    # Speculative windows: solved in parallel assuming no shift is carried over
+    speculative_shifts = {}
+    if payload.parallel_windows and len(commit_starts) > 1:
+        window_args = []
+        for commit_start in commit_starts:
+            window_start, window_end = _get_bounds(commit_start, [])
+            window_args.append(
+                (
+                    get_window_payload(
+                        payload,
+                        window_start,
+                        window_end,
+                        commit_start,
+                        _get_fixed_shifts(window_start, window_end),
+                        max(1, payload.num_workers // len(commit_starts)),
+                        _get_time_limit(len(commit_starts)),
+                    ),
+                    commit_start - window_start,
+                )
+            )
+        with multiprocessing.Pool(len(commit_starts)) as pool:
+            windows_shifts = pool.map_async(_solve_window_star, window_args)
+            # The pool processes do not see `cancel_event`, they are terminated
+            while not windows_shifts.ready():
+                if cancel_event.is_set():
+                    print("Run cancelled, terminating the parallel windows", flush=True)
+                    pool.terminate()
+                    break
+                windows_shifts.wait(STOP_CHECK_INTERVAL)
+            else:
+                speculative_shifts = dict(zip(commit_starts, windows_shifts.get()))
+
+    committed_shifts = []
+    stage_message = "Scheduler finished - Rolling horizon solution found."
+    for window, commit_start in enumerate(commit_starts):
+        if cancel_event.is_set():
+            # The schedule stitched so far is kept
+            stage_message = f"Scheduler finished - Rolling horizon cancelled after {window}/{len(commit_starts)} windows."
+            break
+        commit_end = commit_start + window_minutes
+
+        # Shifts still running or resting when the commit period starts
+        carried_shifts = [
+            shift
+            for shift in committed_shifts
+            if shift[2] + inputs.rest_time > commit_start
+        ]
+        window_start, window_end = _get_bounds(commit_start, carried_shifts)
+        if not carried_shifts and commit_start in speculative_shifts:
+            window_shifts = speculative_shifts[commit_start]
+        else:
+            window_fixed_shifts = carried_shifts + [
+                shift
+                for shift in _get_fixed_shifts(window_start, window_end)
+                if shift not in carried_shifts
+            ]
+            window_shifts = solve_window(
+                get_window_payload(
+                    payload,
+                    window_start,
+                    window_end,
+                    commit_start,
+                    window_fixed_shifts,
+                    payload.num_workers,
+                    _get_time_limit(len(commit_starts) - window),
+                ),
+                commit_start - window_start,
+            )
+
+        # Keep the new shifts starting in the commit period and the fixed ones
+        for vehicle, start, end in window_shifts:
+            shift = (vehicle, start + window_start, end + window_start)
+            if shift in committed_shifts:
+                continue
+            if (
+                commit_start <= shift[1] < commit_end
+                or shift in inputs.fixed_shifts_list
+            ):
+                committed_shifts.append(shift)
+
+        score_real, score_constraints = evaluate_shifts(inputs, committed_shifts)
+        print(
+            f"Window {window + 1}/{len(commit_starts)} stitched: {score_real - score_constraints}$ ({score_real}$ from real -{score_constraints}$ from soft constraints)",
+            flush=True,
+        )
+        publish_solution(
+            heartbeat,
+            get_states_from_shifts(sorted(committed_shifts), inputs.all_minutes.step),
+            window + 1,
+            score_real - score_constraints,
+            score_real,
+            score_constraints,
+            multiprocess_pipe,
+        )
+
+    heartbeat.set_stage(5, stage_message)
+    heartbeat.set_end_time()
+    if multiprocess_pipe:
+        multiprocess_pipe.send(heartbeat)
+
+        # Finish process and close the process pipe
+        multiprocess_pipe.send(None)
+        multiprocess_pipe.close()
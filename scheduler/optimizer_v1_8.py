@@ -1,33 +1,74 @@
-import os
 import pandas as pd
 
 from ortools.sat.python import cp_model
 
 from api.objects import HeartbeatStatus
-from .solver import define_maximization_function, SolutionCollector
+from .solver import (
+    ModelBuildProfiler,
+    define_maximization_function,
+    SolutionCollector,
+    ShiftCountsSolutionCollector,
+    ShiftIntervalsSolutionCollector,
+    get_shifts_from_schedule,
+    get_states_from_shifts,
+    publish_solution,
+    set_solver_stats,
+    set_stopping_criteria,
+)
 from .constraints import (
     min_shifts_per_hour,
     shift_start_and_end_behaviour,
+    shift_intervals_behaviour,
+    shift_counts_behaviour,
     max_start_and_end,
     rush_hours,
     market_hours,
     fixed_shifts,
+    vehicles_lexicographic_order,
+    vehicles_first_start_order,
+    sort_vehicles_shifts,
+    schedule_hint,
+    schedule_intervals_hint,
+    schedule_counts_hint,
 )
 from .auxiliary import (
     define_shift_state,
     define_shifts_start,
     define_shifts_end,
+    define_shift_intervals,
+    define_shift_interval_literals,
+    define_interval_counts_in_time,
+    define_shifts_count,
     define_rush_hour,
     define_completion_rate,
     define_min_shifts_to_vehicles_difference,
     define_sum_of_ends,
     define_sum_of_equals,
     define_sum_of_starts,
+    get_vehicles_in_time,
+    get_starts_in_time,
+    get_ends_in_time,
+    get_counts_in_time,
+    get_interval_literals_in_time,
+)
+from .greedy import greedy_schedule
+from .optimizer_patterns import evaluate_shifts, get_pattern_inputs, validate_shifts
+from .utils import (
+    TimeGrid,
+    clear_solutions_folder,
+    get_input_per_slot,
+    get_slot_costs,
+    get_start_end_windows,
+    validate_fixed_shifts_input,
 )
-from .utils import validate_fixed_shifts_input
 
 
-def compute_schedule(heartbeat: HeartbeatStatus, multiprocess_pipe=None):
+def compute_schedule(
+    heartbeat: HeartbeatStatus,
+    multiprocess_pipe=None,
+    frozen_until: int = 0,
+    feasible_hint: bool = False,
+):
     """This function defines the model contraints, objective function and runs the
     optimizer until it finds an optimal or no-solution.
 
@@ -35,8 +76,15 @@ def compute_schedule(heartbeat: HeartbeatStatus, multiprocess_pipe=None):
         heartbeat (HeartbeatStatus): Status object which will be updated with the run information.
         multiprocess_pipe (_type_, optional): Multiprocessing pipe to send the current heartbeat object
             everytime it is updated. Defaults to None.
+        frozen_until (int, optional): Minute before which only the fixed shifts can start.
+            Used when the schedule before that minute is already decided. Defaults to 0.
+        feasible_hint (bool, optional): Whether the payload hint schedule is known to be
+            feasible, e.g. when solved on a coarser time grid. It is then published as
+            step 0 instead of the greedy schedule. Defaults to False.
     """
     model = cp_model.CpModel()
+    # Size and cost of each model builder, published with the `Finding Solutions` stage
+    profiler = ModelBuildProfiler(model)
 
     # Static Inputs
     num_hours = heartbeat.payload.static_variables.num_hours
@@ -47,17 +95,14 @@ def compute_schedule(heartbeat: HeartbeatStatus, multiprocess_pipe=None):
     max_duration = int(
         heartbeat.payload.static_variables.max_duration * 60
     )  # Convert to minutes
-    cost_vehicle_per_minute = heartbeat.payload.static_variables.cost_vehicle_per_15min
-    revenue_passenger = heartbeat.payload.static_variables.revenue_passenger
-    max_starts_per_slot = heartbeat.payload.static_variables.max_starts_per_slot
-    max_ends_per_slot = heartbeat.payload.static_variables.max_ends_per_slot
     rush_hour_soft_constraint_cost = (
         heartbeat.payload.static_variables.rush_hour_soft_constraint_cost
     )
-    minimum_shifts_soft_constraint_cost = (
-        heartbeat.payload.static_variables.minimum_shifts_soft_constraint_cost
-    )
     min_time_between_shifts = heartbeat.payload.static_variables.min_time_between_shifts
+    shift_formulation = heartbeat.payload.static_variables.shift_formulation
+    enable_symmetry_breaking = (
+        heartbeat.payload.static_variables.enable_symmetry_breaking
+    )
 
     # Hard Constraints Flags
     enable_min_shift_constraint = (
@@ -71,55 +116,45 @@ def compute_schedule(heartbeat: HeartbeatStatus, multiprocess_pipe=None):
     )
 
     # Utility Ranges (for the for-loops)
-    duration_step = 15  # In minutes. We default to every 15 minutes ticks.
+    duration_step = heartbeat.payload.static_variables.duration_step  # In minutes
+    # The costs and max starts & ends are given per 15 minutes, rescale them to the grid
+    (
+        revenue_passenger,
+        cost_vehicle_per_minute,
+        minimum_shifts_soft_constraint_cost,
+    ) = get_slot_costs(heartbeat.payload.static_variables, duration_step)
+    window_slots, max_starts_per_window, max_ends_per_window = get_start_end_windows(
+        heartbeat.payload.static_variables, duration_step
+    )
     total_minutes = (
         60 * num_hours
     )  # We work in minutes, so we convert the hours into minutes.
-    all_minutes = range(0, total_minutes, duration_step)
+    time_grid = TimeGrid.from_static_variables(heartbeat.payload.static_variables)
+    all_minutes = time_grid.all_minutes
     all_vehicles = range(num_vehicles)
-    all_duration = range(min_duration, max_duration, duration_step)
-
-    # Demand: Convert to constraint format
-    demand_input = {
-        (c["day"], c["hour"], c["minute"]): int(round(c["demand"]))
-        for _, c in pd.read_json(
-            heartbeat.payload.dynamic_variables.demand_forecast.json(), orient="split"
-        ).iterrows()
-    }
-
-    # Rush Hours: Convert to constraint format
-    if heartbeat.payload.dynamic_variables.rush_hours:
-        rush_hour_input = {
-            (c["day"], c["hour"], c["minute"]): int(c["rush_hour"])
-            for _, c in pd.read_json(
-                heartbeat.payload.dynamic_variables.rush_hours.json(), orient="split"
-            ).iterrows()
-        }
-    else:
-        rush_hour_input = None
-
-    # Market Hours: Convert to constraint format
-    if heartbeat.payload.dynamic_variables.market_hours:
-        market_hours_input = {
-            (c["day"], c["hour"], c["minute"]): int(round(c["open"]))
-            for _, c in pd.read_json(
-                heartbeat.payload.dynamic_variables.market_hours.json(), orient="split"
-            ).iterrows()
-        }
-    else:
-        market_hours_input = None
+    # Shifts last a whole number of slots, from the first one above `min_duration`
+    all_duration = range(
+        -(-min_duration // duration_step) * duration_step, max_duration, duration_step
+    )
 
-    # Minimum Shifts: Convert to constraint format
-    if heartbeat.payload.dynamic_variables.minimum_shifts:
-        minimum_shifts_input = {
-            (c["day"], c["hour"], c["minute"]): int(c["min_shifts"])
-            for _, c in pd.read_json(
-                heartbeat.payload.dynamic_variables.minimum_shifts.json(),
-                orient="split",
-            ).iterrows()
-        }
+    # Dynamic Inputs: one value per time slot of `all_minutes`, indexed by slot
+    # number. Missing rush hours or minimum shifts inputs are all zeros
+    dynamic_variables = heartbeat.payload.dynamic_variables
+    demand_input = get_input_per_slot(
+        dynamic_variables.demand_forecast, "demand", all_minutes, required=True
+    )
+    rush_hour_input = get_input_per_slot(
+        dynamic_variables.rush_hours, "rush_hour", all_minutes, required=True
+    )
+    if dynamic_variables.market_hours:
+        market_hours_input = get_input_per_slot(
+            dynamic_variables.market_hours, "open", all_minutes, required=True
+        )
     else:
-        minimum_shifts_input = None
+        market_hours_input = None
+    minimum_shifts_input = get_input_per_slot(
+        dynamic_variables.minimum_shifts, "min_shifts", all_minutes, required=True
+    )
 
     # Fixed shifts: Convert to cosntraint format (list)
     if heartbeat.payload.dynamic_variables.fixed_shifts:
@@ -137,8 +172,61 @@ def compute_schedule(heartbeat: HeartbeatStatus, multiprocess_pipe=None):
             raise ValueError("Fixed shifts input contains errors", invalid_shifts)
         fixed_shifts_input = df_fixed_shifts.iloc[:, 1:].to_numpy()
         del df_fixed_shifts
+        fixed_shifts_list = [
+            (
+                vehicle,
+                (sday * 60 * 24) + (shour * 60) + sminute,
+                (eday * 60 * 24) + (ehour * 60) + eminute,
+            )
+            for vehicle, sday, shour, sminute, eday, ehour, eminute in fixed_shifts_input
+        ]
     else:
         fixed_shifts_input = None
+        fixed_shifts_list = []
+
+    # Vehicles without fixed shifts are interchangeable
+    pinned_vehicles = {vehicle for vehicle, _, _ in fixed_shifts_list}
+    free_vehicles = [
+        vehicle for vehicle in all_vehicles if vehicle not in pinned_vehicles
+    ]
+
+    # Everything was setup fine, remove previous solutions
+    clear_solutions_folder(heartbeat.payload.run_id)
+
+    # Initial schedule: published right away as step 0 while the model is built.
+    # It is the greedy one, unless the hint schedule is known to be feasible. It is
+    # only a hint of the search if it breaks a hard constraint (e.g. the greedy one
+    # does not enforce the minimum shifts)
+    pattern_inputs = get_pattern_inputs(heartbeat)
+    if feasible_hint:
+        initial_name = "Hint"
+        initial_shifts = get_shifts_from_schedule(
+            heartbeat.payload.hint_schedule.dict()
+        )
+    else:
+        initial_name = "Greedy"
+        initial_shifts = greedy_schedule(pattern_inputs)
+    initial_errors = validate_shifts(pattern_inputs, initial_shifts, frozen_until)
+    if initial_errors:
+        print(
+            f"The {initial_name.lower()} schedule is not feasible, only used as a hint: {initial_errors[0]}",
+            flush=True,
+        )
+    else:
+        score_real, score_constraints = evaluate_shifts(pattern_inputs, initial_shifts)
+        print(
+            f"{initial_name} solution: {score_real - score_constraints}$ ({score_real}$ from real -{score_constraints}$ from soft constraints)",
+            flush=True,
+        )
+        publish_solution(
+            heartbeat,
+            get_states_from_shifts(initial_shifts, duration_step),
+            0,
+            score_real - score_constraints,
+            score_real,
+            score_constraints,
+            multiprocess_pipe,
+        )
 
     # Define the main and auxiliary variables for the model
     heartbeat.set_stage(1)
@@ -146,22 +234,86 @@ def compute_schedule(heartbeat: HeartbeatStatus, multiprocess_pipe=None):
         multiprocess_pipe.send(heartbeat)
     print("Defining Auxiliary Variables", flush=True)
 
-    shifts_start = define_shifts_start(model, all_minutes, all_vehicles)
-    shifts_end = define_shifts_end(model, all_minutes, all_vehicles)
-    sum_of_starts = define_sum_of_starts(model, all_minutes, all_vehicles)
-    sum_of_ends = define_sum_of_ends(model, all_minutes, all_vehicles)
-    sum_equals = define_sum_of_equals(model, all_minutes, all_vehicles)
-    shifts_state = define_shift_state(model, all_minutes, all_vehicles)
+    if shift_formulation == "counts":
+        # Vehicles with fixed shifts only run those, the rest are interchangeable
+        with profiler.profile("define_shifts_count"):
+            shifts_count = define_shifts_count(
+                model,
+                all_minutes,
+                all_duration,
+                total_minutes,
+                min(max_starts_per_window, len(free_vehicles)),
+            )
+        vehicles_in_time, starts_in_time, ends_in_time = get_counts_in_time(
+            shifts_count, fixed_shifts_list, all_minutes
+        )
+    elif shift_formulation == "intervals":
+        # The shifts are optional intervals with a literal per minute of their start
+        # & end domains, the counts per timestamp are derived from those literals
+        with profiler.profile("define_shift_intervals"):
+            shift_intervals = define_shift_intervals(
+                model,
+                all_minutes,
+                all_vehicles,
+                all_duration,
+                total_minutes,
+                duration_step,
+                min_time_between_shifts,
+            )
+        with profiler.profile("define_shift_interval_literals"):
+            interval_starts, interval_ends = define_shift_interval_literals(
+                model, shift_intervals, all_minutes
+            )
+        with profiler.profile("define_interval_counts_in_time"):
+            (
+                vehicles_in_time,
+                starts_in_time,
+                ends_in_time,
+            ) = define_interval_counts_in_time(
+                model, interval_starts, interval_ends, all_minutes, num_vehicles
+            )
+        # Starts & ends of each vehicle, for the fixed shifts and `frozen_until`
+        shifts_start = get_interval_literals_in_time(
+            interval_starts, all_minutes, all_vehicles
+        )
+        shifts_end = get_interval_literals_in_time(
+            interval_ends, all_minutes, all_vehicles
+        )
+    else:
+        with profiler.profile("define_shifts_start"):
+            shifts_start = define_shifts_start(model, all_minutes, all_vehicles)
+        with profiler.profile("define_shifts_end"):
+            shifts_end = define_shifts_end(model, all_minutes, all_vehicles)
+        with profiler.profile("define_shift_state"):
+            shifts_state = define_shift_state(model, all_minutes, all_vehicles)
+        with profiler.profile("define_sum_of_starts"):
+            sum_of_starts = define_sum_of_starts(model, all_minutes, all_vehicles)
+        with profiler.profile("define_sum_of_ends"):
+            sum_of_ends = define_sum_of_ends(model, all_minutes, all_vehicles)
+        with profiler.profile("define_sum_of_equals"):
+            sum_equals = define_sum_of_equals(model, all_minutes, all_vehicles)
+        vehicles_in_time = {
+            minute: get_vehicles_in_time(shifts_state, minute, all_vehicles)
+            for minute in all_minutes
+        }
+        starts_in_time = {
+            minute: get_starts_in_time(shifts_start, minute, all_vehicles)
+            for minute in all_minutes
+        }
+        ends_in_time = {
+            minute: get_ends_in_time(shifts_end, minute, all_vehicles)
+            for minute in all_minutes
+        }
 
     # Auxiliary variable - It will be used to define the objective function
-    completion_rate = define_completion_rate(
-        model,
-        all_minutes,
-        all_vehicles,
-        num_vehicles,
-        demand_input,
-        shifts_state,
-    )
+    with profiler.profile("define_completion_rate"):
+        completion_rate = define_completion_rate(
+            model,
+            all_minutes,
+            num_vehicles,
+            demand_input,
+            vehicles_in_time,
+        )
 
     # Define the constraints
     heartbeat.set_stage(2)
@@ -173,81 +325,198 @@ def compute_schedule(heartbeat: HeartbeatStatus, multiprocess_pipe=None):
     # There must be at least one active state (i.e. one start)
     # We do this to avoid the "empty shifts case" and prevent
     # the solver from exploiting that path, making it faster to find a feasible solution.
-    model.AddAtLeastOne(shifts_start.values())
+    with profiler.profile("at_least_one_start"):
+        model.Add(cp_model.LinearExpr.Sum(list(starts_in_time.values())) >= 1)
 
     # Constraint #2
     # This is the main constraints
     # Defines how the start and end of a shift must be constructed
-    shift_start_and_end_behaviour(
-        model,
-        shifts_start,
-        shifts_end,
-        shifts_state,
-        all_minutes,
-        all_vehicles,
-        all_duration,
-        total_minutes,
-        duration_step,
-        min_time_between_shifts,
-        sum_of_starts,
-        sum_of_ends,
-        sum_equals,
-    )
+    if shift_formulation == "counts":
+        # Only the number of vehicles busy at the same time is bounded, the rosters
+        # are recovered once a solution is found
+        with profiler.profile("shift_counts_behaviour"):
+            shift_counts_behaviour(
+                model,
+                shifts_count,
+                all_minutes,
+                min_time_between_shifts,
+                len(free_vehicles),
+            )
+    elif shift_formulation == "intervals":
+        # Same behaviour modelled with optional intervals, which avoids enforcing
+        # every (start, duration) combination and keeps the model small
+        with profiler.profile("shift_intervals_behaviour"):
+            shift_intervals_behaviour(
+                model,
+                shift_intervals,
+                interval_starts,
+                interval_ends,
+                all_vehicles,
+            )
+    else:
+        with profiler.profile("shift_start_and_end_behaviour"):
+            shift_start_and_end_behaviour(
+                model,
+                shifts_start,
+                shifts_end,
+                shifts_state,
+                all_minutes,
+                all_vehicles,
+                all_duration,
+                total_minutes,
+                duration_step,
+                min_time_between_shifts,
+                sum_of_starts,
+                sum_of_ends,
+                sum_equals,
+            )
 
     # Constraint #3: Max starts & ends per time slot
-    max_start_and_end(
-        model,
-        shifts_start,
-        shifts_end,
-        all_minutes,
-        all_vehicles,
-        max_starts_per_slot,
-        max_ends_per_slot,
-    )
+    with profiler.profile("max_start_and_end"):
+        max_start_and_end(
+            model,
+            starts_in_time,
+            ends_in_time,
+            all_minutes,
+            max_starts_per_window,
+            max_ends_per_window,
+            window_slots,
+        )
 
     # Constraint #4: Minimum shifts per hour
     # This is also a soft-constraint, but if the hard-constraint is enabled the soft
     # does not play any role
-    if enable_min_shift_constraint and minimum_shifts_input:
-        min_shifts_per_hour(
+    if enable_min_shift_constraint and dynamic_variables.minimum_shifts:
+        with profiler.profile("min_shifts_per_hour"):
+            min_shifts_per_hour(
+                model,
+                vehicles_in_time,
+                minimum_shifts_input,
+                all_minutes,
+            )
+    # Define a new variable to keep track of the difference between the min_shifts and
+    # the actual vehicles. We need this to use the max() function in the solver
+    with profiler.profile("define_min_shifts_to_vehicles_difference"):
+        vehicles_to_min_shifts = define_min_shifts_to_vehicles_difference(
             model,
-            shifts_state,
+            vehicles_in_time,
             minimum_shifts_input,
-            all_vehicles,
+            num_vehicles,
             all_minutes,
-            all_duration,
         )
-    # Define a new variable to keep track of the difference between the min_shifts and
-    # the actual vehicles. We need this to use the max() function in the solver
-    vehicles_to_min_shifts = define_min_shifts_to_vehicles_difference(
-        model,
-        shifts_state,
-        minimum_shifts_input,
-        num_vehicles,
-        all_minutes,
-        all_vehicles,
-    )
 
     # Constraint #5: Do not end during rush hours
     # This is also a soft-constraint, but if the hard-constraint is enabled the soft
     # does not play any role
     if enable_rush_hour_constraint:
-        rush_hour = define_rush_hour(model, all_minutes, rush_hour_input)
-        rush_hours(model, shifts_end, rush_hour, all_vehicles, all_minutes)
+        with profiler.profile("define_rush_hour"):
+            rush_hour = define_rush_hour(model, all_minutes, rush_hour_input)
+        with profiler.profile("rush_hours"):
+            rush_hours(model, ends_in_time, rush_hour, all_minutes)
 
     # Constraint #6: No shifts during market closed hours
-    if enable_market_hour_constraint and market_hours_input:
-        market_hours(
-            model,
-            shifts_state,
-            market_hours_input,
-            all_vehicles,
-            all_minutes,
-        )
+    if enable_market_hour_constraint and market_hours_input is not None:
+        with profiler.profile("market_hours"):
+            market_hours(
+                model,
+                vehicles_in_time,
+                market_hours_input,
+                all_minutes,
+            )
 
     # Constraint #7: Fixed shifts
-    if fixed_shifts_input is not None:
-        fixed_shifts(model, shifts_start, shifts_end, fixed_shifts_input)
+    # In the counts formulation they are already part of the time aggregates
+    if fixed_shifts_input is not None and shift_formulation != "counts":
+        with profiler.profile("fixed_shifts"):
+            fixed_shifts(model, shifts_start, shifts_end, fixed_shifts_input)
+    # Before `frozen_until` the schedule is already decided by the fixed shifts
+    fixed_starts = {(vehicle, start) for vehicle, start, _ in fixed_shifts_list}
+    with profiler.profile("frozen_until"):
+        for minute in range(0, min(frozen_until, total_minutes), duration_step):
+            if shift_formulation == "counts":
+                for duration in all_duration:
+                    if (minute, duration) in shifts_count:
+                        model.Add(shifts_count[(minute, duration)] == 0)
+            else:
+                for vehicle in all_vehicles:
+                    if (vehicle, minute) not in fixed_starts:
+                        model.Add(shifts_start[(vehicle, minute)] == 0)
+
+    # Constraint #8: Symmetry breaking
+    # Interchangeable vehicles are sorted by their starts, so permutations of the
+    # same roster are not explored. The counts formulation has no such symmetry.
+    if enable_symmetry_breaking and shift_formulation == "intervals":
+        with profiler.profile("vehicles_first_start_order"):
+            vehicles_first_start_order(model, shift_intervals, free_vehicles)
+    elif enable_symmetry_breaking and shift_formulation == "states":
+        with profiler.profile("vehicles_lexicographic_order"):
+            vehicles_lexicographic_order(
+                model, shifts_start, all_minutes, free_vehicles
+            )
+
+    # Warm start from a previous schedule, or else from the greedy one. Outside of
+    # `hint_free_hours`, if provided, the schedule is fixed to the previous one
+    hint_schedule = heartbeat.payload.hint_schedule
+    hint_free_hours = heartbeat.payload.hint_free_hours
+    hint_window_hours = heartbeat.payload.hint_window_hours
+    free_minutes = None
+    window_minutes = None
+    if hint_schedule:
+        # Shifts of a schedule on a finer time grid may not fall on this one
+        hint_shifts = [
+            (vehicle, start, end)
+            for vehicle, start, end in get_shifts_from_schedule(hint_schedule.dict())
+            if vehicle < num_vehicles
+            and end < total_minutes
+            and start % duration_step == 0
+            and end % duration_step == 0
+        ]
+        if hint_free_hours:
+            free_minutes = range(hint_free_hours[0] * 60, hint_free_hours[1] * 60)
+        if hint_window_hours is not None:
+            window_minutes = hint_window_hours * 60
+    else:
+        hint_shifts = initial_shifts
+    if enable_symmetry_breaking and shift_formulation != "counts":
+        # The hint, and the vehicles it pins, must follow the symmetry breaking order
+        hint_shifts = sort_vehicles_shifts(hint_shifts, free_vehicles)
+    if hint_shifts:
+        if shift_formulation == "counts":
+            # Fixed shifts are not part of the counts
+            with profiler.profile("schedule_counts_hint"):
+                schedule_counts_hint(
+                    model,
+                    shifts_count,
+                    [shift for shift in hint_shifts if shift not in fixed_shifts_list],
+                    free_minutes,
+                    window_minutes,
+                )
+        elif shift_formulation == "intervals":
+            with profiler.profile("schedule_intervals_hint"):
+                schedule_intervals_hint(
+                    model,
+                    shift_intervals,
+                    interval_starts,
+                    interval_ends,
+                    hint_shifts,
+                    all_minutes,
+                    all_vehicles,
+                    free_minutes,
+                    window_minutes,
+                )
+        else:
+            with profiler.profile("schedule_hint"):
+                schedule_hint(
+                    model,
+                    shifts_start,
+                    shifts_end,
+                    shifts_state,
+                    hint_shifts,
+                    all_minutes,
+                    all_vehicles,
+                    free_minutes,
+                    window_minutes,
+                )
 
     # Define the optimization function
     heartbeat.set_stage(3)
@@ -255,39 +524,29 @@ def compute_schedule(heartbeat: HeartbeatStatus, multiprocess_pipe=None):
         multiprocess_pipe.send(heartbeat)
     print("Constructing Optimization Problem", flush=True)
 
-    model.Maximize(
-        define_maximization_function(
-            shifts_state,
-            completion_rate,
-            revenue_passenger,
-            cost_vehicle_per_minute,
-            rush_hour_input,
-            vehicles_to_min_shifts,
-            all_vehicles,
-            shifts_end,
-            all_minutes,
-            rush_hour_soft_constraint_cost,
-            minimum_shifts_soft_constraint_cost,
+    with profiler.profile("objective"):
+        model.Maximize(
+            define_maximization_function(
+                vehicles_in_time,
+                ends_in_time,
+                completion_rate,
+                revenue_passenger,
+                cost_vehicle_per_minute,
+                rush_hour_input,
+                vehicles_to_min_shifts,
+                all_minutes,
+                rush_hour_soft_constraint_cost,
+                minimum_shifts_soft_constraint_cost,
+            )
         )
-    )
-
-    # Everything was setup fine, remove previous solutions before starting the solver
-    for f in os.listdir("./scheduler/solutions"):
-        os.remove(f"./scheduler/solutions/{f}")
 
     # Run the scheduler
+    heartbeat.build_profile = profiler.report
     heartbeat.set_stage(4)
     if multiprocess_pipe:
         multiprocess_pipe.send(heartbeat)
     print("Finding Solutions", flush=True)
 
-    model.AddDecisionStrategy(
-        shifts_start.values(), cp_model.CHOOSE_FIRST, cp_model.SELECT_MAX_VALUE
-    )
-    model.AddDecisionStrategy(
-        shifts_end.values(), cp_model.CHOOSE_FIRST, cp_model.SELECT_MAX_VALUE
-    )
-
     solver = cp_model.CpSolver()
     solver.parameters.num_workers = (
         heartbeat.payload.num_workers
@@ -295,11 +554,55 @@ def compute_schedule(heartbeat: HeartbeatStatus, multiprocess_pipe=None):
     solver.parameters.enumerate_all_solutions = (
         False  # cannot enumerate all solutions when solving in parallel
     )
+    set_stopping_criteria(solver, heartbeat)
+    max_time_without_improvement = heartbeat.payload.max_time_without_improvement
 
     # solver callback to display and record interim solutions from the solver (on the journey to optimal solutions)
-    status = solver.Solve(
-        model,
-        SolutionCollector(
+    if shift_formulation == "counts":
+        solution_collector = ShiftCountsSolutionCollector(
+            heartbeat,
+            shifts_count,
+            fixed_shifts_list,
+            free_vehicles,
+            min_time_between_shifts,
+            completion_rate,
+            revenue_passenger,
+            cost_vehicle_per_minute,
+            rush_hour_input,
+            vehicles_to_min_shifts,
+            vehicles_in_time,
+            ends_in_time,
+            time_grid,
+            rush_hour_soft_constraint_cost,
+            minimum_shifts_soft_constraint_cost,
+            multiprocess_pipe,
+            max_time_without_improvement,
+        )
+    elif shift_formulation == "intervals":
+        solution_collector = ShiftIntervalsSolutionCollector(
+            heartbeat,
+            shift_intervals,
+            completion_rate,
+            revenue_passenger,
+            cost_vehicle_per_minute,
+            rush_hour_input,
+            vehicles_to_min_shifts,
+            vehicles_in_time,
+            ends_in_time,
+            time_grid,
+            rush_hour_soft_constraint_cost,
+            minimum_shifts_soft_constraint_cost,
+            multiprocess_pipe,
+            max_time_without_improvement,
+        )
+    else:
+        model.AddDecisionStrategy(
+            shifts_start.values(), cp_model.CHOOSE_FIRST, cp_model.SELECT_MAX_VALUE
+        )
+        model.AddDecisionStrategy(
+            shifts_end.values(), cp_model.CHOOSE_FIRST, cp_model.SELECT_MAX_VALUE
+        )
+        solution_collector = SolutionCollector(
             heartbeat,
             shifts_state,
             completion_rate,
@@ -307,22 +610,41 @@ def compute_schedule(heartbeat: HeartbeatStatus, multiprocess_pipe=None):
             cost_vehicle_per_minute,
             rush_hour_input,
             vehicles_to_min_shifts,
-            all_vehicles,
+            vehicles_in_time,
+            ends_in_time,
             shifts_start,
             shifts_end,
-            all_minutes,
+            time_grid,
             rush_hour_soft_constraint_cost,
             minimum_shifts_soft_constraint_cost,
             multiprocess_pipe,
-        ),
-    )
+            max_time_without_improvement,
+        )
+    with solution_collector.publishing(), solution_collector.watch_stop_rules():
+        status = solver.Solve(model, solution_collector)
+    set_solver_stats(heartbeat, solver, status)
 
     if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
         print(f"Maximum of objective function: {solver.ObjectiveValue()}\n", flush=True)
         sol_type = "Optimal" if status == cp_model.OPTIMAL else "Feasible"
-        heartbeat.set_stage(5, f"Scheduler finished - {sol_type} solution found.")
+        stop_reason = solution_collector.get_stop_reason(solver, status)
+        heartbeat.set_stage(
+            5, f"Scheduler finished - {sol_type} solution found{stop_reason}."
+        )
+    elif status == cp_model.UNKNOWN and not initial_errors:
+        # Stopped before improving on the initial schedule, which is kept
+        print(
+            f"No solution better than the {initial_name.lower()} schedule found.",
+            flush=True,
+        )
+        stop_reason = solution_collector.get_stop_reason(solver, status)
+        heartbeat.set_stage(
+            5, f"Scheduler finished - {initial_name} solution kept{stop_reason}."
+        )
     else:
         print("No solution found.", flush=True)
+        heartbeat.solution = None
+        heartbeat.schedule = None
         heartbeat.set_stage(5, "Scheduler finished - No solution found.")
     heartbeat.set_end_time()
     if multiprocess_pipe:
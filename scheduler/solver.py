@@ -1,98 +1,118 @@
+import json
+import sys
+import threading
 import time
+from abc import abstractmethod
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+import numpy as np
 import pandas as pd
 from ortools.sat.python import cp_model
 
-from .auxiliary import get_vehicles_in_time, get_vehicles_in_time_from_solver
-from .utils import expand_minutes_into_components
+from .utils import (
+    TimeGrid,
+    assign_shifts_to_vehicles,
+    get_input_per_slot,
+    get_solutions_folder,
+)
 
 
 def get_solution_from_states_df(df: pd.DataFrame, heartbeat):
-    df = df.sort_values(["day", "hour", "minute"]).reset_index(drop=True)
-    df["time"] = (
-        df["day"].astype(str)
-        + "-"
-        + df["hour"].astype(str)
-        + "-"
-        + df["minute"].astype(str)
+    """Aggregates the states of a solution per time slot of the run grid, next to the
+    demand and minimum shifts inputs resampled onto that grid"""
+    time_grid = TimeGrid.from_static_variables(heartbeat.payload.static_variables)
+    df = df.assign(
+        slot=time_grid.get_slots(
+            df["day"].to_numpy() * 60 * 24
+            + df["hour"].to_numpy() * 60
+            + df["minute"].to_numpy()
+        )
     )
     # Compute aggregations over time
-    df = df.groupby("time")[["vehicle", "start", "end"]].agg(
+    df = df.groupby("slot")[["vehicle", "start", "end"]].agg(
         {"vehicle": "size", "start": "sum", "end": "sum"}
     )
     df.columns = ["vehicles", "starts", "ends"]
-    df = df.reset_index()
-
-    demand = pd.read_json(
-        heartbeat.payload.dynamic_variables.demand_forecast.json(), orient="split"
-    )
-    demand["time"] = (
-        demand["day"].astype(str)
+    slots = df.index.to_numpy()
+    days, hours, minutes = time_grid.components[slots].T
+    df = df.reset_index(drop=True)
+    df.insert(
+        0,
+        "time",
+        pd.Series(days).astype(str)
         + "-"
-        + demand["hour"].astype(str)
+        + pd.Series(hours).astype(str)
         + "-"
-        + demand["minute"].astype(str)
+        + pd.Series(minutes).astype(str),
     )
+    df["day"] = days
+    df["hour"] = hours
+    df["minute"] = minutes
 
-    if heartbeat.payload.dynamic_variables.minimum_shifts:
-        min_shifts = pd.read_json(
-            heartbeat.payload.dynamic_variables.minimum_shifts.json(), orient="split"
-        )
-        min_shifts["time"] = (
-            min_shifts["day"].astype(str)
-            + "-"
-            + min_shifts["hour"].astype(str)
-            + "-"
-            + min_shifts["minute"].astype(str)
-        )
-        min_shifts = min_shifts.drop(columns=["day", "hour", "minute"])
-
-    return (
-        df.merge(demand, on="time")
-        .merge(min_shifts, on="time")
-        .sort_values(["day", "hour", "minute"])
-        .reset_index(drop=True)
-    )
+    dynamic_variables = heartbeat.payload.dynamic_variables
+    df["demand"] = get_input_per_slot(
+        dynamic_variables.demand_forecast, "demand", time_grid.all_minutes
+    )[slots]
+    if dynamic_variables.minimum_shifts:
+        df["min_shifts"] = get_input_per_slot(
+            dynamic_variables.minimum_shifts, "min_shifts", time_grid.all_minutes
+        )[slots]
+    return df
 
 
 def get_schedule_from_states_df(df):
     df = df.sort_values(["vehicle", "day", "hour", "minute"]).reset_index(drop=True)
-    # Need to add 1 to the days to make them a valid datetime.
-    # We want this to correctly plot a Gantt chart
-    df["day"] = df["day"] + 1
-
-    df["time"] = pd.to_datetime(
-        df["day"].astype(str)
-        + "-"
-        + df["hour"].astype(str)
-        + "-"
-        + df["minute"].astype(str),
-        format="%d-%H-%M",
-    )
 
     # We are only interested in rows with a start or an end
     df = df[(df["start"] == 1) | (df["end"] == 1)]
 
     # Gantt chart: vehicle start times and duration (based on optimal schedules)
-    # We have start-end in row pairs, so traverse the DF in pairs and set the start/end
-    gantt = []
-    for i in range(0, len(df), 2):
-        start_row = df.iloc[i]
-        end_row = df.iloc[i + 1]
-        gantt.append([start_row["vehicle"], start_row["time"], end_row["time"]])
-    schedule_df = pd.DataFrame(gantt, columns=["vehicle", "start_time", "end_time"])
+    # We have start-end in row pairs, so the even rows are the starts and the odd
+    # rows the ends. Times are valid datetimes to correctly plot a Gantt chart
+    times = TimeGrid.get_datetimes(
+        (df["day"] * 60 * 24 + df["hour"] * 60 + df["minute"]).to_numpy()
+    )
+    schedule_df = pd.DataFrame(
+        {
+            "vehicle": df["vehicle"].to_numpy()[0::2],
+            "start_time": times[0::2],
+            "end_time": times[1::2],
+        }
+    )
 
     return schedule_df.to_dict(orient="split")
 
 
+def get_shifts_from_schedule(schedule):
+    """Inverse of `get_schedule_from_states_df`. Returns the (vehicle, start, end)
+    shifts, in minutes, of a schedule in split format"""
+    df = pd.DataFrame(schedule["data"], columns=schedule["columns"])
+
+    def _to_minutes(times):
+        return pd.Series(TimeGrid.get_minutes(times))
+
+    return list(
+        zip(
+            df["vehicle"].astype(int).tolist(),
+            _to_minutes(df["start_time"]).tolist(),
+            _to_minutes(df["end_time"]).tolist(),
+        )
+    )
+
+
 def define_maximization_function(
-    shifts_state,
+    vehicles_in_time,
+    ends_in_time,
     completion_rate,
     revenue_passenger,
     cost_vehicle_per_minute,
     rush_hour_input,
     vehicles_to_min_shifts,
-    all_vehicles,
-    shifts_end,
     all_minutes,
     rush_hour_soft_constraint_cost,
     minimum_shifts_soft_constraint_cost,
@@ -101,22 +121,11 @@ def define_maximization_function(
     We are trying to maximize net revenue (passenger_revenue - vehicle_cost).
     Additionally, we include soft constraints as an additional cost."""
 
-    def _define_rush_hour_soft_constraint(minute):
+    def _define_rush_hour_soft_constraint(slot, minute):
         """If in rush hour -> #_of_ends * rush_hour_cost else 0"""
-        day, hour, r_minutes = expand_minutes_into_components(minute)
         return (
-            cp_model.LinearExpr.Sum(
-                [
-                    shifts_end[
-                        (
-                            driver,
-                            minute,
-                        )
-                    ]
-                    for driver in all_vehicles
-                ]
-            )
-            * rush_hour_input[(day, hour, r_minutes)]
+            ends_in_time[minute]
+            * int(rush_hour_input[slot])
             * rush_hour_soft_constraint_cost
         )
 
@@ -128,26 +137,24 @@ def define_maximization_function(
         [
             (
                 completion_rate[minute] * revenue_passenger
-                - get_vehicles_in_time(shifts_state, minute, all_vehicles)
-                * cost_vehicle_per_minute
+                - vehicles_in_time[minute] * cost_vehicle_per_minute
             )
-            - _define_rush_hour_soft_constraint(minute)
+            - _define_rush_hour_soft_constraint(slot, minute)
             - _define_minimum_shifts_soft_constraint(minute)
-            for minute in all_minutes
+            for slot, minute in enumerate(all_minutes)
         ]
     )
 
 
 def compute_maximization_function_components(
     solver: cp_model.CpSolverSolutionCallback,
-    shifts_state,
+    vehicles_in_time,
+    ends_in_time,
     completion_rate,
     revenue_passenger,
     cost_vehicle_per_minute,
     rush_hour_input,
     vehicles_to_min_shifts,
-    all_vehicles,
-    shifts_end,
     all_minutes,
     rush_hour_soft_constraint_cost,
     minimum_shifts_soft_constraint_cost,
@@ -162,21 +169,15 @@ def compute_maximization_function_components(
     real_part = sum(
         (
             solver.Value(completion_rate[minute]) * revenue_passenger
-            - (
-                get_vehicles_in_time_from_solver(
-                    solver, shifts_state, minute, all_vehicles
-                )
-                * cost_vehicle_per_minute
-            )
+            - solver.Value(vehicles_in_time[minute]) * cost_vehicle_per_minute
         )
         for minute in all_minutes
     )
 
-    def _define_rush_hours_soft(minute):
-        day, hour, r_minutes = expand_minutes_into_components(minute)
+    def _define_rush_hours_soft(slot, minute):
         return (
-            sum(solver.Value(shifts_end[driver, minute]) for driver in all_vehicles)
-            * rush_hour_input[(day, hour, r_minutes)]
+            solver.Value(ends_in_time[minute])
+            * int(rush_hour_input[slot])
             * rush_hour_soft_constraint_cost
         )
 
@@ -187,14 +188,380 @@ def compute_maximization_function_components(
         )
 
     soft_constraints = sum(
-        _define_rush_hours_soft(minute) + _define_minimum_shifts_soft(minute)
-        for minute in all_minutes
+        _define_rush_hours_soft(slot, minute) + _define_minimum_shifts_soft(minute)
+        for slot, minute in enumerate(all_minutes)
     )
 
     return real_part, soft_constraints
 
 
-class SolutionCollector(cp_model.CpSolverSolutionCallback):
+def get_states_from_shifts(shifts, duration_step):
+    """Expands a list of (vehicle, start, end) shifts into an array of state rows
+    `[day, hour, minute, vehicle, start, end]`, one per active time slot"""
+    shifts = np.array(shifts, dtype=np.int64).reshape(-1, 3)
+    vehicles, starts, ends = shifts.T
+    num_slots = (ends - starts) // duration_step + 1
+    # Slot of every state inside of its shift
+    first_states = np.repeat(np.cumsum(num_slots) - num_slots, num_slots)
+    shift_slots = np.arange(num_slots.sum()) - first_states
+    minutes = np.repeat(starts, num_slots) + shift_slots * duration_step
+    return np.column_stack(
+        (
+            TimeGrid.get_components(minutes),
+            np.repeat(vehicles, num_slots),
+            shift_slots == 0,
+            minutes == np.repeat(ends, num_slots),
+        )
+    ).astype(np.int64)
+
+
+def publish_solution(
+    heartbeat,
+    shifts_state_values,
+    solution_count,
+    current_score,
+    score_real,
+    score_constraints,
+    multiprocess_pipe,
+):
+    """Stores a new best solution, given as `[day, hour, minute, vehicle, start, end]`
+    rows, inside the heartbeat and the `solutions` folder of the run and sends the
+    heartbeat through the multiprocess pipe if any"""
+    solutions_folder = get_solutions_folder(heartbeat.payload.run_id)
+    df = pd.DataFrame(
+        shifts_state_values,
+        columns=[
+            "day",
+            "hour",
+            "minute",
+            "vehicle",
+            "start",
+            "end",
+        ],
+    )
+    df.to_csv(
+        f"{solutions_folder}/best_solution_{solution_count}.csv",
+        index=False,
+    )
+
+    solution_df = get_solution_from_states_df(df, heartbeat)
+    heartbeat.solution = solution_df.to_dict(orient="split")
+    heartbeat.schedule = get_schedule_from_states_df(df)
+
+    heartbeat.total_score = current_score
+    heartbeat.score_real = score_real
+    heartbeat.score_constraints = -score_constraints
+    heartbeat.scores_over_time.append((score_real, score_constraints))
+    heartbeat.step = solution_count
+
+    # If we have a multiprocess pipe, send the heartbeat through it
+    if multiprocess_pipe:
+        multiprocess_pipe.send_solution(heartbeat, df.values)
+
+    # Store the solution in front format for ease of debugging
+    solution_df.to_csv(
+        f"{solutions_folder}/best_solution_front_format.csv", index=False
+    )
+
+
+def evaluate_schedule(
+    vehicles_per_slot,
+    ends_per_slot,
+    demand,
+    rush_hour,
+    minimum_shifts,
+    revenue_passenger,
+    cost_vehicle_per_minute,
+    rush_hour_soft_constraint_cost,
+    minimum_shifts_soft_constraint_cost,
+):
+    """NumPy version of `compute_maximization_function_components`.
+    Given the number of active vehicles and ends per time slot, returns the real
+    revenue from operations and the cost added by unmeet soft constraints"""
+    real_part = (
+        np.minimum(demand, vehicles_per_slot) * revenue_passenger
+        - vehicles_per_slot * cost_vehicle_per_minute
+    ).sum()
+    soft_constraints = (
+        ends_per_slot * rush_hour * rush_hour_soft_constraint_cost
+    ).sum() + (
+        np.maximum(minimum_shifts - vehicles_per_slot, 0)
+        * minimum_shifts_soft_constraint_cost
+    ).sum()
+    return int(real_part), int(soft_constraints)
+
+
+class LinearExpressionsEvaluator:
+    """Evaluates many variables or linear expressions of the model at once, as a
+    sparse product with the whole solution array, instead of one `Value` call (and
+    Python to C++ crossing) per variable"""
+
+    def __init__(self, expressions):
+        rows, columns, coefficients = [], [], []
+        self.constants = np.zeros(len(expressions), dtype=np.int64)
+        for row, expression in enumerate(expressions):
+            if isinstance(expression, int):
+                self.constants[row] = expression
+                continue
+            variables, constant = expression.GetIntegerVarValueMap()
+            self.constants[row] = constant
+            for variable, coefficient in variables.items():
+                rows.append(row)
+                columns.append(variable.Index())
+                coefficients.append(coefficient)
+        self.rows = np.array(rows, dtype=np.int64)
+        self.columns = np.array(columns, dtype=np.int64)
+        self.coefficients = np.array(coefficients, dtype=np.int64)
+
+    def evaluate(self, solution):
+        """Returns the value of every expression given the values of all the model
+        variables, as returned by `StoppableSolutionCollector.get_solution_values`"""
+        values = np.zeros(len(self.constants), dtype=np.int64)
+        np.add.at(values, self.rows, self.coefficients * solution[self.columns])
+        return values + self.constants
+
+
+# Seconds between two checks of the `max_time_without_improvement` and cancel rules
+STOP_CHECK_INTERVAL = 0.5
+
+# Set to cancel the run of the current process: the searches stop as if their time
+# limit was reached and keep their best solution. Only one run is active per process
+cancel_event = threading.Event()
+
+
+def set_stopping_criteria(solver: cp_model.CpSolver, heartbeat):
+    """Sets the wall time and relative gap limits of the run, if any. The wall time
+    limit counts from the start of the run, so it includes the model building"""
+    payload = heartbeat.payload
+    if payload.max_time_in_seconds is not None:
+        solver.parameters.max_time_in_seconds = max(
+            payload.max_time_in_seconds - heartbeat.get_elapsed_seconds(), 0
+        )
+    if payload.relative_gap_limit is not None:
+        solver.parameters.relative_gap_limit = payload.relative_gap_limit
+
+
+def get_peak_rss_mb():
+    """Returns the peak resident set size of the process in MB, None if unknown"""
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # In bytes on macOS and in kilobytes on Linux
+    return round(peak_rss / (2**20 if sys.platform == "darwin" else 2**10), 1)
+
+
+class ModelBuildProfiler:
+    """Records the wall time, the peak RSS of the process and the number of variables
+    and constraints added to the model by each model builder:
+
+        with profiler.profile("market_hours"):
+            market_hours(model, ...)
+
+    Every entry is printed as a JSON line, and the `report` of the run is stored in
+    the heartbeat `build_profile`"""
+
+    def __init__(self, model: cp_model.CpModel):
+        self.__proto = model.Proto()
+        self.report = []
+
+    @contextmanager
+    def profile(self, builder: str):
+        num_variables = len(self.__proto.variables)
+        num_constraints = len(self.__proto.constraints)
+        start_time = time.perf_counter()
+        yield
+        entry = dict(
+            builder=builder,
+            wall_time=round(time.perf_counter() - start_time, 3),
+            peak_rss_mb=get_peak_rss_mb(),
+            variables=len(self.__proto.variables) - num_variables,
+            constraints=len(self.__proto.constraints) - num_constraints,
+        )
+        self.report.append(entry)
+        print(json.dumps({"event": "model_build", **entry}), flush=True)
+
+
+def set_solver_stats(heartbeat, solver: cp_model.CpSolver, status):
+    """Records the bound and statistics of a finished search in the heartbeat, so
+    they are published with the final stage, also when the run was cancelled"""
+    heartbeat.best_bound = solver.BestObjectiveBound()
+    heartbeat.solver_stats = dict(
+        status=solver.StatusName(status),
+        objective=solver.ObjectiveValue(),
+        wall_time=solver.WallTime(),
+        num_conflicts=solver.NumConflicts(),
+        num_branches=solver.NumBranches(),
+    )
+
+
+class SolutionPublisher:
+    """Publishes solutions from a background thread, so the solver callback never
+    waits on pandas, the disk or the multiprocess pipe. It works as a queue of size
+    one: a solution submitted while the previous one is still being published
+    replaces the pending one, as only the latest solution is worth publishing."""
+
+    def __init__(self, publish):
+        self.__publish = publish
+        self.__pending = None
+        self.__closed = False
+        self.__error = None
+        self.__condition = threading.Condition()
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+
+    def __enter__(self):
+        self.__thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def submit(self, *args):
+        """Queues the arguments of a `publish` call, replacing the pending one if any"""
+        with self.__condition:
+            self.__pending = args
+            self.__condition.notify()
+
+    def close(self):
+        """Waits for the pending solution to be published and stops the thread.
+        Errors raised while publishing are raised again here"""
+        with self.__condition:
+            self.__closed = True
+            self.__condition.notify()
+        self.__thread.join()
+        if self.__error is not None:
+            raise self.__error
+
+    def __run(self):
+        while True:
+            with self.__condition:
+                while self.__pending is None and not self.__closed:
+                    self.__condition.wait()
+                if self.__pending is None:
+                    return
+                args, self.__pending = self.__pending, None
+            if self.__error is not None:
+                continue
+            try:
+                self.__publish(*args)
+            except Exception as e:
+                self.__error = e
+
+
+class StoppableSolutionCollector(cp_model.CpSolverSolutionCallback):
+    """Solution callback tracking the time of the last improving solution, so the
+    search can be stopped after `max_time_without_improvement` seconds without one,
+    or when the run is cancelled.
+
+    Solutions are published with `submit_solution`. Inside of the `publishing`
+    context that is done by a `SolutionPublisher` thread, so subclasses implement
+    `_publish` and the callback itself only copies the solution values."""
+
+    def __init__(self, max_time_without_improvement=None):
+        # The pybind11 base class can't use `ABCMeta`, the check is done here instead
+        if getattr(self._publish, "__isabstractmethod__", False):
+            raise TypeError(
+                f"Can't instantiate {type(self).__name__} without a `_publish` method"
+            )
+        cp_model.CpSolverSolutionCallback.__init__(self)
+        self.max_time_without_improvement = max_time_without_improvement
+        self.last_improvement_time = None
+        self.stopped_on_stagnation = False
+        self.stopped_on_cancel = False
+        self.__publisher = None
+
+    def register_improvement(self):
+        self.last_improvement_time = time.time()
+
+    @abstractmethod
+    def _publish(self, solution, solution_count, current_score, current_time):
+        """Publishes a solution submitted with `submit_solution`: `solution` holds the
+        values returned by `get_solution_values`, `current_score` its objective and
+        `current_time` the seconds since the search started. Called from the publisher
+        thread inside of the `publishing` context, so it must not use the callback
+        solution getters"""
+        raise NotImplementedError()
+
+    def submit_solution(self, *args):
+        """Publishes a solution with `_publish`, from the publisher thread if any"""
+        if self.__publisher is None:
+            self._publish(*args)
+        else:
+            self.__publisher.submit(*args)
+
+    @contextmanager
+    def publishing(self):
+        """Publishes the solutions submitted inside of the context from a background
+        thread. On exit, it waits for the latest solution to be published"""
+        with SolutionPublisher(self._publish) as publisher:
+            self.__publisher = publisher
+            try:
+                yield
+            finally:
+                self.__publisher = None
+
+    def get_solution_values(self):
+        """Returns the values of all the model variables in the current solution,
+        fetched at once. Indexed by the variables `Index()`"""
+        return np.array(self.Response().solution, dtype=np.int64)
+
+    @contextmanager
+    def watch_stop_rules(self):
+        """Stops the search running inside of the context once the run is cancelled
+        with `cancel_event`, or once the best solution has not improved in
+        `max_time_without_improvement` seconds. The solver only calls back on new
+        solutions, so the rules are checked from a background thread. The stagnation
+        rule does not stop anything before the first solution is found."""
+        finished = threading.Event()
+
+        def _watch():
+            while not finished.wait(STOP_CHECK_INTERVAL):
+                if cancel_event.is_set():
+                    print("Run cancelled, stopping the search", flush=True)
+                    self.stopped_on_cancel = True
+                    self.StopSearch()
+                    return
+                if (
+                    self.max_time_without_improvement is not None
+                    and self.last_improvement_time is not None
+                    and time.time() - self.last_improvement_time
+                    >= self.max_time_without_improvement
+                ):
+                    print(
+                        f"No improvement in {self.max_time_without_improvement} seconds, stopping the search",
+                        flush=True,
+                    )
+                    self.stopped_on_stagnation = True
+                    self.StopSearch()
+                    return
+
+        watcher = threading.Thread(target=_watch, daemon=True)
+        watcher.start()
+        try:
+            yield
+        finally:
+            finished.set()
+            watcher.join()
+
+    def get_stop_reason(self, solver: cp_model.CpSolver, status):
+        """Returns why a search finished before proving optimality, to be added to
+        the final stage message"""
+        if self.stopped_on_cancel:
+            return " (cancelled)"
+        if self.stopped_on_stagnation:
+            return f" (no improvement in {self.max_time_without_improvement} seconds)"
+        if status in (
+            cp_model.FEASIBLE,
+            cp_model.UNKNOWN,
+        ) and solver.parameters.HasField("max_time_in_seconds"):
+            return " (time limit reached)"
+        if status == cp_model.OPTIMAL and solver.parameters.HasField(
+            "relative_gap_limit"
+        ):
+            return " (within the relative gap limit)"
+        return ""
+
+
+class SolutionCollector(StoppableSolutionCollector):
     # Class to print all solutions found
     def __init__(
         self,
@@ -205,26 +572,20 @@ class SolutionCollector(cp_model.CpSolverSolutionCallback):
         cost_vehicle_per_minute,
         rush_hour_input,
         vehicles_to_min_shifts,
-        all_vehicles,
+        vehicles_in_time,
+        ends_in_time,
         shifts_start,
         shifts_end,
-        all_minutes,
+        time_grid,
         rush_hour_soft_constraint_cost,
         minimum_shifts_soft_constraint_cost,
         multiprocess_pipe,
+        max_time_without_improvement=None,
     ):
-        cp_model.CpSolverSolutionCallback.__init__(self)
+        StoppableSolutionCollector.__init__(self, max_time_without_improvement)
         self.__heartbeat = heartbeat
-        self.__shifts_state = shifts_state
-        self.__completion_rate = completion_rate
         self.__revenue_passenger = revenue_passenger
         self.__cost_vehicle_per_minute = cost_vehicle_per_minute
-        self.__rush_hour_input = rush_hour_input
-        self.__vehicles_to_min_shifts = vehicles_to_min_shifts
-        self.__all_vehicles = all_vehicles
-        self.__shifts_start = shifts_start
-        self.__shifts_end = shifts_end
-        self.__all_minutes = all_minutes
         self.__rush_hour_soft_constraint_cost = rush_hour_soft_constraint_cost
         self.__minimum_shifts_soft_constraint_cost = minimum_shifts_soft_constraint_cost
         self.__solution_count = 0
@@ -232,86 +593,224 @@ class SolutionCollector(cp_model.CpSolverSolutionCallback):
         self.__best_solution = -1e6
         self.__multiprocess_pipe = multiprocess_pipe
 
+        # Everything read from a solution is precomputed as index arrays, so each
+        # solution is fetched with a single call and scored with array operations
+        all_minutes = time_grid.all_minutes
+        self.__score_terms = LinearExpressionsEvaluator(
+            [vehicles_in_time[minute] for minute in all_minutes]
+            + [ends_in_time[minute] for minute in all_minutes]
+            + [completion_rate[minute] for minute in all_minutes]
+            + [vehicles_to_min_shifts[minute] for minute in all_minutes]
+        )
+        self.__rush_hour = np.asarray(rush_hour_input)
+        if shifts_state is not None:
+            state_keys = list(shifts_state)
+            self.__states = LinearExpressionsEvaluator(list(shifts_state.values()))
+            self.__starts = LinearExpressionsEvaluator(
+                [shifts_start[vehicle, minute] for minute, vehicle in state_keys]
+            )
+            self.__ends = LinearExpressionsEvaluator(
+                [shifts_end[vehicle, minute] for minute, vehicle in state_keys]
+            )
+            # `[day, hour, minute, vehicle]` of every state
+            state_minutes, state_vehicles = (
+                np.array(state_keys, dtype=np.int64).reshape(-1, 2).T
+            )
+            self.__state_rows = np.column_stack(
+                (
+                    time_grid.components[time_grid.get_slots(state_minutes)],
+                    state_vehicles,
+                )
+            )
+
     def on_solution_callback(self):
         self.__solution_count += 1
         current_score = int(self.ObjectiveValue())
 
         if current_score > self.__best_solution:
-            current_time = round(time.time() - self.__start_time, 2)
-            # Get the real and soft_constraints score components.
-            score_real, score_constraints = compute_maximization_function_components(
-                self,
-                self.__shifts_state,
-                self.__completion_rate,
-                self.__revenue_passenger,
-                self.__cost_vehicle_per_minute,
-                self.__rush_hour_input,
-                self.__vehicles_to_min_shifts,
-                self.__all_vehicles,
-                self.__shifts_end,
-                self.__all_minutes,
-                self.__rush_hour_soft_constraint_cost,
-                self.__minimum_shifts_soft_constraint_cost,
-            )
-            print(
-                f"Solution found: {self.__solution_count} - {current_score}$ ({score_real}$ from real -{score_constraints}$ from soft constraints) - {current_time} seconds",
-                flush=True,
+            self.register_improvement()
+            self.submit_solution(
+                self.get_solution_values(),
+                self.__solution_count,
+                current_score,
+                round(time.time() - self.__start_time, 2),
             )
 
-            shifts_state_values = []
-            for k, v in self.__shifts_state.items():
-                if self.Value(v) == 1:
-                    day, hour, r_minutes = expand_minutes_into_components(
-                        k[0],
-                    )
+        print()
 
-                    shifts_state_values.append(
-                        [
-                            day,
-                            hour,
-                            r_minutes,
-                            k[1],
-                            self.Value(self.__shifts_start[k[1], k[0]]),
-                            self.Value(self.__shifts_end[k[1], k[0]]),
-                        ]
-                    )
-            # Ward against empty solutions (which are possible if not constrainted)
-            if not shifts_state_values:
-                return
-            df = pd.DataFrame(
-                shifts_state_values,
-                columns=[
-                    "day",
-                    "hour",
-                    "minute",
-                    "vehicle",
-                    "start",
-                    "end",
-                ],
-            )
-            df.to_csv(
-                f"./scheduler/solutions/best_solution_{self.__solution_count}.csv",
-                index=False,
-            )
+    def _publish(self, solution, solution_count, current_score, current_time):
+        # Get the real and soft_constraints score components.
+        (
+            vehicles,
+            ends,
+            completion,
+            vehicles_to_min_shifts,
+        ) = self.__score_terms.evaluate(solution).reshape(4, -1)
+        score_real = int(
+            completion.sum() * self.__revenue_passenger
+            - vehicles.sum() * self.__cost_vehicle_per_minute
+        )
+        score_constraints = int(
+            (ends * self.__rush_hour).sum() * self.__rush_hour_soft_constraint_cost
+            + vehicles_to_min_shifts.sum() * self.__minimum_shifts_soft_constraint_cost
+        )
+        print(
+            f"Solution found: {solution_count} - {current_score}$ ({score_real}$ from real -{score_constraints}$ from soft constraints) - {current_time} seconds",
+            flush=True,
+        )
+
+        shifts_state_values = self._get_shifts_state_values(solution)
+        # Ward against empty solutions (which are possible if not constrainted)
+        if not len(shifts_state_values):
+            return
+        publish_solution(
+            self.__heartbeat,
+            shifts_state_values,
+            solution_count,
+            current_score,
+            score_real,
+            score_constraints,
+            self.__multiprocess_pipe,
+        )
 
-            self.__heartbeat.solution = get_solution_from_states_df(
-                df, self.__heartbeat
-            ).to_dict(orient="split")
-            self.__heartbeat.schedule = get_schedule_from_states_df(df)
+    def _get_shifts_state_values(self, solution):
+        """Returns the active time slots of the given solution as
+        `[day, hour, minute, vehicle, start, end]` rows"""
+        active = self.__states.evaluate(solution) == 1
+        return np.column_stack(
+            (
+                self.__state_rows[active],
+                self.__starts.evaluate(solution)[active],
+                self.__ends.evaluate(solution)[active],
+            )
+        )
 
-            self.__heartbeat.total_score = current_score
-            self.__heartbeat.score_real = score_real
-            self.__heartbeat.score_constraints = -score_constraints
-            self.__heartbeat.scores_over_time.append((score_real, score_constraints))
-            self.__heartbeat.step = self.__solution_count
 
-            # If we have a multiprocess pipe, send the heartbeat through it
-            if self.__multiprocess_pipe:
-                self.__multiprocess_pipe.send(self.__heartbeat)
+class ShiftCountsSolutionCollector(SolutionCollector):
+    """Solution collector for the counts formulation.
+    The solver only decides how many shifts start at each minute with each duration,
+    the per vehicle rosters are built with a greedy assignment."""
 
-            # Store the solution in front format for ease of debugging
-            get_solution_from_states_df(df, self.__heartbeat).to_csv(
-                "./scheduler/solutions/best_solution_front_format.csv", index=False
+    def __init__(
+        self,
+        heartbeat,
+        shifts_count,
+        fixed_shifts_list,
+        free_vehicles,
+        min_time_between_shifts,
+        completion_rate,
+        revenue_passenger,
+        cost_vehicle_per_minute,
+        rush_hour_input,
+        vehicles_to_min_shifts,
+        vehicles_in_time,
+        ends_in_time,
+        time_grid,
+        rush_hour_soft_constraint_cost,
+        minimum_shifts_soft_constraint_cost,
+        multiprocess_pipe,
+        max_time_without_improvement=None,
+    ):
+        SolutionCollector.__init__(
+            self,
+            heartbeat,
+            None,
+            completion_rate,
+            revenue_passenger,
+            cost_vehicle_per_minute,
+            rush_hour_input,
+            vehicles_to_min_shifts,
+            vehicles_in_time,
+            ends_in_time,
+            None,
+            None,
+            time_grid,
+            rush_hour_soft_constraint_cost,
+            minimum_shifts_soft_constraint_cost,
+            multiprocess_pipe,
+            max_time_without_improvement,
+        )
+        self.__counts = LinearExpressionsEvaluator(list(shifts_count.values()))
+        self.__count_starts = np.array([start for start, _ in shifts_count])
+        self.__count_ends = np.array(
+            [start + duration for start, duration in shifts_count]
+        )
+        self.__fixed_shifts_list = fixed_shifts_list
+        self.__free_vehicles = free_vehicles
+        self.__rest_time = max(min_time_between_shifts, time_grid.step)
+        self.__duration_step = time_grid.step
+
+    def _get_shifts_state_values(self, solution):
+        counts = self.__counts.evaluate(solution)
+        shifts = list(
+            zip(
+                np.repeat(self.__count_starts, counts).tolist(),
+                np.repeat(self.__count_ends, counts).tolist(),
             )
+        )
+        assigned_shifts = assign_shifts_to_vehicles(
+            shifts, self.__free_vehicles, self.__rest_time
+        )
+        return get_states_from_shifts(
+            list(self.__fixed_shifts_list) + assigned_shifts, self.__duration_step
+        )
 
-        print()
+
+class ShiftIntervalsSolutionCollector(SolutionCollector):
+    """Solution collector for the intervals formulation.
+    The rosters are read from the present shift intervals of every vehicle, as
+    there is no per minute state."""
+
+    def __init__(
+        self,
+        heartbeat,
+        shift_intervals,
+        completion_rate,
+        revenue_passenger,
+        cost_vehicle_per_minute,
+        rush_hour_input,
+        vehicles_to_min_shifts,
+        vehicles_in_time,
+        ends_in_time,
+        time_grid,
+        rush_hour_soft_constraint_cost,
+        minimum_shifts_soft_constraint_cost,
+        multiprocess_pipe,
+        max_time_without_improvement=None,
+    ):
+        SolutionCollector.__init__(
+            self,
+            heartbeat,
+            None,
+            completion_rate,
+            revenue_passenger,
+            cost_vehicle_per_minute,
+            rush_hour_input,
+            vehicles_to_min_shifts,
+            vehicles_in_time,
+            ends_in_time,
+            None,
+            None,
+            time_grid,
+            rush_hour_soft_constraint_cost,
+            minimum_shifts_soft_constraint_cost,
+            multiprocess_pipe,
+            max_time_without_improvement,
+        )
+        self.__vehicles = np.array([vehicle for vehicle, _ in shift_intervals])
+        self.__intervals = LinearExpressionsEvaluator(
+            [is_present for is_present, *_ in shift_intervals.values()]
+            + [start for _, start, _, _, _ in shift_intervals.values()]
+            + [end for _, _, _, end, _ in shift_intervals.values()]
+        )
+        self.__duration_step = time_grid.step
+
+    def _get_shifts_state_values(self, solution):
+        is_present, starts, ends = self.__intervals.evaluate(solution).reshape(3, -1)
+        present = is_present == 1
+        return get_states_from_shifts(
+            np.column_stack(
+                (self.__vehicles[present], starts[present], ends[present])
+            ),
+            self.__duration_step,
+        )
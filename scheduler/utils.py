@@ -1,6 +1,10 @@
 """Non OrTools related auxiliary functions"""
+import os
 import time
+import heapq
+from fractions import Fraction
 from typing import List
+import numpy as np
 import pandas as pd
 
 
@@ -9,6 +13,25 @@ def get_current_time():
     return time.strftime("%H:%M:%S", t)
 
 
+def get_solutions_folder(run_id: str) -> str:
+    """Returns the folder of the solutions of a run, creating it if needed. Each run
+    has its own, so concurrent runs don't overwrite each other's solutions"""
+    folder = f"./scheduler/solutions/{run_id}"
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def clear_solutions_folder(run_id: str):
+    """Removes the previous solutions of the run. Files already removed by a
+    concurrent window of the same run are ignored"""
+    folder = get_solutions_folder(run_id)
+    for f in os.listdir(folder):
+        try:
+            os.remove(f"{folder}/{f}")
+        except FileNotFoundError:
+            pass
+
+
 def validate_fixed_shifts_input(
     df: pd.DataFrame,
     duration_step: int,
@@ -50,6 +73,14 @@ def validate_fixed_shifts_input(
                     "Shift duration is out of min/max provided bounds.",
                 )
             )
+        on_grid = (shift_start % duration_step == 0) & (shift_end % duration_step == 0)
+        if not on_grid.all():
+            invalid_shifts.append(
+                (
+                    f"shift_id: {shift_id}",
+                    f"Shift start or end is not on a {duration_step} minutes time tick.",
+                )
+            )
 
     return invalid_shifts
 
@@ -63,6 +94,206 @@ def validate_fixed_shifts_input(
         )
 
 
+# How the rows of each dynamic input falling into the same time slot are combined
+# when the input is coarser than the grid. Hard limits keep their strictest value.
+INPUT_AGGREGATIONS = {
+    "demand": "mean",
+    "min_shifts": "max",
+    "rush_hour": "max",
+    "open": "min",
+}
+
+
+def get_input_per_slot(
+    vector_dataframe, column, all_minutes, fill_value=0, required=False, how=None
+):
+    """Converts a `VectorDataFrame` input into an array with one value per time slot
+    of `all_minutes`, indexed by slot number, straight from its `data` rows. Slots
+    missing from the input get `fill_value`, or raise a `ValueError` if `required`.
+
+    The input is resampled onto the grid: each row covers the minutes up to the next
+    tick of the input resolution, and the rows covering a slot are combined with
+    `how` ("mean", "max" or "min", `INPUT_AGGREGATIONS[column]` by default). A coarser
+    input is therefore repeated over the finer slots it covers. An input without a
+    `day` column is a daily profile, repeated on every day of the grid."""
+    values = np.full(len(all_minutes), fill_value, dtype=int)
+    if vector_dataframe is None:
+        return values
+
+    columns = vector_dataframe.columns
+    data = np.asarray(vector_dataframe.data, dtype=np.int64).reshape(-1, len(columns))
+    minutes = data[:, columns.index("hour")] * 60 + data[:, columns.index("minute")]
+    rows = data[:, columns.index(column)]
+    if "day" in columns:
+        minutes = minutes + data[:, columns.index("day")] * 60 * 24
+    else:
+        num_days = -(-all_minutes.stop // (60 * 24))
+        minutes = (np.arange(num_days)[:, None] * 60 * 24 + minutes).ravel()
+        rows = np.tile(rows, num_days)
+
+    # Expand every row over the minutes it covers, at a step shared by both grids
+    ticks = np.unique(minutes)
+    input_step = int(np.gcd.reduce(np.diff(ticks))) if len(ticks) > 1 else 0
+    input_step = input_step or all_minutes.step
+    common_step = int(np.gcd(input_step, all_minutes.step))
+    repeats = input_step // common_step
+    minutes = (minutes[:, None] + np.arange(repeats) * common_step).ravel()
+    rows = np.repeat(rows, repeats)
+
+    slots = (minutes - all_minutes.start) // all_minutes.step
+    in_range = (minutes >= all_minutes.start) & (slots < len(all_minutes))
+    slots, rows = slots[in_range], rows[in_range]
+    counts = np.bincount(slots, minlength=len(all_minutes))
+    how = how or INPUT_AGGREGATIONS.get(column, "mean")
+    if how == "mean":
+        totals = np.bincount(slots, weights=rows, minlength=len(all_minutes))
+        aggregated = np.round(totals / np.maximum(counts, 1)).astype(int)
+    elif how in ("max", "min"):
+        ufunc = np.maximum if how == "max" else np.minimum
+        aggregated = np.zeros(len(all_minutes), dtype=int)
+        aggregated[slots] = rows
+        ufunc.at(aggregated, slots, rows)
+    else:
+        raise ValueError(f"Unknown aggregation `{how}` for the `{column}` input")
+    present = counts > 0
+    values[present] = aggregated[present]
+
+    if required and not present.all():
+        raise ValueError(
+            f"The `{column}` input is missing {(~present).sum()} time slots",
+            [
+                expand_minutes_into_components(minute)
+                for minute in np.asarray(all_minutes)[~present][:10].tolist()
+            ],
+        )
+    return values
+
+
+# Minutes the per slot static variables (revenue, vehicle cost, minimum shifts cost,
+# max starts & ends) are given for
+STATIC_VARIABLES_MINUTES = 15
+
+
+def get_slot_costs(static_variables, duration_step):
+    """Returns the revenue per passenger, the vehicle cost and the missing minimum
+    shift cost of one `duration_step` slot, so the objective of a run is the same
+    at every resolution. The rush hour cost is charged per shift end, not per slot.
+
+    The costs stay integers when the slot is a whole number of 15 minutes, keeping
+    an integer objective for the solver"""
+    scale = Fraction(duration_step, STATIC_VARIABLES_MINUTES)
+    scale = int(scale) if scale.denominator == 1 else float(scale)
+    return (
+        static_variables.revenue_passenger * scale,
+        static_variables.cost_vehicle_per_15min * scale,
+        static_variables.minimum_shifts_soft_constraint_cost * scale,
+    )
+
+
+def get_start_end_windows(static_variables, duration_step):
+    """The max starts & ends are given per 15 minutes. They apply to windows of
+    consecutive slots, the shortest spanning both whole slots and whole 15 minutes
+    (e.g. one 30 minutes slot, or three 5 minutes slots).
+
+    Returns the number of slots per window and the max starts and ends per window"""
+    window_minutes = int(np.lcm(duration_step, STATIC_VARIABLES_MINUTES))
+    scale = window_minutes // STATIC_VARIABLES_MINUTES
+    return (
+        window_minutes // duration_step,
+        static_variables.max_starts_per_slot * scale,
+        static_variables.max_ends_per_slot * scale,
+    )
+
+
+def get_counts_per_window(counts_per_slot, window_slots):
+    """Sums per slot counts over consecutive windows of `window_slots` slots"""
+    counts_per_slot = np.asarray(counts_per_slot)
+    return np.add.reduceat(
+        counts_per_slot, np.arange(0, len(counts_per_slot), window_slots)
+    )
+
+
+class TimeGrid:
+    """Time slots of a run, built once per run from its `all_minutes` range. Slot
+    `i` starts at minute `minutes[i]`, which is `components[i]` as `(day, hour,
+    minute)`. Minutes are decomposed with NumPy, never one at a time.
+
+    Outputs label slots with `datetimes`, where day 0 is the 1st of January 1900"""
+
+    # Date of the day 0 in the schedule outputs
+    EPOCH = pd.Timestamp(1900, 1, 1)
+
+    def __init__(self, all_minutes: range):
+        self.all_minutes = all_minutes
+        self.minutes = np.arange(
+            all_minutes.start, all_minutes.stop, all_minutes.step, dtype=np.int64
+        )
+        self.components = self.get_components(self.minutes)
+
+    @classmethod
+    def from_static_variables(cls, static_variables):
+        """Grid of a run: `num_hours` long, with a slot every `duration_step` minutes"""
+        return cls(
+            range(0, static_variables.num_hours * 60, static_variables.duration_step)
+        )
+
+    def __len__(self):
+        return len(self.all_minutes)
+
+    @property
+    def step(self) -> int:
+        return self.all_minutes.step
+
+    @property
+    def datetimes(self) -> pd.DatetimeIndex:
+        return self.get_datetimes(self.minutes)
+
+    def get_slots(self, minutes) -> np.ndarray:
+        """Returns the slot numbers of the given minutes of the grid"""
+        return (np.asarray(minutes) - self.all_minutes.start) // self.all_minutes.step
+
+    @staticmethod
+    def get_components(minutes) -> np.ndarray:
+        """Array version of `expand_minutes_into_components`. Returns the `(day, hour,
+        minute)` rows of the given minutes"""
+        days, minutes_of_day = np.divmod(np.asarray(minutes, dtype=np.int64), 60 * 24)
+        hours, minutes_of_hour = np.divmod(minutes_of_day, 60)
+        return np.column_stack((days, hours, minutes_of_hour))
+
+    @classmethod
+    def get_datetimes(cls, minutes) -> pd.DatetimeIndex:
+        """Returns the output datetimes of the given minutes"""
+        return cls.EPOCH + pd.to_timedelta(np.asarray(minutes), unit="m")
+
+    @classmethod
+    def get_minutes(cls, datetimes) -> np.ndarray:
+        """Inverse of `get_datetimes`"""
+        return (
+            (pd.to_datetime(datetimes) - cls.EPOCH) // pd.Timedelta(minutes=1)
+        ).to_numpy(dtype=np.int64)
+
+
+def assign_shifts_to_vehicles(shifts, vehicles, rest_time):
+    """Greedily assigns (start, end) shifts to the given interchangeable vehicles.
+    Shifts are processed by start time and given to the vehicle that has been free
+    the longest. This never fails as long as no more than `len(vehicles)` shifts
+    (including their rest time) overlap at any time.
+
+    Returns a list of (vehicle, start, end) tuples"""
+    available = [(0, vehicle) for vehicle in vehicles]
+    heapq.heapify(available)
+    assigned_shifts = []
+    for start, end in sorted(shifts):
+        if not available or available[0][0] > start:
+            raise ValueError(
+                f"Not enough vehicles to assign the shift starting at minute {start}"
+            )
+        _, vehicle = heapq.heappop(available)
+        assigned_shifts.append((vehicle, start, end))
+        heapq.heappush(available, (end + rest_time, vehicle))
+    return assigned_shifts
+
+
 def expand_minutes_into_components(total_minutes):
     """Returns the days, hours, minutes contained inside the total minutes"""
     minutes_per_hour = 60
@@ -1,13 +1,27 @@
+import asyncio
 import json
+import threading
 
+import pytest
 from fastapi.testclient import TestClient
 
+from api.jobs import JobManager
 from api.main import optimizer
+from api.messages import HeartbeatDeltaPipe, apply_heartbeat_deltas
+from api.solution_buffer import SolutionBuffer
 from api.objects import HeartbeatStatus, OptimizerInput
 
 client = TestClient(optimizer)
 
 
+@pytest.fixture(autouse=True)
+def job_manager(mocker):
+    """Every test starts with an empty registry and a single running slot"""
+    return mocker.patch(
+        "api.main.job_manager", JobManager(max_running_jobs=1, cpu_budget=4)
+    )
+
+
 def test_read_root():
     """Tests that the healtcheck endpoint returns fine."""
     response = client.get("/")
@@ -35,18 +49,18 @@ def test_output_not_init(mocker):
     """Tests the returned status of the output if no execution was ran but input was provided"""
     with open("./api/payloads/input.json", "r") as f:
         json_input = json.load(f)
-    mocker.patch("fastapi.BackgroundTasks.add_task", return_value=None)
+    mocker.patch("api.jobs.JobManager.watch", return_value=None)
     mocker.patch("multiprocessing.Process.start", return_value=None)
     response = client.post("/input/", json=json_input)
 
     response = client.get("/output/")
     assert response.status_code == 200
     data = response.json()
-    # Remove large or time variables
+    # Remove time variables
     del data["start_time"]
     del data["end_time"]
-    del data["payload"]["dynamic_variables"]
     assert data == {
+        "run_id": "2878898c-263f-4a32-9c14-ff15b60f91e3",
         "version": 1.8,
         "stage_id": 0,
         "stage": "No Stage Set",
@@ -56,9 +70,35 @@ def test_output_not_init(mocker):
         "score_constraints": 0,
         "scores_over_time": [],
         "error_message": None,
+        "solution": None,
+        "schedule": None,
+        "best_bound": None,
+        "solver_stats": None,
+        "build_profile": None,
+    }
+
+    # The payload is only returned if selected
+    response = client.get("/output/?fields=payload")
+    assert response.status_code == 200
+    data = response.json()
+    del data["payload"]["dynamic_variables"]
+    assert data == {
+        "run_id": "2878898c-263f-4a32-9c14-ff15b60f91e3",
         "payload": {
             "run_id": "2878898c-263f-4a32-9c14-ff15b60f91e3",
-            "num_search_workers": 4,
+            "num_workers": 4,
+            "engine": "v1.8",
+            "window_hours": 24,
+            "window_overlap_hours": 0,
+            "parallel_windows": False,
+            "coarse_duration_step": 60,
+            "hint_schedule": None,
+            "hint_run_id": None,
+            "hint_free_hours": None,
+            "hint_window_hours": None,
+            "max_time_in_seconds": None,
+            "relative_gap_limit": None,
+            "max_time_without_improvement": None,
             "static_variables": {
                 "num_hours": 24,
                 "num_vehicles": 77,
@@ -74,10 +114,11 @@ def test_output_not_init(mocker):
                 "rush_hour_soft_constraint_cost": 50,
                 "minimum_shifts_soft_constraint_cost": 50,
                 "min_time_between_shifts": 30,
+                "duration_step": 15,
+                "shift_formulation": "states",
+                "enable_symmetry_breaking": False,
             },
         },
-        "solution": None,
-        "schedule": None,
     }
 
 
@@ -86,7 +127,8 @@ def test_valid_input(mocker):
     with open("./api/payloads/input.json", "r") as f:
         json_input = json.load(f)
 
-    m = mocker.patch("fastapi.BackgroundTasks.add_task", return_value=None)
+    watched = threading.Event()
+    m = mocker.patch("api.jobs.JobManager.watch", side_effect=lambda job: watched.set())
     n = mocker.patch("multiprocessing.Process.start", return_value=None)
 
     response = client.post("/input/", json=json_input)
@@ -94,13 +136,15 @@ def test_valid_input(mocker):
     assert response.json() == [
         "Scheduler started with run_id: 2878898c-263f-4a32-9c14-ff15b60f91e3 and process_id: None."
     ]
+    # The job is followed by its own thread
+    assert watched.wait(5)
     m.assert_called_once()
     n.assert_called_once()
 
 
 def test_invalid_input(mocker):
     """Tests that the scheduler is not called when providing an invalid input"""
-    m = mocker.patch("fastapi.BackgroundTasks.add_task", return_value=None)
+    m = mocker.patch("api.jobs.JobManager.watch", return_value=None)
     n = mocker.patch("multiprocessing.Process.start", return_value=None)
 
     response = client.post(
@@ -126,18 +170,257 @@ def test_invalid_input(mocker):
     n.assert_not_called()
 
 
-def test_already_running_input(mocker):
-    """Tests that the scheduler is not called when it is already running."""
+def test_unknown_hint_run_id(mocker):
+    """Tests that the scheduler is not called when the warm start run is unknown."""
     with open("./api/payloads/input.json", "r") as f:
         json_input = json.load(f)
+    json_input["hint_run_id"] = "00000000-0000-0000-0000-000000000000"
+    mocker.patch("api.jobs.JobManager.watch", return_value=None)
+    mocker.patch("multiprocessing.Process.start", return_value=None)
+
+    response = client.post("/input/", json=json_input)
+    assert response.status_code == 404
+    assert response.json() == {
+        "detail": "No schedule found for the provided `hint_run_id`."
+    }
 
-    mocker.patch("api.main._current_scheduler_process", return_value=True)
 
+def test_already_running_input(mocker):
+    """Tests that the scheduler is not called when the same run is already running."""
+    with open("./api/payloads/input.json", "r") as f:
+        json_input = json.load(f)
+    mocker.patch("api.jobs.JobManager.watch", return_value=None)
+    n = mocker.patch("multiprocessing.Process.start", return_value=None)
+
+    client.post("/input/", json=json_input)
     response = client.post("/input/", json=json_input)
     assert response.status_code == 404
     assert response.json() == {
-        "detail": "Cannot start a scheduler run while a previous run is still running. Check `/heartbeat/`"
+        "detail": "Cannot start a scheduler run while a run with the same `run_id` is still queued or running. Check `/heartbeat/{run_id}`"
     }
+    n.assert_called_once()
+
+
+def test_queued_input(mocker):
+    """Tests that runs are queued while there is no free slot and can be cancelled"""
+    with open("./api/payloads/input.json", "r") as f:
+        json_input = json.load(f)
+    mocker.patch("api.jobs.JobManager.watch", return_value=None)
+    n = mocker.patch("multiprocessing.Process.start", return_value=None)
+
+    client.post("/input/", json=json_input)
+    json_input["run_id"] = "00000000-0000-0000-0000-000000000000"
+    response = client.post("/input/", json=json_input)
+    assert response.status_code == 200
+    assert response.json() == [
+        "Scheduler queued with run_id: 00000000-0000-0000-0000-000000000000."
+    ]
+    n.assert_called_once()
+    assert [job["queued"] for job in client.get("/jobs/").json()] == [False, True]
+
+    response = client.get("/cancel/00000000-0000-0000-0000-000000000000")
+    assert response.status_code == 200
+    response = client.get("/heartbeat/00000000-0000-0000-0000-000000000000")
+    assert response.json()["stage_id"] == -1
+    assert client.get("/heartbeat/").json()["run_id"] == json_input["run_id"]
+
+
+def test_conditional_output(mocker):
+    """Tests that the output and heartbeat are not sent again while they did not
+    change"""
+    with open("./api/payloads/input.json", "r") as f:
+        json_input = json.load(f)
+    mocker.patch("api.jobs.JobManager.watch", return_value=None)
+    mocker.patch("multiprocessing.Process.start", return_value=None)
+
+    client.post("/input/", json=json_input)
+    for endpoint in ("/output/", "/heartbeat/", f"/output/{json_input['run_id']}"):
+        response = client.get(endpoint)
+        assert response.status_code == 200
+        etag = response.headers["etag"]
+        response = client.get(endpoint, headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+
+    # A new run changes the version of the latest run endpoints
+    json_input["run_id"] = "00000000-0000-0000-0000-000000000000"
+    client.post("/input/", json=json_input)
+    response = client.get("/output/", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["run_id"] == json_input["run_id"]
+    assert "payload" not in response.json()
+
+
+def test_output_fields(mocker):
+    """Tests that the output endpoints only return the selected fields"""
+    with open("./api/payloads/input.json", "r") as f:
+        json_input = json.load(f)
+    mocker.patch("api.jobs.JobManager.watch", return_value=None)
+    mocker.patch("multiprocessing.Process.start", return_value=None)
+
+    client.post("/input/", json=json_input)
+    response = client.get("/output/?fields=status,schedule")
+    assert response.status_code == 200
+    data = response.json()
+    assert set(data) == {
+        "run_id",
+        "version",
+        "stage_id",
+        "stage",
+        "step",
+        "start_time",
+        "end_time",
+        "error_message",
+        "schedule",
+    }
+    assert data["run_id"] == json_input["run_id"]
+
+    response = client.get(f"/output/{json_input['run_id']}?limit=10")
+    assert "payload" not in response.json()
+    assert "solution" in response.json()
+
+    response = client.get("/output/?fields=unknown")
+    assert response.status_code == 422
+
+
+def test_run_stream(mocker):
+    """Tests that the stream of a finished run sends its status and outputs, then
+    ends"""
+    with open("./api/payloads/input.json", "r") as f:
+        json_input = json.load(f)
+    mocker.patch("api.jobs.JobManager.watch", return_value=None)
+    mocker.patch("multiprocessing.Process.start", return_value=None)
+
+    client.post("/input/", json=json_input)
+    json_input["run_id"] = "00000000-0000-0000-0000-000000000000"
+    client.post("/input/", json=json_input)
+    client.get("/cancel/00000000-0000-0000-0000-000000000000")
+
+    response = client.get("/stream/00000000-0000-0000-0000-000000000000")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [
+        (lines[0][len("event: ") :], json.loads(lines[1][len("data: ") :]))
+        for lines in (event.split("\n") for event in response.text.split("\n\n"))
+        if lines[0].startswith("event: ")
+    ]
+    assert [event for event, _ in events] == ["heartbeat", "incumbent"]
+    assert events[0][1]["run_id"] == json_input["run_id"]
+    assert events[0][1]["stage_id"] == -1
+    assert "payload" not in events[0][1]
+    assert events[1][1]["solution"] is None
+
+
+def test_wait_for_update_async():
+    """Tests that the streams wait for the updates of other threads on the event loop"""
+    job_manager = JobManager(max_running_jobs=1, cpu_budget=4)
+
+    async def _wait():
+        version = job_manager.version
+        assert await job_manager.wait_for_update_async(version, 0.01) == version
+        update = threading.Thread(target=job_manager._JobManager__notify_update)
+        update.start()
+        new_version = await job_manager.wait_for_update_async(version, 5)
+        update.join()
+        return new_version
+
+    assert asyncio.run(_wait()) == 1
+
+
+def test_cancel_running_input(mocker):
+    """Tests that cancelling a running run stops its search without killing it"""
+    with open("./api/payloads/input.json", "r") as f:
+        json_input = json.load(f)
+    mocker.patch("api.jobs.JobManager.watch", return_value=None)
+    mocker.patch("multiprocessing.Process.start", return_value=None)
+    cancel = mocker.patch("api.jobs.SchedulerWorker.cancel")
+    kill = mocker.patch("api.jobs.SchedulerWorker.kill")
+    mocker.patch("threading.Timer.start", return_value=None)
+
+    client.post("/input/", json=json_input)
+    response = client.get(f"/cancel/{json_input['run_id']}")
+    assert response.status_code == 200
+    assert response.json() == ["Scheduler execution cancelled."]
+    cancel.assert_called_once()
+    kill.assert_not_called()
+
+
+def test_unknown_run_id():
+    """Tests that the per run endpoints return a 404 for unknown runs"""
+    for endpoint in ("heartbeat", "output"):
+        response = client.get(f"/{endpoint}/00000000-0000-0000-0000-000000000000")
+        assert response.status_code == 404
+        assert response.json() == {
+            "detail": "No scheduler run found for the provided `run_id`."
+        }
+
+
+def test_heartbeat_deltas(mocker):
+    """Tests that applying the pipe deltas rebuilds the scheduler heartbeat"""
+    sent = []
+    pipe = mocker.Mock()
+    pipe.send.side_effect = sent.append
+    delta_pipe = HeartbeatDeltaPipe(pipe)
+    scheduler_heartbeat = HeartbeatStatus()
+    scheduler_heartbeat.reset()
+    api_heartbeat = scheduler_heartbeat.copy(deep=True)
+
+    scheduler_heartbeat.set_stage(4)
+    delta_pipe.send(scheduler_heartbeat)
+    delta_pipe.send(scheduler_heartbeat)
+    scheduler_heartbeat.step = 1
+    scheduler_heartbeat.total_score = 10
+    scheduler_heartbeat.scores_over_time.append((12, 2))
+    scheduler_heartbeat.solution = {"columns": [], "index": [], "data": []}
+    delta_pipe.send(scheduler_heartbeat)
+    scheduler_heartbeat.best_bound = 12.0
+    scheduler_heartbeat.solver_stats = {"status": "FEASIBLE", "objective": 10.0}
+    scheduler_heartbeat.set_stage(5)
+    scheduler_heartbeat.set_end_time()
+    delta_pipe.send(scheduler_heartbeat)
+    delta_pipe.send(None)
+
+    assert len(sent) == 4 and sent[-1] is None
+    for deltas in sent[:-1]:
+        apply_heartbeat_deltas(api_heartbeat, deltas)
+    assert api_heartbeat == scheduler_heartbeat
+
+
+def test_heartbeat_deltas_keep_open(mocker):
+    """Tests that a pipe kept open for the next runs is not ended by the scheduler"""
+    pipe = mocker.Mock()
+    delta_pipe = HeartbeatDeltaPipe(pipe, keep_open=True)
+    scheduler_heartbeat = HeartbeatStatus()
+    scheduler_heartbeat.reset()
+
+    delta_pipe.send(scheduler_heartbeat)
+    delta_pipe.send(None)
+    delta_pipe.close()
+
+    pipe.send.assert_called_once()
+    pipe.close.assert_not_called()
+
+
+def test_solution_buffer():
+    """Tests that the solutions written to the shared memory buffer are read back"""
+    solution_buffer = SolutionBuffer.create(
+        num_vehicles=2, num_slots=8, duration_step=15
+    )
+    reader = SolutionBuffer.attach(solution_buffer.name)
+    try:
+        assert reader.read()[0] == 0
+        for solution in (
+            [[0, 0, 15, 1, 1, 0], [0, 0, 30, 1, 0, 1]],
+            [[0, 0, 0, 0, 1, 0], [0, 0, 15, 0, 0, 0], [0, 0, 30, 0, 0, 1]],
+        ):
+            solution_buffer.write(solution)
+            sequence, shifts_state_values = reader.read()
+            assert shifts_state_values.tolist() == solution
+        assert sequence == 2
+    finally:
+        reader.close()
+        solution_buffer.close()
+        solution_buffer.unlink()
 
 
 # def test_cancel_valid(mocker):
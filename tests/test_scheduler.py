@@ -0,0 +1,926 @@
+import itertools
+import json
+import os
+import threading
+
+import pytest
+import numpy as np
+import pandas as pd
+from ortools.sat.python import cp_model
+
+from api.objects import (
+    HeartbeatStatus,
+    OptimizerInput,
+    StaticVariables,
+    VectorDataFrame,
+)
+from scheduler.constraints import schedule_counts_hint, sort_vehicles_shifts
+from scheduler.greedy import greedy_schedule
+import scheduler.optimizer_column_generation as optimizer_column_generation
+from scheduler.optimizer_column_generation import (
+    RestrictedMaster,
+    compute_schedule as compute_column_generation_schedule,
+)
+from scheduler.optimizer_lns import (
+    LocalSearchState,
+    compute_schedule as compute_lns_schedule,
+)
+import scheduler.optimizer_multi_resolution as optimizer_multi_resolution
+from scheduler.optimizer_patterns import (
+    PatternInputs,
+    compute_schedule as compute_pattern_schedule,
+    enumerate_shift_patterns,
+    get_counts_per_slot,
+    get_pattern_inputs,
+    get_patterns_per_slot,
+    get_patterns_cost,
+    get_valid_patterns,
+    validate_shifts,
+)
+from scheduler.optimizer_rolling_horizon import (
+    compute_schedule as compute_rolling_horizon_schedule,
+    slice_vector_dataframe,
+)
+from scheduler.optimizer_v1_8 import compute_schedule
+from scheduler.utils import (
+    TimeGrid,
+    assign_shifts_to_vehicles,
+    get_counts_per_window,
+    clear_solutions_folder,
+    get_input_per_slot,
+    get_slot_costs,
+    get_start_end_windows,
+)
+from scheduler.solver import (
+    LinearExpressionsEvaluator,
+    ModelBuildProfiler,
+    SolutionPublisher,
+    StoppableSolutionCollector,
+    cancel_event,
+    get_schedule_from_states_df,
+    get_shifts_from_schedule,
+    get_states_from_shifts,
+    set_stopping_criteria,
+)
+
+PAYLOAD_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "api", "payloads", "input.json"
+)
+
+
+@pytest.fixture
+def solutions_folder(tmp_path, monkeypatch):
+    """Runs the scheduler from a temporary folder, as it writes its solutions to
+    `./scheduler/solutions/<run_id>`"""
+    (tmp_path / "scheduler" / "solutions").mkdir(parents=True)
+    monkeypatch.chdir(tmp_path)
+
+
+def _get_heartbeat(static_variables=None, **payload):
+    """Heartbeat of the stock payload with the given payload and static variables
+    changes"""
+    with open(PAYLOAD_PATH, "r") as f:
+        json_input = json.load(f)
+    json_input.update(payload)
+    json_input["static_variables"].update(static_variables or {})
+    heartbeat = HeartbeatStatus(payload=OptimizerInput(**json_input))
+    heartbeat.reset()
+    return heartbeat
+
+
+def test_assign_shifts_to_vehicles():
+    """Tests that overlapping shifts go to different vehicles and rest time is respected"""
+    shifts = [(0, 240), (0, 300), (270, 600), (330, 600)]
+    assigned = assign_shifts_to_vehicles(shifts, [3, 5], rest_time=30)
+
+    assert sorted(assigned) == [(3, 0, 240), (3, 270, 600), (5, 0, 300), (5, 330, 600)]
+
+
+def test_assign_shifts_to_vehicles_not_enough_vehicles():
+    """Tests that an error is raised when the shifts can't be covered by the vehicles"""
+    with pytest.raises(ValueError):
+        assign_shifts_to_vehicles([(0, 240), (255, 600)], [0], rest_time=30)
+
+
+def test_get_input_per_slot():
+    """Tests that inputs are indexed by slot number and missing slots are detected"""
+    all_minutes = range(0, 24 * 60, 15)
+    rows = [[0, hour, minute, hour] for hour in range(24) for minute in range(0, 60, 15)]
+    vector_dataframe = VectorDataFrame(
+        columns=["day", "hour", "minute", "demand"],
+        index=list(range(len(rows))),
+        data=rows[::-1],
+    )
+
+    demand = get_input_per_slot(vector_dataframe, "demand", all_minutes, required=True)
+    assert demand.tolist() == [slot // 4 for slot in range(len(all_minutes))]
+
+    vector_dataframe.data = rows[1:]
+    vector_dataframe.index = vector_dataframe.index[1:]
+    assert get_input_per_slot(vector_dataframe, "demand", all_minutes)[0] == 0
+    with pytest.raises(ValueError):
+        get_input_per_slot(vector_dataframe, "demand", all_minutes, required=True)
+
+
+def test_resample_input_per_slot():
+    """Tests that inputs are aggregated onto coarser grids and repeated on finer ones"""
+    rows = [
+        [hour, minute, 4 * hour + minute // 15]
+        for hour in range(2)
+        for minute in range(0, 60, 15)
+    ]
+    vector_dataframe = VectorDataFrame(
+        columns=["hour", "minute", "rush_hour"],
+        index=list(range(len(rows))),
+        data=rows,
+    )
+
+    hourly = range(0, 120, 60)
+    assert get_input_per_slot(vector_dataframe, "rush_hour", hourly).tolist() == [3, 7]
+    assert get_input_per_slot(
+        vector_dataframe, "rush_hour", hourly, how="min"
+    ).tolist() == [0, 4]
+    assert get_input_per_slot(
+        vector_dataframe, "rush_hour", hourly, how="mean"
+    ).tolist() == [2, 6]
+
+    fine = get_input_per_slot(
+        vector_dataframe, "rush_hour", range(0, 120, 5), required=True
+    )
+    assert fine.tolist() == np.repeat(np.arange(8), 3).tolist()
+
+
+def test_slot_costs_and_windows():
+    """Tests that the per 15 minutes static variables are rescaled to the slots"""
+    static_variables = StaticVariables(
+        cost_vehicle_per_15min=3, max_starts_per_slot=2, max_ends_per_slot=4
+    )
+    assert get_slot_costs(static_variables, 15) == (50, 3, 50)
+    assert get_slot_costs(static_variables, 60) == (200, 12, 200)
+    assert get_slot_costs(static_variables, 5) == pytest.approx((50 / 3, 1, 50 / 3))
+
+    assert get_start_end_windows(static_variables, 5) == (3, 2, 4)
+    assert get_start_end_windows(static_variables, 10) == (3, 4, 8)
+    assert get_start_end_windows(static_variables, 15) == (1, 2, 4)
+    assert get_start_end_windows(static_variables, 30) == (1, 4, 8)
+    assert get_counts_per_window([1, 0, 2, 1, 1, 0], 3).tolist() == [3, 2]
+
+
+def test_score_across_resolutions(solutions_folder):
+    """Tests that a run scores the same on grids fine enough for its optimum"""
+    scores = []
+    for duration_step in (10, 15, 30):
+        heartbeat = _get_heartbeat(
+            {"num_hours": 14, "num_vehicles": 3, "duration_step": duration_step},
+            num_workers=2,
+            max_time_in_seconds=30,
+        )
+        compute_pattern_schedule(heartbeat)
+        assert heartbeat.stage == "Scheduler finished - Optimal solution found."
+        scores.append(heartbeat.total_score)
+    assert scores == [scores[1]] * 3
+
+
+def test_solutions_folder_per_run(solutions_folder):
+    """Tests that the solutions of a run are not removed by the start of another one"""
+    heartbeat = _get_heartbeat(
+        {"num_hours": 14, "num_vehicles": 3},
+        run_id="first",
+        num_workers=2,
+        max_time_in_seconds=30,
+    )
+    compute_pattern_schedule(heartbeat)
+    clear_solutions_folder("second")
+
+    assert os.listdir("./scheduler/solutions/second") == []
+    assert "best_solution_front_format.csv" in os.listdir(
+        "./scheduler/solutions/first"
+    )
+
+
+def test_daily_input_per_slot():
+    """Tests that inputs without a `day` column are repeated on every day"""
+    rows = [[hour, 0, hour] for hour in range(24)]
+    vector_dataframe = VectorDataFrame(
+        columns=["hour", "minute", "rush_hour"],
+        index=list(range(len(rows))),
+        data=rows,
+    )
+
+    rush_hour = get_input_per_slot(
+        vector_dataframe, "rush_hour", range(0, 48 * 60, 60), required=True
+    )
+    assert rush_hour.tolist() == list(range(24)) * 2
+
+    # Sliced from the second day, relative to the window start
+    window = slice_vector_dataframe(vector_dataframe, 36 * 60, 60 * 60)
+    assert get_input_per_slot(
+        window, "rush_hour", range(0, 24 * 60, 60), required=True
+    ).tolist() == list(range(12, 24)) + list(range(12))
+
+
+def test_linear_expressions_evaluator():
+    """Tests that variables, expressions and constants are evaluated from the solution array"""
+    model = cp_model.CpModel()
+    a = model.NewBoolVar("a")
+    b = model.NewIntVar(0, 10, "b")
+    evaluator = LinearExpressionsEvaluator(
+        [a, b, cp_model.LinearExpr.Sum([a, b]) + 2, 2 * b - a, 3]
+    )
+
+    assert evaluator.evaluate(np.array([1, 7])).tolist() == [1, 7, 10, 13, 3]
+
+
+def test_schedule_counts_hint_window():
+    """Tests that only the shifts starting and ending close to a hinted one are allowed"""
+    model = cp_model.CpModel()
+    shifts_count = {
+        (start, duration): model.NewIntVar(0, 2, f"count_{start}_{duration}")
+        for start in range(0, 240, 15)
+        for duration in (60, 120)
+    }
+    schedule_counts_hint(model, shifts_count, [(0, 60, 180)], window_minutes=30)
+    model.Maximize(cp_model.LinearExpr.Sum(list(shifts_count.values())))
+    solver = cp_model.CpSolver()
+    solver.Solve(model)
+
+    assert {key for key, count in shifts_count.items() if solver.Value(count)} == {
+        (start, duration)
+        for start, duration in shifts_count
+        if abs(start - 60) <= 30 and abs(start + duration - 180) <= 30
+    }
+
+
+def test_model_build_profiler():
+    """Tests that the variables and constraints added by each builder are counted"""
+    model = cp_model.CpModel()
+    profiler = ModelBuildProfiler(model)
+    with profiler.profile("variables"):
+        variables = [model.NewBoolVar(f"x_{i}") for i in range(3)]
+    with profiler.profile("constraints"):
+        model.Add(cp_model.LinearExpr.Sum(variables) <= 2)
+        model.AddBoolOr(variables)
+
+    assert [
+        (entry["builder"], entry["variables"], entry["constraints"])
+        for entry in profiler.report
+    ] == [("variables", 3, 0), ("constraints", 0, 2)]
+    assert all(entry["wall_time"] >= 0 for entry in profiler.report)
+
+
+def test_solution_publisher():
+    """Tests that pending solutions are coalesced and the latest one is always published"""
+    published = []
+    release = threading.Event()
+
+    def _publish(step):
+        release.wait()
+        published.append(step)
+
+    with SolutionPublisher(_publish) as publisher:
+        for step in range(5):
+            publisher.submit(step)
+        release.set()
+
+    assert published[-1] == 4
+    assert published == sorted(published) and len(published) < 5
+
+
+def test_solution_publisher_error():
+    """Tests that errors raised while publishing are raised again on close"""
+
+    def _publish(step):
+        raise ValueError("Publishing failed")
+
+    with pytest.raises(ValueError):
+        with SolutionPublisher(_publish) as publisher:
+            publisher.submit(0)
+
+
+def test_stoppable_solution_collector_publish():
+    """Tests that the solution collectors must implement `_publish`"""
+
+    class Collector(StoppableSolutionCollector):
+        pass
+
+    with pytest.raises(TypeError):
+        Collector()
+
+    class PublishingCollector(StoppableSolutionCollector):
+        def _publish(self, solution, solution_count, current_score, current_time):
+            self.published = solution_count
+
+    collector = PublishingCollector()
+    collector.submit_solution(None, 1, 0, 0)
+    assert collector.published == 1
+
+
+class _ImprovementCollector(StoppableSolutionCollector):
+    def on_solution_callback(self):
+        self.register_improvement()
+
+    def _publish(self, solution, solution_count, current_score, current_time):
+        pass
+
+
+def _solve_golomb_ruler(**payload):
+    """Solves a 10 marks Golomb ruler, whose optimum (55) is found quickly but takes
+    long to prove, with the stop rules of the given payload changes. Returns the
+    final stage stop reason"""
+    num_marks, max_mark = 10, 100
+    model = cp_model.CpModel()
+    marks = [model.NewIntVar(0, max_mark, f"mark_{i}") for i in range(num_marks)]
+    model.Add(marks[0] == 0)
+    for mark, next_mark in zip(marks, marks[1:]):
+        model.Add(mark < next_mark)
+    differences = []
+    for i, j in itertools.combinations(range(num_marks), 2):
+        difference = model.NewIntVar(1, max_mark, f"difference_{i}_{j}")
+        model.Add(difference == marks[j] - marks[i])
+        differences.append(difference)
+    model.AddAllDifferent(differences)
+    model.Minimize(marks[-1])
+
+    heartbeat = _get_heartbeat(**payload)
+    solver = cp_model.CpSolver()
+    solver.parameters.num_workers = 1
+    set_stopping_criteria(solver, heartbeat)
+    collector = _ImprovementCollector(heartbeat.payload.max_time_without_improvement)
+    with collector.watch_stop_rules():
+        status = solver.Solve(model, collector)
+    return collector.get_stop_reason(solver, status)
+
+
+def test_stop_on_time_limit():
+    """Tests that a run stops on `max_time_in_seconds`"""
+    assert _solve_golomb_ruler(max_time_in_seconds=1) == " (time limit reached)"
+
+
+def test_stop_on_relative_gap_limit():
+    """Tests that a run stops once within `relative_gap_limit` of the bound"""
+    assert (
+        _solve_golomb_ruler(relative_gap_limit=0.5, max_time_in_seconds=60)
+        == " (within the relative gap limit)"
+    )
+
+
+def test_stop_on_stagnation():
+    """Tests that a run stops after `max_time_without_improvement` seconds without a
+    better solution"""
+    assert (
+        _solve_golomb_ruler(max_time_without_improvement=1, max_time_in_seconds=60)
+        == " (no improvement in 1.0 seconds)"
+    )
+
+
+def test_get_shifts_from_schedule():
+    """Tests that the shifts are recovered from the heartbeat schedule"""
+    shifts = [(0, 60, 360), (1, 1380, 1800), (1, 1845, 2100)]
+    df = pd.DataFrame(
+        get_states_from_shifts(shifts, 15),
+        columns=["day", "hour", "minute", "vehicle", "start", "end"],
+    )
+
+    assert get_shifts_from_schedule(get_schedule_from_states_df(df)) == shifts
+
+
+def test_time_grid():
+    """Tests the slot, minute and (day, hour, minute) mappings of the time grid"""
+    time_grid = TimeGrid(range(0, 48 * 60, 15))
+
+    assert len(time_grid) == 192
+    assert time_grid.components[101].tolist() == [1, 1, 15]
+    assert time_grid.get_slots([0, 1455, 2865]).tolist() == [0, 97, 191]
+    assert time_grid.datetimes[97] == pd.Timestamp(1900, 1, 2, 0, 15)
+    # Datetimes keep counting days after the first month
+    minutes = [0, 40 * 24 * 60 + 75]
+    assert TimeGrid.get_minutes(TimeGrid.get_datetimes(minutes)).tolist() == minutes
+
+
+def test_get_states_from_shifts():
+    """Tests that every active slot of the shifts gets a state row"""
+    assert get_states_from_shifts([(2, 1410, 1455), (0, 0, 15)], 15).tolist() == [
+        [0, 23, 30, 2, 1, 0],
+        [0, 23, 45, 2, 0, 0],
+        [1, 0, 0, 2, 0, 0],
+        [1, 0, 15, 2, 0, 1],
+        [0, 0, 0, 0, 1, 0],
+        [0, 0, 15, 0, 0, 1],
+    ]
+    assert get_states_from_shifts([], 15).shape == (0, 6)
+
+
+def _get_pattern_inputs():
+    """12 hours with a demand of 3 vehicles, closed for the first 2 hours"""
+    num_slots = 48
+    market_open = np.ones(num_slots, dtype=int)
+    market_open[:8] = 0
+    zeros = np.zeros(num_slots, dtype=int)
+    return PatternInputs(
+        StaticVariables(
+            num_hours=12,
+            num_vehicles=2,
+            min_duration=2,
+            max_duration=4,
+            max_starts_per_slot=1,
+            enable_market_hour_constraint=True,
+        ),
+        range(0, 12 * 60, 15),
+        range(120, 240, 15),
+        30,
+        np.full(num_slots, 3),
+        zeros,
+        market_open,
+        zeros,
+        [],
+        [0, 1],
+        zeros,
+        zeros,
+        zeros,
+    )
+
+
+def test_enumerate_shift_patterns():
+    """Tests that patterns end inside the horizon, never cover a closed slot and
+    never end in a rush hour slot"""
+    durations = [2, 3]
+    closed = np.zeros(8, dtype=int)
+    closed[4] = 1
+    rush_hour = np.zeros(8, dtype=int)
+    rush_hour[6] = 1
+
+    def _patterns(*masks):
+        return set(zip(*enumerate_shift_patterns(8, durations, *masks)))
+
+    assert _patterns() == {
+        (start, duration) for duration in durations for start in range(8 - duration)
+    }
+    assert _patterns(closed) == {(0, 2), (0, 3), (1, 2), (5, 2)}
+    assert _patterns(None, rush_hour) == _patterns() - {(4, 2), (3, 3)}
+    assert _patterns(closed, rush_hour) == {(0, 2), (0, 3), (1, 2), (5, 2)}
+
+
+def test_get_valid_patterns():
+    """Tests that the patterns follow the shift durations, market hours and rush
+    hours of the inputs"""
+    inputs = _get_pattern_inputs()
+    pattern_starts, pattern_durations = get_valid_patterns(inputs)
+    pattern_ends = pattern_starts + pattern_durations
+
+    # From 2 hours to the last duration under 4 hours, between the market opening
+    # and the end of the horizon
+    assert set(pattern_durations) == set(range(8, 16))
+    assert pattern_starts.min() == 8 and pattern_ends.max() == 47
+    assert len(pattern_starts) == sum(48 - 8 - duration for duration in range(8, 16))
+
+    rush_hour = np.zeros(48, dtype=int)
+    rush_hour[40:44] = 1
+    inputs = inputs._replace(
+        static_variables=inputs.static_variables.copy(
+            update={"enable_rush_hour_constraint": True}
+        ),
+        rush_hour=rush_hour,
+    )
+    rush_hour_starts, rush_hour_durations = get_valid_patterns(inputs)
+    rush_hour_ends = rush_hour_starts + rush_hour_durations
+    assert not rush_hour[rush_hour_ends].any()
+    assert len(rush_hour_starts) == len(pattern_starts) - 4 * 8
+
+
+def test_patterns_per_slot():
+    """Tests that the patterns spanning each slot, and the selected shifts per slot,
+    match the (slot x pattern) matrix of the patterns"""
+    inputs = _get_pattern_inputs()
+    num_slots = len(inputs.all_minutes)
+    pattern_starts, pattern_durations = get_valid_patterns(inputs)
+    slots = np.arange(num_slots)[:, None]
+    busy = (slots >= pattern_starts) & (slots < pattern_starts + pattern_durations + 3)
+
+    patterns_per_slot = get_patterns_per_slot(
+        pattern_starts, pattern_durations + 3, num_slots
+    )
+    assert len(patterns_per_slot) == num_slots
+    for slot, patterns in enumerate(patterns_per_slot):
+        assert patterns.tolist() == np.flatnonzero(busy[slot]).tolist()
+
+    counts = np.random.default_rng(0).integers(0, 3, len(pattern_starts))
+    assert (
+        get_counts_per_slot(pattern_starts, pattern_durations + 3, counts, num_slots)
+        == busy @ counts
+    ).all()
+
+
+def test_greedy_schedule():
+    """Tests that the greedy schedule respects the market hours and max starts"""
+    shifts = greedy_schedule(_get_pattern_inputs())
+    starts = [start for _, start, _ in shifts]
+
+    assert shifts
+    assert len(set(starts)) == len(starts)
+    assert min(starts) >= 120
+
+
+def test_validate_shifts():
+    """Tests that the hard constraints broken by a schedule are reported"""
+    inputs = _get_pattern_inputs()
+    assert validate_shifts(inputs, greedy_schedule(inputs)) == []
+    assert validate_shifts(inputs, [(0, 120, 330), (1, 240, 450)]) == []
+
+    # Market closed, no rest between shifts, duration and frozen minutes
+    assert validate_shifts(inputs, [(0, 60, 270)])
+    assert validate_shifts(inputs, [(0, 120, 330), (0, 345, 540)])
+    assert validate_shifts(inputs, [(0, 120, 600)])
+    assert validate_shifts(inputs, [(0, 120, 330)], frozen_until=240)
+
+    inputs = inputs._replace(
+        static_variables=inputs.static_variables.copy(
+            update={"enable_min_shift_constraint": True}
+        ),
+        minimum_shifts=np.full(48, 1),
+    )
+    assert validate_shifts(inputs, [(0, 120, 330)])
+
+
+def test_local_search_replace_shifts():
+    """Tests that only improving replacements are kept, with an up to date score"""
+    state = LocalSearchState(_get_pattern_inputs(), [(0, 120, 360)])
+    score = state.total_score
+
+    assert not state.replace_shifts([(0, 120, 360)], [(0, 120, 240)], 0, 48)
+    assert state.shifts == [(0, 120, 360)] and state.total_score == score
+    assert state.replace_shifts([], [(1, 240, 480)], 0, 48)
+    assert state.total_score == LocalSearchState(state.inputs, state.shifts).total_score
+    assert state.total_score > score
+
+
+def test_lns_infeasible_hint(solutions_folder, capsys):
+    """Tests that the local search starts from the greedy schedule when the hint
+    breaks a hard constraint"""
+    heartbeat = _get_heartbeat(
+        {"num_hours": 14, "num_vehicles": 3},
+        num_workers=2,
+        max_time_in_seconds=5,
+        # The vehicle does not rest between both shifts
+        hint_schedule=_get_schedule([(0, 300, 540), (0, 555, 795)]),
+    )
+    compute_lns_schedule(heartbeat)
+
+    assert "The hint schedule is not feasible" in capsys.readouterr().out
+    assert heartbeat.stage.startswith("Scheduler finished - Local search finished")
+    shifts = get_shifts_from_schedule(heartbeat.schedule)
+    assert validate_shifts(get_pattern_inputs(heartbeat), shifts) == []
+
+
+def test_rolling_horizon_stock_payload(solutions_folder):
+    """Tests that the rolling horizon solves the stock payload, whose rush hours have
+    no `day` column"""
+    heartbeat = _get_heartbeat(
+        {"shift_formulation": "counts"},
+        engine="rolling_horizon",
+        window_hours=12,
+        num_workers=1,
+        max_time_in_seconds=30,
+    )
+    compute_rolling_horizon_schedule(heartbeat)
+
+    assert heartbeat.stage == "Scheduler finished - Rolling horizon solution found."
+    assert heartbeat.step == 2 and heartbeat.schedule["data"]
+
+
+def test_rolling_horizon_cancel_parallel_windows(solutions_folder):
+    """Tests that cancelling a run terminates its parallel windows without waiting
+    for their time limit"""
+    heartbeat = _get_heartbeat(
+        {"num_hours": 48},
+        engine="rolling_horizon",
+        window_hours=24,
+        parallel_windows=True,
+        num_workers=2,
+        max_time_in_seconds=120,
+    )
+    timer = threading.Timer(1, cancel_event.set)
+    timer.start()
+    try:
+        compute_rolling_horizon_schedule(heartbeat)
+    finally:
+        timer.cancel()
+        cancel_event.clear()
+
+    assert heartbeat.stage == (
+        "Scheduler finished - Rolling horizon cancelled after 0/2 windows."
+    )
+    assert heartbeat.get_elapsed_seconds() < 30
+
+
+def test_rolling_horizon_after_first_day(solutions_folder):
+    """Tests that the windows after the first day get the daily inputs"""
+    heartbeat = _get_heartbeat(
+        {"num_hours": 48, "shift_formulation": "counts"},
+        engine="rolling_horizon",
+        window_hours=24,
+        num_workers=2,
+        max_time_in_seconds=60,
+    )
+    compute_rolling_horizon_schedule(heartbeat)
+
+    assert heartbeat.stage == "Scheduler finished - Rolling horizon solution found."
+    assert heartbeat.step == 2
+    assert max(end for _, _, end in get_shifts_from_schedule(heartbeat.schedule)) > (
+        24 * 60
+    )
+
+
+def _get_schedule(shifts):
+    """Schedule in split format of the given (vehicle, start, end) shifts"""
+    return get_schedule_from_states_df(
+        pd.DataFrame(
+            get_states_from_shifts(shifts, 15),
+            columns=["day", "hour", "minute", "vehicle", "start", "end"],
+        )
+    )
+
+
+def _get_vehicles_starts(shifts):
+    """Sorted shift starts of each vehicle, with the sort key of the symmetry breaking
+    order"""
+    vehicles_starts = {}
+    for vehicle, start, _ in shifts:
+        vehicles_starts.setdefault(vehicle, []).append(start)
+    return {
+        vehicle: (*sorted(starts), float("inf"))
+        for vehicle, starts in vehicles_starts.items()
+    }
+
+
+def test_sort_vehicles_shifts():
+    """Tests that only the ordered vehicles are relabelled, earliest starts first"""
+    shifts = [(0, 300, 780), (1, 270, 750), (2, 300, 780), (2, 900, 960), (5, 0, 60)]
+    sorted_shifts = sort_vehicles_shifts(shifts, [0, 1, 2])
+
+    assert sorted(sorted_shifts) == [
+        (0, 270, 750),
+        (1, 300, 780),
+        (1, 900, 960),
+        (2, 300, 780),
+        (5, 0, 60),
+    ]
+
+
+def test_symmetry_breaking_order(solutions_folder):
+    """Tests that the free vehicles come out sorted by their shift starts, without
+    changing the objective"""
+    heartbeats = []
+    for enable_symmetry_breaking in (False, True):
+        heartbeat = _get_heartbeat(
+            {
+                "num_hours": 14,
+                "num_vehicles": 3,
+                "enable_symmetry_breaking": enable_symmetry_breaking,
+            },
+            num_workers=2,
+            max_time_in_seconds=30,
+        )
+        compute_schedule(heartbeat)
+        assert heartbeat.stage == "Scheduler finished - Optimal solution found."
+        heartbeats.append(heartbeat)
+
+    assert heartbeats[0].total_score == heartbeats[1].total_score
+    vehicles_starts = _get_vehicles_starts(
+        get_shifts_from_schedule(heartbeats[1].schedule)
+    )
+    keys = [vehicles_starts.get(vehicle, (float("inf"),)) for vehicle in range(3)]
+    assert keys == sorted(keys)
+
+
+def test_symmetry_breaking_pinned_hint(solutions_folder):
+    """Tests that a hint not sorted by vehicle can be pinned with symmetry breaking"""
+    scores = []
+    for enable_symmetry_breaking in (False, True):
+        heartbeat = _get_heartbeat(
+            {
+                "num_hours": 14,
+                "num_vehicles": 3,
+                "enable_symmetry_breaking": enable_symmetry_breaking,
+            },
+            num_workers=2,
+            max_time_in_seconds=30,
+            hint_schedule=_get_schedule([(0, 300, 780), (1, 270, 750), (2, 300, 780)]),
+            hint_free_hours=[12, 13],
+        )
+        compute_schedule(heartbeat)
+        assert heartbeat.stage.startswith("Scheduler finished - Optimal solution")
+        scores.append(heartbeat.total_score)
+
+    assert scores[0] == scores[1]
+
+
+def test_restricted_master_reduced_costs():
+    """Tests that the patterns priced with the master duals have the reduced costs of
+    the LP solver, and that adding columns improves the LP"""
+    inputs = _get_pattern_inputs()
+    pattern_starts, pattern_durations = get_valid_patterns(inputs)
+    patterns_cost = get_patterns_cost(inputs, pattern_starts, pattern_durations)
+    master = RestrictedMaster(inputs)
+    assert master.solve() == 0
+
+    columns = slice(None, None, 7)
+    for start, duration, cost in zip(
+        pattern_starts[columns], pattern_durations[columns], patterns_cost[columns]
+    ):
+        master.add_pattern(start, duration, cost)
+    assert master.solve() > 0
+    reduced_costs = master.get_reduced_costs(
+        pattern_starts[columns], pattern_durations[columns], patterns_cost[columns]
+    )
+    assert np.allclose(
+        reduced_costs, [count.reduced_cost() for count in master.patterns_count]
+    )
+    assert len(master.get_patterns_count()) == len(reduced_costs)
+
+
+def test_column_generation_matches_patterns(solutions_folder):
+    """Tests that the column generation finds the objective of the patterns engine
+    on a small instance, and reports the LP bound instead of optimality"""
+    heartbeats = []
+    for compute in (compute_pattern_schedule, compute_column_generation_schedule):
+        heartbeat = _get_heartbeat(
+            {"num_hours": 14, "num_vehicles": 3},
+            num_workers=2,
+            max_time_in_seconds=30,
+        )
+        compute(heartbeat)
+        heartbeats.append(heartbeat)
+    patterns, column_generation = heartbeats
+
+    assert patterns.stage == "Scheduler finished - Optimal solution found."
+    assert column_generation.stage.startswith(
+        "Scheduler finished - Best solution over the generated columns found"
+    )
+    assert column_generation.total_score == patterns.total_score
+    assert column_generation.best_bound >= column_generation.total_score - 1e-6
+
+
+def test_column_generation_pricing_time_limit(solutions_folder, monkeypatch, capsys):
+    """Tests that the pricing stops at its share of the time limit, and that the
+    integer pass still selects a schedule from the first columns"""
+    monkeypatch.setattr(optimizer_column_generation, "INTEGER_PASS_TIME_SHARE", 1.0)
+    heartbeat = _get_heartbeat(
+        {"num_hours": 14, "num_vehicles": 3},
+        num_workers=2,
+        max_time_in_seconds=30,
+    )
+    compute_column_generation_schedule(heartbeat)
+
+    output = capsys.readouterr().out
+    assert "Pricing time limit reached" in output
+    assert "Column generation iteration 2:" not in output
+    assert "no LP bound" in output
+    assert heartbeat.stage.startswith(
+        "Scheduler finished - Best solution over the generated columns found"
+    )
+    assert heartbeat.total_score is not None
+
+
+def test_patterns_matches_states(solutions_folder):
+    """Tests that the patterns engine finds the objective of the v1.8 states
+    formulation on a small instance"""
+    scores = []
+    for compute in (compute_pattern_schedule, compute_schedule):
+        heartbeat = _get_heartbeat(
+            {"num_hours": 14, "num_vehicles": 3, "shift_formulation": "states"},
+            num_workers=2,
+            max_time_in_seconds=30,
+        )
+        compute(heartbeat)
+        assert heartbeat.stage == "Scheduler finished - Optimal solution found."
+        scores.append(heartbeat.total_score)
+
+    assert scores[0] == scores[1]
+
+
+def test_intervals_matches_states(solutions_folder):
+    """Tests that the intervals formulation keeps the shifts of a vehicle apart by the
+    rest time and finds the objective of the states formulation"""
+    heartbeats = []
+    for shift_formulation in ("states", "intervals"):
+        heartbeat = _get_heartbeat(
+            {
+                "num_hours": 12,
+                "num_vehicles": 2,
+                "min_duration": 2,
+                "max_duration": 4,
+                "shift_formulation": shift_formulation,
+            },
+            num_workers=2,
+            max_time_in_seconds=30,
+        )
+        compute_schedule(heartbeat)
+        assert heartbeat.stage == "Scheduler finished - Optimal solution found."
+        heartbeats.append(heartbeat)
+    states, intervals = heartbeats
+
+    assert intervals.total_score == states.total_score
+    shifts = get_shifts_from_schedule(intervals.schedule)
+    rest_time = intervals.payload.static_variables.min_time_between_shifts
+    for vehicle in {vehicle for vehicle, _, _ in shifts}:
+        vehicle_shifts = sorted(
+            (start, end)
+            for shift_vehicle, start, end in shifts
+            if shift_vehicle == vehicle
+        )
+        assert all(120 <= end - start <= 240 for start, end in vehicle_shifts)
+        # No overlap, with the rest time between consecutive shifts
+        assert all(
+            next_start - end >= rest_time
+            for (_, end), (next_start, _) in zip(vehicle_shifts, vehicle_shifts[1:])
+        )
+    assert len(shifts) > len({vehicle for vehicle, _, _ in shifts})
+
+
+def test_intervals_without_state_grid(solutions_folder):
+    """Tests that the intervals formulation derives the counts per timestamp from the
+    intervals, without the per minute states, and with a much smaller model"""
+    num_variables = []
+    for shift_formulation in ("states", "intervals"):
+        heartbeat = _get_heartbeat(
+            {
+                "num_hours": 14,
+                "num_vehicles": 3,
+                "shift_formulation": shift_formulation,
+                "enable_symmetry_breaking": True,
+            },
+            num_workers=2,
+            max_time_in_seconds=30,
+            hint_schedule=_get_schedule([(0, 300, 780), (1, 270, 750), (2, 300, 780)]),
+            hint_free_hours=[12, 13],
+        )
+        compute_schedule(heartbeat)
+        assert heartbeat.stage == "Scheduler finished - Optimal solution found."
+        builders = [entry["builder"] for entry in heartbeat.build_profile]
+        num_variables.append(
+            sum(entry["variables"] for entry in heartbeat.build_profile)
+        )
+    states, intervals = num_variables
+
+    assert "define_shift_state" not in builders
+    assert "define_interval_counts_in_time" in builders
+    assert intervals < states / 2
+    assert _get_vehicles_starts(get_shifts_from_schedule(heartbeat.schedule)) == {
+        0: (270, float("inf")),
+        1: (300, float("inf")),
+        2: (300, float("inf")),
+    }
+
+
+def test_infeasible_greedy_not_kept(solutions_folder):
+    """Tests that a greedy schedule breaking the hard minimum shifts is not published
+    as a solution"""
+    heartbeat = _get_heartbeat(
+        {"shift_formulation": "counts", "enable_min_shift_constraint": True},
+        num_workers=2,
+        max_time_in_seconds=30,
+    )
+    compute_schedule(heartbeat)
+
+    assert heartbeat.stage == "Scheduler finished - No solution found."
+    assert heartbeat.step == 0
+    assert heartbeat.solution is None and heartbeat.schedule is None
+
+
+def test_multi_resolution_infeasible_coarse_schedule(solutions_folder, monkeypatch):
+    """Tests that a coarse schedule breaking a hard constraint on the run grid is only
+    a hint of an unrestricted refinement"""
+    heartbeat = _get_heartbeat(
+        {
+            "num_hours": 14,
+            "num_vehicles": 3,
+            "enable_min_shift_constraint": True,
+        },
+        engine="multi_resolution",
+        num_workers=2,
+        max_time_in_seconds=30,
+    )
+    # A single vehicle is required at 9:45
+    for row in heartbeat.payload.dynamic_variables.minimum_shifts.data:
+        row[3] = int(row[:3] == [0, 9, 45])
+
+    refinements = []
+
+    def _compute_grid_schedule(grid_heartbeat, multiprocess_pipe=None, **kwargs):
+        if grid_heartbeat.payload.static_variables.duration_step == 60:
+            # The coarse shift covers 9:00-9:59, but only 9:00-9:14 on the run grid
+            grid_heartbeat.schedule = _get_schedule([(0, 300, 540)])
+            grid_heartbeat.solver_stats = {"status": "FEASIBLE"}
+            return
+        refinements.append((kwargs, grid_heartbeat.payload.hint_window_hours))
+        compute_schedule(grid_heartbeat, multiprocess_pipe, **kwargs)
+
+    monkeypatch.setattr(
+        optimizer_multi_resolution, "compute_grid_schedule", _compute_grid_schedule
+    )
+    optimizer_multi_resolution.compute_schedule(heartbeat)
+
+    assert refinements == [({}, None)]
+    assert heartbeat.stage.startswith("Scheduler finished - Optimal solution")
+    shifts = get_shifts_from_schedule(heartbeat.schedule)
+    assert validate_shifts(get_pattern_inputs(heartbeat), shifts) == []